@@ -0,0 +1,69 @@
+#######################################################################################################################
+# Benchmark of adjust_widget on meshes from 8 to 50k vertices: vectorized transform against the per-vertex loop
+# Run inside blender: blender -b --python benchmarks/bench_adjust_widget.py
+#######################################################################################################################
+
+import os
+import random
+import sys
+import timeit
+
+import bpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from new_experimental.rigs.utils import adjust_widget, get_widget_adjust_matrix
+
+SIZES = [8, 64, 512, 4096, 50000]
+AXES = ['x', '-y', 'z']
+REPEAT = 3
+SEED = 0
+
+
+def make_mesh(size):
+    random.seed(SEED)
+    verts = [(random.uniform(-1, 1), random.uniform(-1, 1), random.uniform(-1, 1)) for i in range(size)]
+    mesh = bpy.data.meshes.new('bench_adjust_widget')
+    mesh.from_pydata(verts, [], [])
+    mesh.update()
+    return mesh
+
+
+def legacy_adjust_widget(mesh, axis='y', offset=0.0):
+    # previous implementation: every vertex transformed on its own
+    matrix = get_widget_adjust_matrix(axis, offset)
+    for vert in mesh.vertices:
+        vert.co = (matrix @ vert.co.to_4d()).to_3d()
+
+
+def best_time(function, mesh, number):
+    times = timeit.repeat(lambda: [function(mesh, axis=axis, offset=0.5) for axis in AXES],
+                          repeat=REPEAT, number=number)
+    return min(times) / (number * len(AXES)) * 1e3
+
+
+def max_difference(size):
+    mesh = make_mesh(size)
+    legacy_mesh = make_mesh(size)
+    for axis in AXES:
+        adjust_widget(mesh, axis=axis, offset=0.5)
+        legacy_adjust_widget(legacy_mesh, axis=axis, offset=0.5)
+    difference = max((v.co - w.co).length for v, w in zip(mesh.vertices, legacy_mesh.vertices))
+    bpy.data.meshes.remove(mesh)
+    bpy.data.meshes.remove(legacy_mesh)
+    return difference
+
+
+def main():
+    print("%8s %14s %14s %12s" % ('verts', 'vectorized ms', 'legacy ms', 'max diff'))
+    for size in SIZES:
+        number = max(1, 5000 // size)
+        mesh = make_mesh(size)
+        vectorized = best_time(adjust_widget, mesh, number)
+        legacy = best_time(legacy_adjust_widget, mesh, number)
+        bpy.data.meshes.remove(mesh)
+        print("%8d %14.4f %14.4f %12.2e" % (size, vectorized, legacy, max_difference(size)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#######################################################################################################################
+# Benchmark of ctrl aggregation at 100, 1k and 10k ctrls: kd-tree clustering against the previous pairwise loop
+# Run inside blender: blender -b --python benchmarks/bench_aggregate_ctrls.py [-- SIZE ...]
+#######################################################################################################################
+
+import os
+import random
+import sys
+import time
+
+import bpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from new_experimental.rigs.control_snapper import ControlSnapper
+from new_experimental.rigs.generation_context import GenerationContext
+
+SIZES = [100, 1000, 10000]
+BONE_LENGTH = 0.1
+SEED = 0
+
+
+def make_armature(size):
+    """
+    Creates an armature with size ctrls in coincident pairs, each pair within the aggregation tolerance
+    :param size:
+    :return:
+    """
+
+    random.seed(SEED)
+
+    arm = bpy.data.armatures.new('bench_aggregate')
+    obj = bpy.data.objects.new('bench_aggregate', arm)
+    bpy.context.collection.objects.link(obj)
+    bpy.context.view_layer.objects.active = obj
+    bpy.ops.object.mode_set(mode='EDIT')
+
+    names = []
+    error = BONE_LENGTH * ControlSnapper.POSITION_RELATIVE_ERROR * 0.5
+    for i in range(size):
+        if i % 2 == 0:
+            head = (random.uniform(-10, 10), random.uniform(-10, 10), random.uniform(-10, 10))
+        else:
+            head = (head[0] + error, head[1], head[2])
+        eb = arm.edit_bones.new('ctrl_%d' % i)
+        eb.head = head
+        eb.tail = (head[0], head[1] + BONE_LENGTH, head[2])
+        names.append(eb.name)
+
+    return obj, names
+
+
+def remove_armature(obj):
+    bpy.ops.object.mode_set(mode='OBJECT')
+    GenerationContext.release(obj)
+    arm = obj.data
+    bpy.data.objects.remove(obj, do_unlink=True)
+    bpy.data.armatures.remove(arm)
+
+
+def legacy_aggregates(obj, ctrls, same_parent=True):
+    # previous implementation: every free ctrl compared against every remaining one through edit_bones
+    edit_bones = obj.data.edit_bones
+    all_ctrls = list(ctrls)
+    aggregates = []
+
+    while 1:
+        ctrl = all_ctrls[0]
+        aggregate = [ctrl]
+        for ctrl2 in all_ctrls[1:]:
+            error = edit_bones[ctrl].length * ControlSnapper.POSITION_RELATIVE_ERROR
+            if (edit_bones[ctrl].head - edit_bones[ctrl2].head).magnitude <= error \
+                    and (not same_parent or edit_bones[ctrl].parent == edit_bones[ctrl2].parent):
+                aggregate.append(ctrl2)
+        for element in aggregate:
+            all_ctrls.remove(element)
+        if len(aggregate) > 1:
+            aggregates.append(aggregate)
+        if not all_ctrls:
+            break
+
+    return aggregates
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    sizes = [int(arg) for arg in argv] or SIZES
+
+    print("%8s %12s %12s %8s" % ('ctrls', 'kd-tree s', 'legacy s', 'match'))
+    for size in sizes:
+        obj, names = make_armature(size)
+        snapper = ControlSnapper(obj, {'ctrl': {'all_ctrls': names}})
+
+        kd_time, kd_result = timed(snapper.get_aggregates, names)
+        legacy_time, legacy_result = timed(legacy_aggregates, obj, names)
+
+        print("%8d %12.4f %12.4f %8s" % (size, kd_time, legacy_time, kd_result == legacy_result))
+        remove_armature(obj)
+
+
+if __name__ == "__main__":
+    main()
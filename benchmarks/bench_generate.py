@@ -0,0 +1,316 @@
+#######################################################################################################################
+# Scaling benchmark of rig generation on synthetic metarigs: N bendy_eye rigs, M lip subdivisions for bendy_jaw,
+# K-segment bendy_tail and super_chain chains, G glue bones and N tiled meshy_face samples.
+# Every run appends a row per family and size to a csv: timings, bone counts and process memory.
+# The rig types must be installed where rigify finds them, as for the create_sample metarigs.
+# Run inside blender: blender -b --python benchmarks/bench_generate.py [-- --families eyes jaw --sizes 1 4 --label x]
+#######################################################################################################################
+
+import argparse
+import csv
+import datetime
+import os
+import sys
+import time
+
+import addon_utils
+import bpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from new_experimental.rigs import bendy_eye, meshy_face
+from new_experimental.rigs.generation_context import GenerationContext
+
+SIZES = {'eyes': [1, 4, 16],
+         'jaw': [2, 8, 32],
+         'tail': [4, 16, 64],
+         'super_chain': [4, 16, 64],
+         'glue': [1, 8, 64],
+         'face': [1, 2, 4]}
+CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_generate.csv")
+FIELDS = ['date', 'blender', 'label', 'family', 'size', 'metarig_bones', 'rig_bones', 'generate_s',
+          'rss_before_mb', 'rss_after_mb', 'rss_delta_mb', 'peak_rss_mb']
+TILE_OFFSET = 0.5   # x distance between tiled samples
+
+
+def get_rss_mb():
+    """
+    Current resident memory of the process, falls back to the peak where /proc is not available
+    :return:
+    """
+
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return get_peak_rss_mb()
+
+
+def get_peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def new_armature(name):
+    arm = bpy.data.armatures.new(name)
+    obj = bpy.data.objects.new(name, arm)
+    bpy.context.collection.objects.link(obj)
+    bpy.context.view_layer.objects.active = obj
+    return obj
+
+
+def add_chain(arm, name, points, parent=None):
+    """
+    Adds a connected chain through points, returns the bone names. Must be called in EDIT mode
+    :param arm: armature data
+    :param name: name of the first bone, the following get .001, .002 ...
+    :param points: head of the first bone to tail of the last bone
+    :param parent: parent name of the first bone
+    :return:
+    """
+
+    names = []
+    for i in range(len(points) - 1):
+        eb = arm.edit_bones.new(name if i == 0 else "%s.%03d" % (name, i))
+        eb.head = points[i]
+        eb.tail = points[i + 1]
+        if i == 0:
+            eb.parent = arm.edit_bones[parent] if parent else None
+        else:
+            eb.parent = arm.edit_bones[names[-1]]
+            eb.use_connect = True
+        names.append(eb.name)
+    return names
+
+
+def resample(points, count):
+    """
+    Returns count + 1 points evenly spread along the polyline through points
+    """
+
+    lengths = [0.0]
+    for a, b in zip(points[:-1], points[1:]):
+        lengths.append(lengths[-1] + sum((b[k] - a[k]) ** 2 for k in range(3)) ** 0.5)
+
+    result = []
+    segment = 0
+    for i in range(count + 1):
+        target = lengths[-1] * i / count
+        while segment < len(points) - 2 and lengths[segment + 1] < target:
+            segment += 1
+        span = (lengths[segment + 1] - lengths[segment]) or 1.0
+        t = (target - lengths[segment]) / span
+        a, b = points[segment], points[segment + 1]
+        result.append(tuple(a[k] + (b[k] - a[k]) * t for k in range(3)))
+    return result
+
+
+def set_rigify_types(obj, types):
+    bpy.ops.object.mode_set(mode='OBJECT')
+    for name in types:
+        obj.pose.bones[name].rigify_type = types[name]
+
+
+def build_tiled(sample_module, count):
+    """
+    Tiles count copies of a create_sample metarig along x, bone names of every copy get a 't<i>_' prefix
+    :param sample_module: rig module with a create_sample function
+    :param count:
+    :return: the joined metarig
+    """
+
+    tiles = []
+    for i in range(count):
+        obj = new_armature('bench_tile')
+        sample_module.create_sample(obj)
+        bpy.ops.object.mode_set(mode='OBJECT')
+
+        renamed = dict()
+        for bone in obj.data.bones:
+            renamed[bone.name] = "t%d_%s" % (i, bone.name)
+        for old, new in renamed.items():
+            obj.data.bones[old].name = new
+
+        # string parameters pointing to bones (paired_eye) follow the renaming
+        for pb in obj.pose.bones:
+            for key in pb.rigify_parameters.keys():
+                value = pb.rigify_parameters[key]
+                if isinstance(value, str) and value in renamed:
+                    pb.rigify_parameters[key] = renamed[value]
+
+        obj.location.x = i * TILE_OFFSET
+        tiles.append(obj)
+
+    for obj in bpy.context.view_layer.objects:
+        obj.select_set(obj in tiles)
+    bpy.context.view_layer.objects.active = tiles[0]
+    bpy.ops.object.join()
+
+    return tiles[0]
+
+
+def build_eyes(size):
+    return build_tiled(bendy_eye, size)
+
+
+def build_face(size):
+    return build_tiled(meshy_face, size)
+
+
+def build_jaw(size):
+    """
+    bendy_jaw sample with size bones in each of the 4 lip chains
+    """
+
+    obj = new_armature('bench_jaw')
+    bpy.ops.object.mode_set(mode='EDIT')
+    arm = obj.data
+
+    add_chain(arm, 'mouth', [(0.0, -0.0700, 0.0962), (0.0, -0.0295, 0.0962), (0.0, -0.0923, 0.0044)])
+    lips = {'T': [(0.0, -0.1022, 0.0563), (0.0131, -0.0986, 0.0567), (0.0236, -0.0877, 0.0519)],
+            'B': [(0.0, -0.0993, 0.0455), (0.0124, -0.0938, 0.0488), (0.0236, -0.0877, 0.0519)]}
+    for t_b, points in lips.items():
+        for side, sign in (('L', 1), ('R', -1)):
+            mirrored = [(sign * x, y, z) for x, y, z in points]
+            add_chain(arm, 'lip.%s.%s' % (t_b, side), resample(mirrored, size), parent='mouth')
+
+    set_rigify_types(obj, {'mouth': 'bendy_jaw'})
+    return obj
+
+
+def build_chain(rigify_type, size):
+    obj = new_armature('bench_' + rigify_type)
+    bpy.ops.object.mode_set(mode='EDIT')
+
+    add_chain(obj.data, 'spine', [(0.0, 0.0, i * 0.1) for i in range(size + 1)])
+
+    set_rigify_types(obj, {'spine': rigify_type})
+    return obj
+
+
+def build_tail(size):
+    return build_chain('bendy_tail', size)
+
+
+def build_super_chain(size):
+    return build_chain('super_chain', size)
+
+
+def build_glue(size):
+    """
+    A super_chain with a glue bone from each of its joints
+    """
+
+    obj = new_armature('bench_glue')
+    bpy.ops.object.mode_set(mode='EDIT')
+    arm = obj.data
+
+    points = [(0.0, 0.0, i * 0.1) for i in range(size + 2)]
+    add_chain(arm, 'spine', points)
+    glue_bones = []
+    for i in range(size):
+        x, y, z = points[i + 1]
+        glue_bones.extend(add_chain(arm, 'glue.%03d' % i, [(x, y, z), (x + 0.05, y, z)]))
+
+    types = {name: 'glue_bone' for name in glue_bones}
+    types['spine'] = 'super_chain'
+    set_rigify_types(obj, types)
+    return obj
+
+
+BUILDERS = {'eyes': build_eyes,
+            'jaw': build_jaw,
+            'tail': build_tail,
+            'super_chain': build_super_chain,
+            'glue': build_glue,
+            'face': build_face}
+
+
+def clear_scene():
+    if bpy.context.object and bpy.context.object.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+
+    for obj in list(bpy.data.objects):
+        if obj.type == 'ARMATURE':
+            GenerationContext.release(obj)
+        bpy.data.objects.remove(obj, do_unlink=True)
+    for collection in (bpy.data.armatures, bpy.data.meshes):
+        for data in list(collection):
+            if data.users == 0:
+                collection.remove(data)
+
+
+def run(family, size):
+    """
+    Builds the metarig of family at size and generates it
+    :return: csv row
+    :rtype: dict
+    """
+
+    from rigify.generate import generate_rig
+
+    clear_scene()
+    metarig = BUILDERS[family](size)
+    bpy.ops.object.mode_set(mode='OBJECT')
+    metarig_bones = len(metarig.data.bones)
+
+    rss_before = get_rss_mb()
+    start = time.perf_counter()
+    generate_rig(bpy.context, metarig)
+    generate_time = time.perf_counter() - start
+    rss_after = get_rss_mb()
+
+    rigs = [obj for obj in bpy.data.objects if obj.type == 'ARMATURE' and obj != metarig]
+
+    return {'family': family,
+            'size': size,
+            'metarig_bones': metarig_bones,
+            'rig_bones': len(rigs[0].data.bones) if rigs else 0,
+            'generate_s': "%.4f" % generate_time,
+            'rss_before_mb': "%.1f" % rss_before,
+            'rss_after_mb': "%.1f" % rss_after,
+            'rss_delta_mb': "%.1f" % (rss_after - rss_before),
+            'peak_rss_mb': "%.1f" % get_peak_rss_mb()}
+
+
+def main():
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+
+    parser = argparse.ArgumentParser(prog='bench_generate')
+    parser.add_argument('--families', nargs='+', choices=sorted(BUILDERS), default=list(BUILDERS))
+    parser.add_argument('--sizes', nargs='+', type=int, help="overrides the per family default sizes")
+    parser.add_argument('--csv', default=CSV_PATH)
+    parser.add_argument('--label', default='', help="release or commit the results belong to")
+    args = parser.parse_args(argv)
+
+    addon_utils.enable('rigify')
+
+    common = {'date': datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+              'blender': bpy.app.version_string,
+              'label': args.label}
+
+    new_file = not os.path.exists(args.csv)
+    with open(args.csv, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        if new_file:
+            writer.writeheader()
+
+        print("%12s %6s %8s %8s %10s %10s" % ('family', 'size', 'metarig', 'rig', 'generate s', 'rss delta'))
+        for family in args.families:
+            for size in args.sizes or SIZES[family]:
+                row = run(family, size)
+                row.update(common)
+                writer.writerow(row)
+                f.flush()
+                print("%12s %6d %8d %8d %10s %10s" % (family, size, row['metarig_bones'], row['rig_bones'],
+                                                      row['generate_s'], row['rss_delta_mb']))
+
+    clear_scene()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#######################################################################################################################
+# Generation benchmark in plain CPython on the headless backend: a meshy_face metarig with C chains of L bones,
+# so the generated armature reaches tens of thousands of bones. Prints the generation time, bone counts and the
+# mode switch statistics of the scheduler. --face also generates the meshy_face sample, which runs every face rig type,
+# then moves one eyelid bone of the metarig and regenerates: only the rigs depending on it are rebuilt. Last it
+# generates the face into a new armature, whose rigs are replayed from the generation cache of the first runs.
+# Run: python benchmarks/bench_headless.py [--chains 1000 --length 3] [--face] [--profile]
+#######################################################################################################################
+
+import argparse
+import cProfile
+import os
+import pstats
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from new_experimental import headless
+
+headless.install()
+
+import bpy
+from mathutils import Vector
+
+from new_experimental.rigs import meshy_face
+from new_experimental.rigs.generation_context import GenerationContext
+
+CHAIN_SPACING = 0.02    # distance between chains on x and z
+BONE_LENGTH = 0.01
+
+
+def new_metarig():
+    bpy.reset()
+    arm = bpy.data.armatures.new('metarig')
+    obj = bpy.data.objects.new('metarig', arm)
+    bpy.context.collection.objects.link(obj)
+    bpy.context.view_layer.objects.active = obj
+    return obj
+
+
+def build_face():
+    obj = new_metarig()
+    meshy_face.create_sample(obj)
+    bpy.ops.object.mode_set(mode='OBJECT')
+    return obj
+
+
+def touch_eyelid(metarig):
+    bpy.context.view_layer.objects.active = metarig
+    bpy.ops.object.mode_set(mode='EDIT')
+    bone = metarig.data.edit_bones['lid.B.L']
+    bone.tail = bone.tail + Vector((0.0, -0.001, 0.0))
+    bpy.ops.object.mode_set(mode='OBJECT')
+    return metarig
+
+
+def build_chains(chains, length):
+    """
+    meshy_face root bone with chains of length connected bones, laid out on a grid in front of it
+    :param chains:
+    :param length:
+    :return: the metarig object
+    """
+
+    obj = new_metarig()
+    arm = obj.data
+    bpy.ops.object.mode_set(mode='EDIT')
+
+    root = arm.edit_bones.new('face')
+    root.head = (0.0, 0.0, 0.0)
+    root.tail = (0.0, 0.0, 0.1)
+
+    side = int(chains ** 0.5) + 1
+    for i in range(chains):
+        x = (i % side) * CHAIN_SPACING
+        z = (i // side) * CHAIN_SPACING
+        parent = root
+        for j in range(length):
+            bone = arm.edit_bones.new('chain.%05d.%02d' % (i, j))
+            bone.head = (x, -0.1 - j * BONE_LENGTH, z)
+            bone.tail = (x, -0.1 - (j + 1) * BONE_LENGTH, z)
+            bone.parent = parent
+            bone.use_connect = j > 0
+            parent = bone
+
+    bpy.ops.object.mode_set(mode='OBJECT')
+    obj.pose.bones['face'].rigify_type = 'meshy_face'
+
+    return obj
+
+
+def run(label, metarig, name='rig', profile=False):
+    metarig_bones = len(metarig.data.bones)
+
+    profiler = cProfile.Profile() if profile else None
+    start = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    obj, rigs = headless.generate(metarig, name)
+    if profiler:
+        profiler.disable()
+    generate_time = time.perf_counter() - start
+
+    context = GenerationContext.get(obj)
+    stats = context.get_mode_stats()
+    replayed = context.get_cache('generation_stats', dict).get('replayed_rigs', 0)
+    widgets = len([o for o in bpy.data.objects if o.type == 'MESH'])
+    print("%18s: %6d metarig bones -> %6d bones, %5d widgets, %4d rigs, %d replayed | generate %.2fs | %d mode switches"
+          % (label, metarig_bones, len(obj.data.bones), widgets, len(rigs), replayed, generate_time,
+             stats['transitions']))
+
+    if profiler:
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(25)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='bench_headless')
+    parser.add_argument('--chains', nargs='*', type=int, default=[10, 100, 1000])
+    parser.add_argument('--length', type=int, default=3)
+    parser.add_argument('--face', action='store_true', help="generate the meshy_face sample first")
+    parser.add_argument('--profile', action='store_true', help="print the cProfile stats of the last run")
+    args = parser.parse_args()
+
+    if args.face:
+        metarig = build_face()
+        run('face sample', metarig)
+        run('face, one eyelid', touch_eyelid(metarig))
+        run('face, replayed', metarig, name='rig.replayed', profile=args.profile and not args.chains)
+
+    for i, chains in enumerate(args.chains):
+        run('%d chains x %d' % (chains, args.length), build_chains(chains, args.length),
+            profile=args.profile and i == len(args.chains) - 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#######################################################################################################################
+# Micro-benchmark of LIMIT_* constraint string parsing at 1, 6 and 24 limit clauses. Both implementations are timed
+# on the same scope: the whole compile (match, clause parsing and ConstraintSpec build), then the clause parser alone
+# Run inside blender: blender -b --python benchmarks/bench_limit_parser.py
+#######################################################################################################################
+
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from new_experimental.rigs.utils import compile_limit_constraint, parse_limit_clauses, match_constraint_string, \
+    ConstraintSpec, CONSTRAINT_SPACE, LIMIT_REGEX, LIMIT_TYPE
+
+CLAUSES = ['mX-0.5', 'mY-0.25', 'mZ0', 'MX0.5', 'MY0.25', 'MZ1.57']
+SIZES = [1, 6, 24]
+REPEAT = 5
+NUMBER = 2000
+
+# previous implementation: limits were peeled off the end of the string one re.search at a time
+LEGACY_REGEX = re.compile(r'^(LL|LR|LS)([0-9]*\.?[0-9]+)*(([mM]{1}[XYZ]{1}-?[0-9]*\.?[0-9]+)+)*(T)*(W|L|P)*$')
+LEGACY_TAIL_REGEX = re.compile(r'(([mM]{1}[XYZ]{1}-?[0-9]*\.?[0-9]+)+)*')
+
+
+def legacy_parse_limit_clauses(cns_type, limits, limit):
+    props = []
+    while 1:
+        if not limits:
+            break
+        axis = limit[1].lower()
+        if cns_type == 'LIMIT_ROTATION':
+            props.append(('use_limit_%s' % axis, True))
+        elif limit[0] == 'm':
+            props.append(('use_min_%s' % axis, True))
+        else:
+            props.append(('use_max_%s' % axis, True))
+        if limit[0] == 'm':
+            props.append(('min_%s' % axis, float(limit[2:])))
+        else:
+            props.append(('max_%s' % axis, float(limit[2:])))
+        limits = limits[:-len(limit)]
+        o = LEGACY_TAIL_REGEX.search(limits)
+        limits = o.groups()[0]
+        limit = o.groups()[1]
+    return props
+
+
+def legacy_compile_limit_constraint(fstring):
+    cns_props = match_constraint_string(LEGACY_REGEX, fstring)
+    cns_type = LIMIT_TYPE[cns_props[0]]
+    props = [('influence', float(cns_props[1]) if bool(cns_props[1]) else 1.0),
+             ('use_transform_limit', bool(cns_props[-2])),
+             ('owner_space', CONSTRAINT_SPACE[cns_props[-1]] if bool(cns_props[-1]) else "LOCAL")]
+    props.extend(legacy_parse_limit_clauses(cns_type, cns_props[2], cns_props[3]))
+    return ConstraintSpec(cns_type, False, tuple(props))
+
+
+def make_spec(size):
+    clauses = [CLAUSES[i % len(CLAUSES)] for i in range(size)]
+    return 'LR1.0' + ''.join(clauses) + 'TL'
+
+
+def best_time(function, *args):
+    times = timeit.repeat(lambda: function(*args), repeat=REPEAT, number=NUMBER)
+    return min(times) / NUMBER * 1e6
+
+
+def main():
+    print("%8s %14s %14s %14s %14s" % ('clauses', 'compile us', 'legacy us', 'clauses us', 'legacy us'))
+    for size in SIZES:
+        fstring = make_spec(size)
+        cns_props = LIMIT_REGEX.match(fstring).groups()
+        legacy_props = LEGACY_REGEX.match(fstring).groups()
+        print("%8d %14.2f %14.2f %14.2f %14.2f"
+              % (size, best_time(compile_limit_constraint, fstring),
+                 best_time(legacy_compile_limit_constraint, fstring),
+                 best_time(parse_limit_clauses, 'LIMIT_ROTATION', cns_props[2]),
+                 best_time(legacy_parse_limit_clauses, 'LIMIT_ROTATION', legacy_props[2], legacy_props[3])))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#######################################################################################################################
+# Headless backend: runs the rigs of new_experimental.rigs in plain CPython, without a blender process.
+# install() registers array backed stand-ins for bpy, mathutils, rna_prop_ui and the rigify functions the rigs import,
+# then the rig modules import unchanged. generate() runs a rigify-like generation of a metarig, regenerating only
+# the rigs whose inputs changed when the armature exists and replaying the rigs found in the generation cache.
+#
+#   from new_experimental import headless
+#   headless.install()
+#   import bpy      # the stand-in
+#   ... build a metarig with bpy.data.armatures.new / edit_bones.new ...
+#   rig = headless.generate(metarig)
+#######################################################################################################################
+
+import importlib
+import importlib.abc
+import importlib.util
+import pkgutil
+import sys
+import tempfile
+import types
+
+from . import bpy
+from .armature import RigifyParameters
+
+RIGS_PACKAGE = __name__.rsplit('.', 1)[0] + '.rigs'
+RIG_TYPES_PREFIX = 'rigify.rigs.'
+
+
+class RigTypeFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    """
+    Resolves rigify.rigs.<type>, as imported by utils.get_rig_type, to the module of the rigs package,
+    so that rig classes are the same objects whichever way they are imported
+    """
+
+    def __init__(self, package):
+        self.package = package
+
+    def find_spec(self, fullname, path, target=None):
+        if not fullname.startswith(RIG_TYPES_PREFIX):
+            return None
+        if importlib.util.find_spec(self.package + '.' + fullname[len(RIG_TYPES_PREFIX):]) is None:
+            return None
+        return importlib.util.spec_from_loader(fullname, self)
+
+    def create_module(self, spec):
+        return importlib.import_module(self.package + '.' + spec.name[len(RIG_TYPES_PREFIX):])
+
+    def exec_module(self, module):
+        pass
+
+
+def is_installed():
+    return getattr(sys.modules.get('bpy'), 'HEADLESS', False)
+
+
+def install(package=RIGS_PACKAGE):
+    """
+    Registers the stand-in modules. Does nothing inside blender, where bpy is already the real one
+    :param package: package of the rig types
+    :return: True if the stand-ins are installed
+    :rtype: bool
+    """
+
+    if is_installed():
+        return True
+
+    if 'bpy' in sys.modules:
+        return False
+
+    from . import mathutils, kdtree, rna_prop_ui, rigify_utils
+
+    mathutils.kdtree = kdtree
+
+    rigify = types.ModuleType('rigify')
+    rigify.__path__ = []
+    rigify.utils = rigify_utils
+    rigs = types.ModuleType('rigify.rigs')
+    rigs.__path__ = []
+    rigs.widgets = rigify_utils
+    limbs = types.ModuleType('rigify.rigs.limbs')
+    limbs.__path__ = []
+    limbs.limb_utils = rigify_utils
+    rigify.rigs = rigs
+    rigs.limbs = limbs
+
+    sys.modules.update({'bpy': bpy,
+                        'mathutils': mathutils,
+                        'mathutils.kdtree': kdtree,
+                        'rna_prop_ui': rna_prop_ui,
+                        'rigify': rigify,
+                        'rigify.utils': rigify_utils,
+                        'rigify.rigs': rigs,
+                        'rigify.rigs.widgets': rigify_utils,
+                        'rigify.rigs.limbs': limbs,
+                        'rigify.rigs.limbs.limb_utils': rigify_utils})
+
+    sys.meta_path.insert(0, RigTypeFinder(package))
+
+    # shapes of the stand-in widgets must not end up in the widget library
+    from ..rigs.widget_library import WidgetLibrary
+    WidgetLibrary._library = WidgetLibrary(tempfile.mkdtemp(prefix='headless_widgets_'))
+
+    return True
+
+
+#######################################################################################################################
+# Generation
+#######################################################################################################################
+
+
+class ParameterCollector:
+    """
+    What add_parameters gets as params: collects the defaults of the bpy.props definitions
+    """
+
+    def __setattr__(self, name, value):
+        if isinstance(value, bpy.PropertyDefinition):
+            RigifyParameters.definitions.setdefault(name, value.default)
+
+
+def register_parameters(package=RIGS_PACKAGE):
+    """
+    Collects the parameters of every rig type of package, as rigify registers them all in RigifyParameters
+    :param package:
+    :return:
+    """
+
+    for info in pkgutil.iter_modules(importlib.import_module(package).__path__):
+        module = importlib.import_module(RIG_TYPES_PREFIX + info.name)
+        if hasattr(module, 'Rig') and hasattr(module, 'add_parameters'):
+            module.add_parameters(ParameterCollector())
+        elif hasattr(module, 'Rig'):
+            module.Rig.add_parameters(ParameterCollector())
+
+
+def generate(metarig, name='rig'):
+    """
+    Rigify-like generation of the metarig into the armature object name, see rigs.incremental.
+    When name was generated from the metarig before, only the rigs whose inputs changed are regenerated.
+    rig_ui scripts, bone groups and the rigify layer UI are out of scope
+    :param metarig: metarig armature object
+    :param name: name of the generated armature object
+    :return: the generated armature object and the rigs that were generated
+    :rtype: tuple
+    """
+
+    from ..rigs import incremental
+
+    if not RigifyParameters.definitions:
+        register_parameters()
+
+    obj = bpy.data.objects.get(name)
+    if obj is not None and obj.type != 'ARMATURE':
+        obj = None
+
+    return incremental.generate(metarig, obj, name)
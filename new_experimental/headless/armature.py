@@ -0,0 +1,851 @@
+#######################################################################################################################
+# Array backed armature: edit bones, bones and pose bones are views on the rows of a single BoneStore
+#######################################################################################################################
+
+import copy
+import math
+import numpy as np
+
+from .mathutils import Vector, Matrix, rotation_matrix
+
+# per bone array attributes: name -> (dtype, values per bone, default)
+BONE_ATTRIBUTES = {'head': (np.float32, 3, 0.0),
+                   'tail': (np.float32, 3, 0.0),
+                   'roll': (np.float32, 1, 0.0),
+                   'use_connect': (bool, 1, False),
+                   'layers': (bool, 32, [True] + [False] * 31),
+                   'use_deform': (bool, 1, True),
+                   'use_inherit_rotation': (bool, 1, True),
+                   'use_inherit_scale': (bool, 1, True),
+                   'use_local_location': (bool, 1, True),
+                   'use_envelope_multiply': (bool, 1, False),
+                   'bbone_segments': (np.int32, 1, 1),
+                   'bbone_in': (np.float32, 1, 1.0),
+                   'bbone_out': (np.float32, 1, 1.0),
+                   'bbone_x': (np.float32, 1, 0.1),
+                   'bbone_z': (np.float32, 1, 0.1),
+                   'envelope_distance': (np.float32, 1, 0.25),
+                   'head_radius': (np.float32, 1, 0.1),
+                   'tail_radius': (np.float32, 1, 0.1),
+                   'hide': (bool, 1, False),
+                   'select': (bool, 1, False),
+                   'select_head': (bool, 1, False),
+                   'select_tail': (bool, 1, False)}
+
+SAFE_THRESHOLD = 1.0e-5
+CHILDREN_SCANS = 16     # children queries answered by scanning before the children index is built
+
+
+def get_bone_axes(vector, roll):
+    """
+    Bone x, y and z axes from the bone vector and roll, as blender vec_roll_to_mat3 computes them
+    :param vector:
+    :param roll:
+    :return: 3x3 array, columns are the axes
+    """
+
+    vector = np.asarray(vector, dtype=np.float64)
+    length = np.linalg.norm(vector)
+    nor = vector / length if length else np.array((0.0, 1.0, 0.0))
+    x, y, z = nor
+    theta = 1.0 + y
+
+    matrix = np.identity(3)
+    if theta > SAFE_THRESHOLD or x or z:
+        matrix[:, 1] = nor
+        matrix[1, 0] = -x
+        matrix[1, 2] = -z
+        if theta > SAFE_THRESHOLD:
+            matrix[0, 0] = 1.0 - x * x / theta
+            matrix[2, 2] = 1.0 - z * z / theta
+            matrix[2, 0] = matrix[0, 2] = -x * z / theta
+        else:
+            theta = x * x + z * z
+            matrix[0, 0] = (x + z) * (x - z) / -theta
+            matrix[2, 2] = -matrix[0, 0]
+            matrix[2, 0] = matrix[0, 2] = 2.0 * x * z / theta
+    else:
+        matrix[0, 0] = matrix[1, 1] = -1.0
+
+    return rotation_matrix(nor, roll) @ matrix
+
+
+def get_roll_to_vector(vector, align_axis):
+    """
+    Roll aligning the z axis of a bone with vector as closely as possible to align_axis, as blender ED_rollBoneToVector
+    """
+
+    nor = np.asarray(vector, dtype=np.float64)
+    nor = nor / (np.linalg.norm(nor) or 1.0)
+    z_axis = get_bone_axes(nor, 0.0)[:, 2]
+
+    align_axis = np.asarray(tuple(align_axis)[:3], dtype=np.float64)
+    projected = align_axis - nor * (align_axis @ nor)
+    norm = np.linalg.norm(projected)
+    if not norm:
+        return 0.0
+    projected /= norm
+
+    roll = math.acos(max(-1.0, min(1.0, float(projected @ z_axis))))
+    if np.cross(z_axis, projected) @ nor < 0.0:
+        roll = -roll
+
+    return roll
+
+
+class BoneStore:
+    """
+    Bone attributes of an armature in arrays, one row per bone. Removed bones leave a dead row behind
+    so rows never move and bone views stay valid
+    """
+
+    def __init__(self, capacity=64):
+        self.arrays = {name: self._allocate(dtype, size, default, capacity)
+                       for name, (dtype, size, default) in BONE_ATTRIBUTES.items()}
+        self.parents = np.full(capacity, -1, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.names = []
+        self.pose = []
+        self.index = dict()
+        self.owner = None   # armature object, set when the armature is linked to one
+        self._rows = None
+        self._keys = None
+        self._children = None
+        self._scans = 0
+
+    @staticmethod
+    def _allocate(dtype, size, default, capacity):
+        array = np.zeros((capacity, size), dtype=dtype)
+        array[:] = default
+        return array
+
+    @property
+    def rows(self):
+        """
+        Rows of the live bones in creation order
+        """
+
+        if self._rows is None:
+            self._rows = np.flatnonzero(self.alive[:len(self.names)])
+        return self._rows
+
+    @property
+    def keys(self):
+        """
+        Names of the live bones in creation order
+        """
+
+        if self._keys is None:
+            names = self.names
+            self._keys = [names[row] for row in self.rows.tolist()]
+        return self._keys
+
+    def __len__(self):
+        return len(self.index)
+
+    def unique_name(self, name, exclude=None):
+        name = name[:63]
+        if name not in self.index or self.index[name] == exclude:
+            return name
+        base = name
+        i = 1
+        while True:
+            candidate = "%s.%03d" % (base[:59], i)
+            if candidate not in self.index:
+                return candidate
+            i += 1
+
+    def add(self, name):
+        row = len(self.names)
+
+        if row == len(self.alive):
+            capacity = 2 * row
+            for attribute, (dtype, size, default) in BONE_ATTRIBUTES.items():
+                array = self._allocate(dtype, size, default, capacity)
+                array[:row] = self.arrays[attribute]
+                self.arrays[attribute] = array
+            self.parents = np.concatenate((self.parents, np.full(row, -1, dtype=np.int64)))
+            self.alive = np.concatenate((self.alive, np.zeros(row, dtype=bool)))
+
+        name = self.unique_name(name)
+        self.names.append(name)
+        self.pose.append(None)
+        self.index[name] = row
+        self.alive[row] = True
+        self._rows = None
+        self._keys = None
+
+        return row
+
+    def set_parent(self, row, parent):
+        self.parents[row] = parent
+        self._children = None
+        self._scans = 0
+
+    def remove(self, row, disconnect=True):
+        """
+        Removes a bone, its children get its parent and are disconnected unless disconnect is False
+        """
+
+        children = self.get_children(row)
+        self.parents[children] = self.parents[row]
+        if disconnect:
+            self.arrays['use_connect'][children] = False
+
+        self.alive[row] = False
+        self.parents[row] = -1
+        del self.index[self.names[row]]
+        self._rows = None
+        self._keys = None
+        self._children = None
+        self._scans = 0
+
+    def rename(self, row, name):
+        name = self.unique_name(name, exclude=row)
+        del self.index[self.names[row]]
+        self.names[row] = name
+        self.index[name] = row
+        self._keys = None
+
+    def get_row(self, key):
+        if isinstance(key, str):
+            return self.index[key]
+        rows = self.rows
+        return int(rows[key])
+
+    def get_pose(self, row):
+        pose = self.pose[row]
+        if pose is None:
+            pose = self.pose[row] = PoseData()
+        return pose
+
+    def get_children(self, row):
+        """
+        Rows of the children of row. Right after hierarchy edits the parents are scanned, the parent -> children
+        index is rebuilt once queries outnumber the edits
+        """
+
+        if self._children is None and self._scans < CHILDREN_SCANS:
+            self._scans += 1
+            return np.flatnonzero(self.parents[:len(self.names)] == row)
+
+        if self._children is None:
+            rows = self.rows
+            parents = self.parents[rows]
+            order = np.argsort(parents, kind='stable')
+            bounds = np.flatnonzero(np.diff(parents[order])) + 1
+            self._children = {int(group_parents[0]): group_rows
+                              for group_parents, group_rows in zip(np.split(parents[order], bounds),
+                                                                   np.split(rows[order], bounds))
+                              if len(group_rows)}
+        return self._children.get(int(row), np.zeros(0, dtype=np.int64))
+
+    def is_ancestor(self, ancestor, row):
+        while row != -1:
+            if row == ancestor:
+                return True
+            row = self.parents[row]
+        return False
+
+
+class BoneView:
+    """
+    Common part of EditBone, Bone and PoseBone: a live row of a BoneStore
+    """
+
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, store, row):
+        object.__setattr__(self, '_store', store)
+        object.__setattr__(self, '_row', row)
+
+    def __eq__(self, other):
+        return type(other) is type(self) and other._store is self._store and other._row == self._row
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self._store), self._row))
+
+    def __repr__(self):
+        return "%s(%r)" % (type(self).__name__, self.name)
+
+    def _check(self):
+        if not self._store.alive[self._row]:
+            raise ReferenceError("StructRNA of type %s has been removed" % type(self).__name__)
+
+    @property
+    def name(self):
+        return self._store.names[self._row]
+
+    @name.setter
+    def name(self, value):
+        self._check()
+        self._store.rename(self._row, value)
+
+    def _view(self, row):
+        return type(self)(self._store, int(row)) if row != -1 else None
+
+    @property
+    def parent(self):
+        return self._view(self._store.parents[self._row])
+
+    @property
+    def children(self):
+        return [self._view(row) for row in self._store.get_children(self._row)]
+
+    @property
+    def children_recursive(self):
+        result = []
+        stack = list(reversed(self._store.get_children(self._row)))
+        while stack:
+            row = stack.pop()
+            result.append(self._view(row))
+            stack.extend(reversed(self._store.get_children(row)))
+        return result
+
+    @property
+    def parent_recursive(self):
+        result = []
+        row = self._store.parents[self._row]
+        while row != -1:
+            result.append(self._view(row))
+            row = self._store.parents[row]
+        return result
+
+    @property
+    def head(self):
+        return Vector.view(self._store.arrays['head'][self._row])
+
+    @property
+    def tail(self):
+        return Vector.view(self._store.arrays['tail'][self._row])
+
+    @property
+    def vector(self):
+        return Vector(self._store.arrays['tail'][self._row] - self._store.arrays['head'][self._row])
+
+    @property
+    def length(self):
+        return float(np.linalg.norm(self._store.arrays['tail'][self._row] - self._store.arrays['head'][self._row]))
+
+    def _axes(self):
+        return get_bone_axes(self._store.arrays['tail'][self._row] - self._store.arrays['head'][self._row],
+                             float(self._store.arrays['roll'][self._row, 0]))
+
+    @property
+    def x_axis(self):
+        return Vector(self._axes()[:, 0])
+
+    @property
+    def y_axis(self):
+        return Vector(self._axes()[:, 1])
+
+    @property
+    def z_axis(self):
+        return Vector(self._axes()[:, 2])
+
+    @property
+    def matrix(self):
+        matrix = Matrix.Identity(4)
+        matrix._data[:3, :3] = self._axes()
+        matrix._data[:3, 3] = self._store.arrays['head'][self._row]
+        return matrix
+
+
+def _array_property(attribute):
+    dtype, size, default = BONE_ATTRIBUTES[attribute]
+
+    if size > 1:
+        def getter(self):
+            return self._store.arrays[attribute][self._row]
+    elif dtype is bool:
+        def getter(self):
+            return bool(self._store.arrays[attribute][self._row, 0])
+    elif dtype is np.int32:
+        def getter(self):
+            return int(self._store.arrays[attribute][self._row, 0])
+    else:
+        def getter(self):
+            return float(self._store.arrays[attribute][self._row, 0])
+
+    def setter(self, value):
+        self._check()
+        self._store.arrays[attribute][self._row] = tuple(value) if size > 1 else value
+
+    return property(getter, setter)
+
+
+class EditBone(BoneView):
+    """
+    Edit bone view. Setting head or tail keeps connected bones attached as blender does
+    """
+
+    __slots__ = ()
+
+    @property
+    def parent(self):
+        return self._view(self._store.parents[self._row])
+
+    @parent.setter
+    def parent(self, value):
+        self._check()
+        store = self._store
+        if value is None:
+            store.set_parent(self._row, -1)
+            return
+        if store.is_ancestor(self._row, value._row):
+            return
+        store.set_parent(self._row, value._row)
+        if store.arrays['use_connect'][self._row, 0]:
+            store.arrays['head'][self._row] = store.arrays['tail'][value._row]
+
+    @property
+    def use_connect(self):
+        return bool(self._store.arrays['use_connect'][self._row, 0])
+
+    @use_connect.setter
+    def use_connect(self, value):
+        # like blender the flag is kept without a parent, the head snaps once the bone is parented
+        self._check()
+        store = self._store
+        store.arrays['use_connect'][self._row] = bool(value)
+        parent = store.parents[self._row]
+        if value and parent != -1:
+            store.arrays['head'][self._row] = store.arrays['tail'][parent]
+
+    @property
+    def head(self):
+        return Vector.view(self._store.arrays['head'][self._row])
+
+    @head.setter
+    def head(self, value):
+        self._check()
+        store = self._store
+        store.arrays['head'][self._row] = tuple(value)[:3]
+        parent = store.parents[self._row]
+        if parent != -1 and store.arrays['use_connect'][self._row, 0]:
+            store.arrays['tail'][parent] = store.arrays['head'][self._row]
+
+    @property
+    def tail(self):
+        return Vector.view(self._store.arrays['tail'][self._row])
+
+    @tail.setter
+    def tail(self, value):
+        self._check()
+        store = self._store
+        store.arrays['tail'][self._row] = tuple(value)[:3]
+        children = store.get_children(self._row)
+        connected = children[store.arrays['use_connect'][children, 0]]
+        store.arrays['head'][connected] = store.arrays['tail'][self._row]
+
+    @property
+    def length(self):
+        return BoneView.length.fget(self)
+
+    @length.setter
+    def length(self, value):
+        vector = self.vector
+        if not vector.length:
+            vector = Vector((0.0, 1.0, 0.0))
+        self.tail = self.head + vector.normalized() * value
+
+    def align_roll(self, vector):
+        self._check()
+        self.roll = get_roll_to_vector(self._store.arrays['tail'][self._row] - self._store.arrays['head'][self._row],
+                                       vector)
+
+    def translate(self, vector):
+        self._check()
+        delta = np.asarray(tuple(vector)[:3], dtype=np.float32)
+        self._store.arrays['head'][self._row] += delta
+        self._store.arrays['tail'][self._row] += delta
+
+    def transform(self, matrix, scale=True, roll=True):
+        self._check()
+        matrix = np.asarray(matrix, dtype=np.float64)
+        for attribute in ('head', 'tail'):
+            co = self._store.arrays[attribute][self._row]
+            co[:] = matrix[:3, :3] @ co + matrix[:3, 3]
+
+
+class Bone(BoneView):
+    """
+    Data bone view, head_local and tail_local are the rest positions
+    """
+
+    __slots__ = ()
+
+    head_local = BoneView.head
+    tail_local = BoneView.tail
+
+    @property
+    def matrix_local(self):
+        return self.matrix
+
+
+for _attribute in BONE_ATTRIBUTES:
+    if _attribute not in ('head', 'tail', 'use_connect'):
+        setattr(EditBone, _attribute, _array_property(_attribute))
+        setattr(Bone, _attribute, _array_property(_attribute))
+Bone.use_connect = _array_property('use_connect')
+
+
+class BlRna:
+
+    def __init__(self, properties):
+        self.properties = properties
+
+
+EditBone.bl_rna = BlRna(set(BONE_ATTRIBUTES) | {'name', 'parent'})
+Bone.bl_rna = BlRna(set(BONE_ATTRIBUTES) | {'name', 'parent', 'head_local', 'tail_local'})
+
+
+#######################################################################################################################
+# Pose
+#######################################################################################################################
+
+
+class RigifyParameters:
+    """
+    rigify_parameters of a pose bone. Parameters registered by add_parameters have their default value
+    """
+
+    definitions = dict()    # parameter name -> default value
+
+    def __init__(self):
+        object.__setattr__(self, '_values', dict())
+
+    def __getattr__(self, name):
+        values = object.__getattribute__(self, '_values')
+        if name in values:
+            return values[name]
+        definitions = RigifyParameters.definitions
+        if name in definitions:
+            default = definitions[name]
+            return list(default) if isinstance(default, list) else default
+        raise AttributeError("'RigifyParameters' object has no attribute '%s'" % name)
+
+    def __setattr__(self, name, value):
+        self._values[name] = value
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __setitem__(self, key, value):
+        self._values[key] = value
+
+    def __delitem__(self, key):
+        del self._values[key]
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def keys(self):
+        return list(self._values.keys())
+
+    def items(self):
+        return list(self._values.items())
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def copy(self):
+        parameters = RigifyParameters()
+        parameters._values.update(copy.deepcopy(self._values))
+        return parameters
+
+
+VECTOR_ATTRIBUTES = {'rotation_quaternion', 'rotation_euler', 'rotation_axis_angle', 'location', 'scale'}
+LIST_ATTRIBUTES = {'lock_location', 'lock_rotation', 'lock_scale'}
+
+
+class PoseData:
+    """
+    Pose bone attributes that are not arrays. Any attribute can be set, as the rigs set many constraint
+    and ik attributes
+    """
+
+    def __init__(self):
+        self.props = dict()
+        self.constraints = []
+        self.rotation_mode = 'QUATERNION'
+        self.rotation_quaternion = Vector((1.0, 0.0, 0.0, 0.0))
+        self.rotation_euler = Vector((0.0, 0.0, 0.0))
+        self.rotation_axis_angle = Vector((0.0, 0.0, 1.0, 0.0))
+        self.location = Vector((0.0, 0.0, 0.0))
+        self.scale = Vector((1.0, 1.0, 1.0))
+        self.lock_location = [False, False, False]
+        self.lock_rotation = [False, False, False]
+        self.lock_rotation_w = False
+        self.lock_rotations_4d = False
+        self.lock_scale = [False, False, False]
+        self.custom_shape = None
+        self.custom_shape_transform = None
+        self.bone_group = None
+        self.rigify_type = ""
+        self.rigify_parameters = RigifyParameters()
+
+    def copy(self):
+        """
+        Copy for another armature: constraints are not copied, objects like custom shapes are shared
+        """
+
+        pose = PoseData.__new__(PoseData)
+        pose.__dict__.update(self.__dict__)
+        pose.props = copy.deepcopy(self.props)
+        pose.constraints = []
+        pose.rigify_parameters = self.rigify_parameters.copy()
+        for attribute in VECTOR_ATTRIBUTES:
+            setattr(pose, attribute, Vector(getattr(self, attribute)))
+        for attribute in LIST_ATTRIBUTES:
+            setattr(pose, attribute, list(getattr(self, attribute)))
+        return pose
+
+
+class PoseBone(BoneView):
+    """
+    Pose bone view. The armature is never posed, pose space is rest space
+    """
+
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self._store.get_pose(self._row), name)
+
+    def __setattr__(self, name, value):
+        if name in PoseBone.__dict__ or name in BoneView.__dict__:
+            object.__setattr__(self, name, value)
+            return
+        self._check()
+        if name in VECTOR_ATTRIBUTES:
+            value = Vector(value)
+        elif name in LIST_ATTRIBUTES:
+            value = list(value)
+        setattr(self._store.get_pose(self._row), name, value)
+
+    @property
+    def bone(self):
+        return Bone(self._store, self._row)
+
+    @property
+    def constraints(self):
+        return ConstraintCollection(self)
+
+    @property
+    def obj(self):
+        return self._store.owner
+
+    # ID properties
+
+    def __getitem__(self, key):
+        return self._store.get_pose(self._row).props[key]
+
+    def __setitem__(self, key, value):
+        self._store.get_pose(self._row).props[key] = value
+
+    def __delitem__(self, key):
+        del self._store.get_pose(self._row).props[key]
+
+    def __contains__(self, key):
+        return key in self._store.get_pose(self._row).props
+
+    def keys(self):
+        return list(self._store.get_pose(self._row).props.keys())
+
+    def get(self, key, default=None):
+        return self._store.get_pose(self._row).props.get(key, default)
+
+    def path_from_id(self, path=''):
+        return 'pose.bones["%s"]' % self.name + ('.' + path if path else '')
+
+    def driver_add(self, path, index=-1):
+        return self._store.owner.driver_add('pose.bones["%s"].%s' % (self.name, path), index)
+
+    def driver_remove(self, path, index=-1):
+        return self._store.owner.driver_remove('pose.bones["%s"].%s' % (self.name, path), index)
+
+
+#######################################################################################################################
+# Constraints
+#######################################################################################################################
+
+CONSTRAINT_NAMES = {'COPY_LOCATION': 'Copy Location', 'COPY_ROTATION': 'Copy Rotation', 'COPY_SCALE': 'Copy Scale',
+                    'COPY_TRANSFORMS': 'Copy Transforms', 'LIMIT_DISTANCE': 'Limit Distance',
+                    'LIMIT_LOCATION': 'Limit Location', 'LIMIT_ROTATION': 'Limit Rotation',
+                    'LIMIT_SCALE': 'Limit Scale', 'DAMPED_TRACK': 'Damped Track', 'TRACK_TO': 'Track To',
+                    'STRETCH_TO': 'Stretch To', 'IK': 'IK', 'CHILD_OF': 'Child Of', 'ACTION': 'Action',
+                    'TRANSFORM': 'Transformation', 'ARMATURE': 'Armature', 'MAINTAIN_VOLUME': 'Maintain Volume'}
+
+
+class Constraint:
+    """
+    Attribute bag with the common constraint attributes, the type specific ones are set freely
+    """
+
+    def __init__(self, owner, cns_type, name):
+        self._owner = owner
+        self.type = cns_type
+        self.name = name
+        self.target = None
+        self.subtarget = ""
+        self.influence = 1.0
+        self.mute = False
+        self.owner_space = 'WORLD'
+        self.target_space = 'WORLD'
+
+    def __repr__(self):
+        return "Constraint(%r, %r)" % (self.type, self.name)
+
+    def driver_add(self, path, index=-1):
+        owner = self._owner
+        return owner.obj.driver_add('pose.bones["%s"].constraints["%s"].%s' % (owner.name, self.name, path), index)
+
+
+class ConstraintCollection:
+
+    def __init__(self, pose_bone):
+        self._pose_bone = pose_bone
+        self._constraints = pose_bone._store.get_pose(pose_bone._row).constraints
+
+    def __len__(self):
+        return len(self._constraints)
+
+    def __iter__(self):
+        return iter(list(self._constraints))
+
+    def __bool__(self):
+        return bool(self._constraints)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            for constraint in self._constraints:
+                if constraint.name == key:
+                    return constraint
+            raise KeyError("bpy_prop_collection[key]: key \"%s\" not found" % key)
+        return self._constraints[key]
+
+    def __contains__(self, key):
+        return any(constraint.name == key for constraint in self._constraints)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [constraint.name for constraint in self._constraints]
+
+    def new(self, cns_type):
+        base = CONSTRAINT_NAMES.get(cns_type, cns_type.replace('_', ' ').title())
+        names = set(self.keys())
+        name = base
+        i = 1
+        while name in names:
+            name = "%s.%03d" % (base, i)
+            i += 1
+        constraint = Constraint(self._pose_bone, cns_type, name)
+        self._constraints.append(constraint)
+        return constraint
+
+    def remove(self, constraint):
+        self._constraints.remove(constraint)
+
+    def clear(self):
+        del self._constraints[:]
+
+
+#######################################################################################################################
+# Collections
+#######################################################################################################################
+
+
+class BoneCollection:
+    """
+    obj.data.edit_bones, obj.data.bones or obj.pose.bones: the live rows of the store seen as view_class
+    """
+
+    def __init__(self, store, view_class):
+        self._store = store
+        self._view_class = view_class
+
+    def __len__(self):
+        return len(self._store)
+
+    def __iter__(self):
+        view_class = self._view_class
+        return (view_class(self._store, int(row)) for row in self._store.rows)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self._view_class(self._store, int(row)) for row in self._store.rows[key]]
+        try:
+            return self._view_class(self._store, self._store.get_row(key))
+        except (KeyError, IndexError):
+            raise KeyError("bpy_prop_collection[key]: key \"%s\" not found" % key)
+
+    def __contains__(self, key):
+        if isinstance(key, str):
+            return key in self._store.index
+        return isinstance(key, BoneView) and key._store is self._store and self._store.alive[key._row]
+
+    def get(self, key, default=None):
+        row = self._store.index.get(key)
+        return self._view_class(self._store, row) if row is not None else default
+
+    def keys(self):
+        return list(self._store.keys)
+
+    def values(self):
+        return list(self)
+
+    def items(self):
+        return [(view.name, view) for view in self]
+
+    def find(self, key):
+        row = self._store.index.get(key)
+        if row is None:
+            return -1
+        return int(np.searchsorted(self._store.rows, row))
+
+    def foreach_get(self, attribute, seq):
+        rows = self._store.rows
+        if attribute in BONE_ATTRIBUTES:
+            values = self._store.arrays[attribute][rows].ravel()
+        else:
+            values = [getattr(view, attribute) for view in self]
+            values = np.asarray(values).ravel()
+        if isinstance(seq, np.ndarray):
+            seq[...] = values.reshape(seq.shape)
+        else:
+            seq[:] = values.tolist()
+
+    def foreach_set(self, attribute, seq):
+        rows = self._store.rows
+        values = np.asarray(seq)
+        if attribute in BONE_ATTRIBUTES:
+            dtype, size, default = BONE_ATTRIBUTES[attribute]
+            self._store.arrays[attribute][rows] = values.reshape(len(rows), size)
+        else:
+            values = values.reshape(len(rows), -1)
+            for view, value in zip(self, values):
+                setattr(view, attribute, value[0] if len(value) == 1 else tuple(value))
+
+
+class EditBones(BoneCollection):
+
+    def __init__(self, store):
+        super().__init__(store, EditBone)
+        self.active = None
+
+    def new(self, name):
+        return EditBone(self._store, self._store.add(name))
+
+    def remove(self, bone):
+        bone._check()
+        self._store.remove(bone._row)
@@ -0,0 +1,205 @@
+#######################################################################################################################
+# Stand-in for the bpy module: the data, context, ops, props, types, utils and app the rigs use
+#######################################################################################################################
+
+import os
+import tempfile
+import warnings
+from types import SimpleNamespace
+
+from . import armature as _armature
+from . import data as _data
+
+HEADLESS = True
+
+
+class BlendData:
+    """
+    bpy.data
+    """
+
+    def __init__(self):
+        self.objects = _data.IDCollection(_data.Object)
+        self.meshes = _data.IDCollection(_data.Mesh)
+        self.armatures = _data.IDCollection(_data.Armature)
+        self.collections = _data.IDCollection(_data.Collection)
+        self.scenes = _data.IDCollection(lambda name: _data.Scene(name, self.objects))
+        self.filepath = ''      # never saved
+
+
+data = BlendData()
+context = _data.Context(data.scenes.new("Scene"))
+_data.SCENES.append(context.scene)
+
+
+def reset():
+    """
+    Empties the blend data, keeping a single scene
+    """
+
+    data.__init__()
+    del _data.SCENES[:]
+    context.scene = data.scenes.new("Scene")
+    context.active_pose_bone = None
+    _data.SCENES.append(context.scene)
+
+
+#######################################################################################################################
+# ops
+#######################################################################################################################
+
+
+class ZeroLengthBoneWarning(UserWarning):
+    pass
+
+
+def _remove_zero_length_bones(obj):
+    """
+    Blender frees the edit bones of (nearly) zero length when it leaves EDIT mode, their children get their parent
+    and keep their connect flag. Blender reports it only in debug builds, here a warning is issued for every bone
+    """
+
+    store = obj.data.store
+    rows = store.rows
+    lengths = ((store.arrays['tail'][rows] - store.arrays['head'][rows]) ** 2).sum(axis=1)
+    for row in rows[lengths <= 1e-12]:
+        warnings.warn("removed zero sized bone: %s" % store.names[row], ZeroLengthBoneWarning, stacklevel=4)
+        store.remove(int(row), disconnect=False)
+
+
+def mode_set(mode='OBJECT', toggle=False):
+    """
+    bpy.ops.object.mode_set on the active object. Like blender, leaving EDIT mode drops zero length bones
+    """
+
+    obj = context.object
+    if obj is None:
+        raise RuntimeError("Operator bpy.ops.object.mode_set.poll() failed, context is incorrect")
+    if obj.mode == 'EDIT' and mode != 'EDIT' and obj.type == 'ARMATURE':
+        _remove_zero_length_bones(obj)
+    obj.mode = mode
+    return {'FINISHED'}
+
+
+_OPERATORS = {'object.mode_set': mode_set}
+
+
+class BPyOpsSubModOp:
+    """
+    bpy.ops.<module>.<func>, as blender's python operator wrapper. Operators it doesn't implement raise when called
+    """
+
+    def __init__(self, module, func):
+        self._module = module
+        self._func = func
+
+    def idname_py(self):
+        return "%s.%s" % (self._module, self._func)
+
+    def __call__(self, *args, **kwargs):
+        operator = _OPERATORS.get(self.idname_py())
+        if operator is None:
+            raise NotImplementedError("bpy.ops.%s is not available headless" % self.idname_py())
+        return operator(**kwargs)
+
+
+class BPyOpsSubMod:
+    """
+    An ops submodule, its attributes are operators
+    """
+
+    def __init__(self, module):
+        self._module = module
+
+    def __getattr__(self, func):
+        if func.startswith('_'):
+            raise AttributeError(func)
+        return BPyOpsSubModOp(self._module, func)
+
+
+ops = SimpleNamespace(object=BPyOpsSubMod('object'),
+                      armature=BPyOpsSubMod('armature'),
+                      pose=BPyOpsSubMod('pose'))
+
+
+#######################################################################################################################
+# props, types, utils, app
+#######################################################################################################################
+
+
+class PropertyDefinition:
+    """
+    What a bpy.props function returns, add_parameters collects the default
+    """
+
+    def __init__(self, kind, **kwargs):
+        self.kind = kind
+        self.kwargs = kwargs
+
+    @property
+    def default(self):
+        if 'default' in self.kwargs:
+            return self.kwargs['default']
+        if self.kind == 'EnumProperty':
+            items = self.kwargs.get('items')
+            return items[0][0] if items and not callable(items) else ''
+        if self.kind == 'CollectionProperty':
+            return []
+        size = self.kwargs.get('size')
+        value = {'BoolProperty': False, 'BoolVectorProperty': False, 'IntProperty': 0, 'FloatProperty': 0.0,
+                 'FloatVectorProperty': 0.0, 'IntVectorProperty': 0, 'StringProperty': ''}.get(self.kind)
+        return [value] * size if size else value
+
+
+def _property(kind):
+    return lambda **kwargs: PropertyDefinition(kind, **kwargs)
+
+
+props = SimpleNamespace(**{kind: _property(kind) for kind in
+                           ('BoolProperty', 'BoolVectorProperty', 'IntProperty', 'IntVectorProperty',
+                            'FloatProperty', 'FloatVectorProperty', 'StringProperty', 'EnumProperty',
+                            'CollectionProperty', 'PointerProperty')})
+
+
+class PropertyGroup:
+    pass
+
+
+class Operator:
+    pass
+
+
+class Panel:
+    pass
+
+
+types = SimpleNamespace(EditBone=_armature.EditBone, Bone=_armature.Bone, PoseBone=_armature.PoseBone,
+                        Object=_data.Object, Armature=_data.Armature, Mesh=_data.Mesh, ID=_data.ID,
+                        Constraint=_armature.Constraint, Collection=_data.Collection, Scene=_data.Scene,
+                        ViewLayer=_data.ViewLayer, WindowManager=_data.WindowManager, PropertyGroup=PropertyGroup,
+                        Operator=Operator, Panel=Panel)
+
+
+def _register_class(cls):
+    pass
+
+
+_user_resources = tempfile.mkdtemp(prefix='headless_user_')
+
+
+def _user_resource(resource_type, *, path='', create=False):
+    """
+    User resource directories are kept for the process only. path and create are keyword-only, as since blender 3.0
+    """
+
+    target_path = os.path.join(_user_resources, resource_type.lower(), path)
+    if create:
+        os.makedirs(target_path, exist_ok=True)
+    return target_path
+
+
+utils = SimpleNamespace(register_class=_register_class, unregister_class=_register_class,
+                        user_resource=_user_resource)
+
+app = SimpleNamespace(version=(2, 80, 0), version_string="2.80 (headless)", background=True, binary_path='',
+                      tempdir=tempfile.mkdtemp(prefix='headless_tmp_') + os.sep)
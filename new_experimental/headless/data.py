@@ -0,0 +1,704 @@
+#######################################################################################################################
+# ID blocks of the headless backend: objects, armatures, meshes, drivers, scene and context
+#######################################################################################################################
+
+import numpy as np
+
+from .mathutils import Vector, Matrix
+from .armature import BoneStore, BoneCollection, EditBones, Bone, PoseBone
+
+MAX_NAME_LENGTH = 63     # longer ID names are truncated, as blender does
+
+
+class ID:
+    """
+    Named data block with ID properties. users counts the objects using it as data
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._collection = None
+        self.users = 0
+        self._props = dict()
+
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        if self._collection is not None:
+            self._collection.rename(self, value)
+        else:
+            self._name = value
+
+    def __repr__(self):
+        return "%s(%r)" % (type(self).__name__, self.name)
+
+    def __getitem__(self, key):
+        return self._props[key]
+
+    def __setitem__(self, key, value):
+        self._props[key] = value
+
+    def __delitem__(self, key):
+        del self._props[key]
+
+    def __contains__(self, key):
+        return key in self._props
+
+    def keys(self):
+        return list(self._props.keys())
+
+    def get(self, key, default=None):
+        return self._props.get(key, default)
+
+    def user_clear(self):
+        self.users = 0
+
+
+#######################################################################################################################
+# Drivers
+#######################################################################################################################
+
+
+class DriverTarget:
+
+    def __init__(self):
+        self.id = None
+        self.id_type = 'OBJECT'
+        self.data_path = ""
+        self.bone_target = ""
+        self.transform_type = 'LOC_X'
+        self.transform_space = 'WORLD_SPACE'
+
+
+class DriverVariable:
+
+    def __init__(self):
+        self.name = "var"
+        self.type = 'SINGLE_PROP'
+        self.targets = [DriverTarget(), DriverTarget()]
+
+
+class DriverVariables(list):
+
+    def new(self):
+        variable = DriverVariable()
+        self.append(variable)
+        return variable
+
+
+class Driver:
+
+    def __init__(self):
+        self.type = 'SCRIPTED'
+        self.expression = ""
+        self.use_self = False
+        self.variables = DriverVariables()
+
+
+class FModifier:
+
+    def __init__(self, modifier_type):
+        self.type = modifier_type
+        self.mode = 'EXPANDED'
+        self.poly_order = 1
+        self.coefficients = [0.0, 1.0]
+        self.mute = False
+
+
+class FModifiers(list):
+
+    def new(self, modifier_type):
+        modifier = FModifier(modifier_type)
+        self.append(modifier)
+        return modifier
+
+
+class FCurve:
+    """
+    Driver fcurve. Like blender, a new driver fcurve has a generator modifier
+    """
+
+    def __init__(self, data_path, array_index):
+        self.data_path = data_path
+        self.array_index = array_index
+        self.driver = Driver()
+        self.modifiers = FModifiers([FModifier('GENERATOR')])
+        self.keyframe_points = []
+        self.mute = False
+
+
+class FCurves(list):
+
+    def find(self, data_path, index=0):
+        for fcurve in self:
+            if fcurve.data_path == data_path and fcurve.array_index == index:
+                return fcurve
+        return None
+
+
+class AnimData:
+
+    def __init__(self):
+        self.action = None
+        self.drivers = FCurves()
+
+
+#######################################################################################################################
+# Armature and pose
+#######################################################################################################################
+
+
+class Armature(ID):
+    """
+    Armature data: edit_bones and bones share the same BoneStore
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.store = BoneStore()
+        self.edit_bones = EditBones(self.store)
+        self.bones = BoneCollection(self.store, Bone)
+        self.layers = [True] + [False] * 31
+        self.show_names = False
+        self.show_axes = False
+        self.draw_type = 'OCTAHEDRAL'
+        self.use_mirror_x = False
+
+    def copy(self):
+        """
+        Copy of the armature with its bones, pose data and ID properties
+        """
+
+        arm = self._collection.new(self.name)
+        arm._props.update(self._props)
+
+        source = self.store
+        store = arm.store
+        rows = source.rows
+        row_map = np.full(len(source.names), -1, dtype=np.int64)
+
+        for row in rows:
+            row_map[row] = store.add(source.names[row])
+        for attribute, array in source.arrays.items():
+            store.arrays[attribute][row_map[rows]] = array[rows]
+        for row in rows:
+            parent = source.parents[row]
+            store.set_parent(row_map[row], row_map[parent] if parent != -1 else -1)
+            if source.pose[row] is not None:
+                store.pose[row_map[row]] = source.pose[row].copy()
+
+        return arm
+
+
+class BoneGroup:
+
+    def __init__(self, name):
+        self.name = name
+        self.color_set = 'DEFAULT'
+
+
+class BoneGroups(list):
+
+    def new(self, name="Group"):
+        group = BoneGroup(name)
+        self.append(group)
+        return group
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            for group in self:
+                if group.name == key:
+                    return group
+            raise KeyError(key)
+        return list.__getitem__(self, key)
+
+    def __contains__(self, key):
+        if isinstance(key, str):
+            return any(group.name == key for group in self)
+        return list.__contains__(self, key)
+
+
+class Pose:
+
+    def __init__(self, store):
+        self.bones = BoneCollection(store, PoseBone)
+        self.bone_groups = BoneGroups()
+
+
+#######################################################################################################################
+# Mesh
+#######################################################################################################################
+
+
+class MeshElements:
+    """
+    vertices, edges, polygons or loops of a mesh: an array per attribute, grown by add
+    """
+
+    def __init__(self, attributes):
+        self._attributes = attributes     # name -> (dtype, size)
+        self._arrays = {name: np.zeros((0, size), dtype=dtype) for name, (dtype, size) in attributes.items()}
+
+    def __len__(self):
+        return len(next(iter(self._arrays.values())))
+
+    def __iter__(self):
+        return (MeshElement(self, i) for i in range(len(self)))
+
+    def __getitem__(self, index):
+        return MeshElement(self, range(len(self))[index])
+
+    def add(self, count):
+        for name, (dtype, size) in self._attributes.items():
+            self._arrays[name] = np.concatenate((self._arrays[name], np.zeros((count, size), dtype=dtype)))
+
+    def foreach_get(self, attribute, seq):
+        values = self._arrays[attribute].ravel()
+        if isinstance(seq, np.ndarray):
+            seq[...] = values.reshape(seq.shape)
+        else:
+            seq[:] = values.tolist()
+
+    def foreach_set(self, attribute, seq):
+        array = self._arrays[attribute]
+        array[:] = np.asarray(seq).reshape(array.shape)
+
+
+class MeshElement:
+
+    def __init__(self, elements, index):
+        object.__setattr__(self, '_elements', elements)
+        object.__setattr__(self, 'index', index)
+
+    def __getattr__(self, name):
+        values = self._elements._arrays[name][self.index]
+        return Vector.view(values) if name == 'co' else (tuple(values.tolist()) if len(values) > 1 else values[0])
+
+    def __setattr__(self, name, value):
+        self._elements._arrays[name][self.index] = value
+
+
+class Mesh(ID):
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.vertices = MeshElements({'co': (np.float32, 3)})
+        self.edges = MeshElements({'vertices': (np.int32, 2)})
+        self.polygons = MeshElements({'loop_start': (np.int32, 1), 'loop_total': (np.int32, 1)})
+        self.loops = MeshElements({'vertex_index': (np.int32, 1)})
+
+    def from_pydata(self, vertices, edges, faces):
+        self.vertices.add(len(vertices))
+        if len(vertices):
+            self.vertices.foreach_set('co', np.asarray(vertices, dtype=np.float32).ravel())
+        self.edges.add(len(edges))
+        if len(edges):
+            self.edges.foreach_set('vertices', np.asarray(edges, dtype=np.int32).ravel())
+        self.polygons.add(len(faces))
+        self.loops.add(sum(len(face) for face in faces))
+        if faces:
+            totals = np.array([len(face) for face in faces], dtype=np.int32)
+            self.polygons.foreach_set('loop_total', totals)
+            self.polygons.foreach_set('loop_start', np.cumsum(totals) - totals)
+            self.loops.foreach_set('vertex_index', np.concatenate([np.asarray(face) for face in faces]))
+
+    def update(self, calc_edges=False):
+        pass
+
+    def validate(self, verbose=False):
+        return False
+
+
+#######################################################################################################################
+# Object
+#######################################################################################################################
+
+
+class Object(ID):
+    """
+    Object with its data, an armature object also has a pose and a mode
+    """
+
+    def __init__(self, name, data):
+        super().__init__(name)
+        self._data = None
+        self.mode = 'OBJECT'
+        self.animation_data = None
+        self.location = Vector((0.0, 0.0, 0.0))
+        self.rotation_euler = Vector((0.0, 0.0, 0.0))
+        self.scale = Vector((1.0, 1.0, 1.0))
+        self.matrix_world = Matrix.Identity(4)
+        self.parent = None
+        self.hide_viewport = False
+        self.hide_select = False
+        self.show_in_front = False
+        self.users_collection = []
+        self._select = False
+        self._hide = False
+        self.pose = None
+        self.data = data
+
+    @property
+    def type(self):
+        if isinstance(self._data, Armature):
+            return 'ARMATURE'
+        if isinstance(self._data, Mesh):
+            return 'MESH'
+        return 'EMPTY'
+
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        if self._data is not None:
+            self._data.users -= 1
+        self._data = value
+        if value is not None:
+            value.users += 1
+        if isinstance(value, Armature):
+            value.store.owner = self
+            self.pose = Pose(value.store)
+
+    def copy(self):
+        """
+        Copy of the object using the same data, as in blender. The pose lives with the bones here,
+        so the copy shares it until its data is replaced
+        """
+
+        obj = self._collection.new(self.name, self.data)
+        if self.type == 'ARMATURE':
+            self.data.store.owner = self
+        obj._props.update(self._props)
+        obj.location = Vector(self.location)
+        obj.rotation_euler = Vector(self.rotation_euler)
+        obj.scale = Vector(self.scale)
+        return obj
+
+    def select_get(self, view_layer=None):
+        return self._select
+
+    def select_set(self, state, view_layer=None):
+        self._select = bool(state)
+
+    def hide_get(self, view_layer=None):
+        return self._hide
+
+    def hide_set(self, state, view_layer=None):
+        self._hide = bool(state)
+
+    def animation_data_create(self):
+        if self.animation_data is None:
+            self.animation_data = AnimData()
+        return self.animation_data
+
+    def driver_add(self, path, index=-1):
+        drivers = self.animation_data_create().drivers
+        index = max(index, 0)
+        fcurve = drivers.find(path, index)
+        if fcurve is None:
+            fcurve = FCurve(path, index)
+            drivers.append(fcurve)
+        return fcurve
+
+    def driver_remove(self, path, index=-1):
+        if self.animation_data is None:
+            return False
+        drivers = self.animation_data.drivers
+        removed = [fcurve for fcurve in drivers if fcurve.data_path == path and index in (-1, fcurve.array_index)]
+        for fcurve in removed:
+            drivers.remove(fcurve)
+        return bool(removed)
+
+
+#######################################################################################################################
+# bpy.data collections, scene and context
+#######################################################################################################################
+
+
+class IDCollection:
+    """
+    bpy.data.objects, meshes or armatures: ID blocks by unique name
+    """
+
+    def __init__(self, id_class):
+        self._id_class = id_class
+        self._items = dict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(list(self._items.values()))
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._items[key]
+        return list(self._items.values())[key]
+
+    def __contains__(self, key):
+        if isinstance(key, str):
+            return key in self._items
+        return self._items.get(getattr(key, 'name', None)) is key
+
+    def get(self, key, default=None):
+        return self._items.get(key, default)
+
+    def keys(self):
+        return list(self._items.keys())
+
+    def values(self):
+        return list(self._items.values())
+
+    def unique_name(self, name):
+        name = name[:MAX_NAME_LENGTH]
+        if name not in self._items:
+            return name
+        name = name[:MAX_NAME_LENGTH - 4]
+        i = 1
+        while "%s.%03d" % (name, i) in self._items:
+            i += 1
+        return "%s.%03d" % (name, i)
+
+    def rename(self, block, name):
+        del self._items[block.name]
+        block._name = self.unique_name(name)
+        self._items[block.name] = block
+
+    def new(self, name, *args):
+        block = self._id_class(self.unique_name(name), *args)
+        block._collection = self
+        self._items[block.name] = block
+        return block
+
+    def remove(self, block, do_unlink=True):
+        if self._items.get(block.name) is not block:
+            raise ReferenceError("%r is not in the blend data" % block)
+        del self._items[block.name]
+        block._collection = None
+        if isinstance(block, Object):
+            for collection in list(block.users_collection):
+                collection.objects.unlink(block)
+            block.data = None
+        elif isinstance(block, Collection):
+            for obj in list(block.objects):
+                block.objects.unlink(obj)
+            for scene in SCENES:
+                for parent in [scene.collection] + scene.collection.children_recursive:
+                    if block in parent.children:
+                        parent.children.unlink(block)
+
+
+class CollectionObjects:
+    """
+    collection.objects: the objects linked to a collection, in link order
+    """
+
+    def __init__(self, collection):
+        self._owner = collection
+        self._linked = dict()   # id -> object, in link order
+
+    def __len__(self):
+        return len(self._linked)
+
+    def __iter__(self):
+        return iter(list(self._linked.values()))
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            for obj in self._linked.values():
+                if obj.name == key:
+                    return obj
+            raise KeyError(key)
+        return list(self._linked.values())[key]
+
+    def __contains__(self, key):
+        if isinstance(key, str):
+            return any(obj.name == key for obj in self._linked.values())
+        return id(key) in self._linked
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def link(self, obj):
+        if id(obj) in self._linked:
+            raise RuntimeError("Object '%s' already in collection '%s'" % (obj.name, self._owner.name))
+        self._linked[id(obj)] = obj
+        obj.users_collection.append(self._owner)
+
+    def unlink(self, obj):
+        if id(obj) not in self._linked:
+            raise RuntimeError("Object '%s' not in collection '%s'" % (obj.name, self._owner.name))
+        del self._linked[id(obj)]
+        obj.users_collection = [c for c in obj.users_collection if c is not self._owner]
+
+
+class CollectionChildren(list):
+    """
+    collection.children
+    """
+
+    def __contains__(self, child):
+        return any(c is child for c in self)
+
+    def link(self, child):
+        if child in self:
+            raise RuntimeError("Collection '%s' already in collection" % child.name)
+        self.append(child)
+
+    def unlink(self, child):
+        self[:] = [c for c in self if c is not child]
+
+
+class Collection(ID):
+    """
+    Objects and child collections, a scene links its objects through its master collection
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.objects = CollectionObjects(self)
+        self.children = CollectionChildren()
+        self.hide_viewport = False
+        self.hide_render = False
+        self.hide_select = False
+
+    @property
+    def children_recursive(self):
+        children = []
+        for child in self.children:
+            for collection in [child] + child.children_recursive:
+                if not any(c is collection for c in children):
+                    children.append(collection)
+        return children
+
+    @property
+    def all_objects(self):
+        objects = dict()
+        for collection in [self] + self.children_recursive:
+            for obj in collection.objects:
+                objects.setdefault(id(obj), obj)
+        return list(objects.values())
+
+
+class SceneObjects:
+    """
+    scene.objects: every object of the scene collection tree, read only. Objects are linked through collections
+    and names are looked up in the blend data objects
+    """
+
+    def __init__(self, scene, data_objects):
+        self._scene = scene
+        self._data_objects = data_objects
+
+    def __len__(self):
+        return len(self._scene.collection.all_objects)
+
+    def __iter__(self):
+        return iter(self._scene.collection.all_objects)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            obj = self._data_objects.get(key)
+            if obj is None or obj not in self:
+                raise KeyError(key)
+            return obj
+        return self._scene.collection.all_objects[key]
+
+    def __contains__(self, key):
+        if isinstance(key, str):
+            key = self._data_objects.get(key)
+        if key is None or not key.users_collection:
+            return False
+        tree = [self._scene.collection] + self._scene.collection.children_recursive
+        return any(c is collection for c in key.users_collection for collection in tree)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        return [obj.name for obj in self]
+
+
+class LayerObjects(SceneObjects):
+    """
+    view_layer.objects: the scene objects and the active object
+    """
+
+    def __init__(self, scene, data_objects):
+        super().__init__(scene, data_objects)
+        self._active = None
+
+    @property
+    def active(self):
+        if self._active is not None and self._active not in self:
+            self._active = None
+        return self._active
+
+    @active.setter
+    def active(self, obj):
+        if obj is not None and obj not in self:
+            raise ValueError("ViewLayer.objects.active: object '%s' is not in the view layer" % obj.name)
+        self._active = obj
+
+
+class ViewLayer:
+
+    def __init__(self, scene, data_objects, name="View Layer"):
+        self.name = name
+        self.objects = LayerObjects(scene, data_objects)
+
+    def update(self):
+        pass
+
+
+class Scene(ID):
+
+    def __init__(self, name, data_objects):
+        super().__init__(name)
+        self.collection = Collection("Master Collection")
+        self.objects = SceneObjects(self, data_objects)
+        self.view_layers = [ViewLayer(self, data_objects)]
+
+
+SCENES = []
+
+
+class WindowManager(ID):
+    pass
+
+
+class Context:
+    """
+    bpy.context: the active object comes from the view layer, new objects go to the scene collection
+    """
+
+    def __init__(self, scene):
+        self.scene = scene
+        self.window_manager = WindowManager("WinMan")
+        self.active_pose_bone = None
+
+    @property
+    def view_layer(self):
+        return self.scene.view_layers[0]
+
+    @property
+    def collection(self):
+        return self.scene.collection
+
+    @property
+    def object(self):
+        return self.view_layer.objects.active
+
+    active_object = object
+
+    @property
+    def mode(self):
+        obj = self.object
+        if obj is None or obj.mode == 'OBJECT':
+            return 'OBJECT'
+        return obj.mode + '_' + obj.type
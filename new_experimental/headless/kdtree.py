@@ -0,0 +1,56 @@
+#######################################################################################################################
+# Stand-in for mathutils.kdtree: points sorted on x, queries only scan the x slab around the query point
+#######################################################################################################################
+
+import numpy as np
+
+from .mathutils import Vector
+
+
+class KDTree:
+
+    def __init__(self, size):
+        self._points = np.zeros((size, 3), dtype=np.float64)
+        self._indices = np.zeros(size, dtype=np.int64)
+        self._count = 0
+        self._order = None
+
+    def insert(self, co, index):
+        self._points[self._count] = tuple(co)[:3]
+        self._indices[self._count] = index
+        self._count += 1
+        self._order = None
+
+    def balance(self):
+        points = self._points[:self._count]
+        self._order = np.argsort(points[:, 0], kind='stable')
+        self._sorted = points[self._order]
+        self._sorted_x = self._sorted[:, 0]
+
+    def _slab(self, co, radius):
+        if self._order is None:
+            raise RuntimeError("KDTree must be balanced before calling find")
+        start = np.searchsorted(self._sorted_x, co[0] - radius, side='left')
+        end = np.searchsorted(self._sorted_x, co[0] + radius, side='right')
+        return start, end
+
+    def find_range(self, co, radius):
+        co = np.asarray(tuple(co)[:3], dtype=np.float64)
+        start, end = self._slab(co, radius)
+        distances = np.linalg.norm(self._sorted[start:end] - co, axis=1)
+        found = np.flatnonzero(distances <= radius)
+        found = found[np.argsort(distances[found], kind='stable')]
+        return [(Vector(self._sorted[start + i]), int(self._indices[self._order[start + i]]), float(distances[i]))
+                for i in found]
+
+    def find_n(self, co, n):
+        co = np.asarray(tuple(co)[:3], dtype=np.float64)
+        if self._order is None:
+            raise RuntimeError("KDTree must be balanced before calling find")
+        distances = np.linalg.norm(self._sorted - co, axis=1)
+        found = np.argsort(distances, kind='stable')[:n]
+        return [(Vector(self._sorted[i]), int(self._indices[self._order[i]]), float(distances[i])) for i in found]
+
+    def find(self, co):
+        found = self.find_n(co, 1)
+        return found[0] if found else (None, None, None)
@@ -0,0 +1,334 @@
+#######################################################################################################################
+# Stand-in for the subset of mathutils used by the rigs: Vector, Matrix, Color and kdtree.KDTree
+#######################################################################################################################
+
+import math
+import numpy as np
+
+
+class Vector:
+    """
+    numpy backed Vector. A Vector built on a bone attribute row is a view: editing it edits the bone
+    """
+
+    __slots__ = ('_data',)
+
+    def __init__(self, seq=(0.0, 0.0, 0.0), _view=None):
+        if _view is not None:
+            object.__setattr__(self, '_data', _view)
+        else:
+            object.__setattr__(self, '_data', np.array(tuple(seq), dtype=np.float64))
+
+    @classmethod
+    def view(cls, array):
+        return cls(_view=array)
+
+    # sequence protocol
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        return iter(self._data.tolist())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self._data[index].tolist())
+        return float(self._data[index])
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            self._data[index] = tuple(value)
+        else:
+            self._data[index] = value
+
+    def __array__(self, dtype=None, copy=None):
+        return np.array(self._data, dtype=dtype)
+
+    def __repr__(self):
+        return "Vector((%s))" % ", ".join("%.4f" % v for v in self._data)
+
+    # components
+
+    def _get(index):
+        return property(lambda self: float(self._data[index]),
+                        lambda self, value: self._data.__setitem__(index, value))
+
+    x = _get(0)
+    y = _get(1)
+    z = _get(2)
+    w = _get(3)
+
+    del _get
+
+    # arithmetic
+
+    @staticmethod
+    def _values(other):
+        return other._data if isinstance(other, Vector) else np.asarray(tuple(other), dtype=np.float64)
+
+    def __add__(self, other):
+        return Vector(self._data + self._values(other))
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return Vector(self._data - self._values(other))
+
+    def __rsub__(self, other):
+        return Vector(self._values(other) - self._data)
+
+    def __mul__(self, other):
+        if isinstance(other, Vector):
+            return self.dot(other)
+        return Vector(self._data * other)
+
+    def __rmul__(self, other):
+        if isinstance(other, Matrix):
+            return other @ self
+        return Vector(self._data * other)
+
+    def __matmul__(self, other):
+        if isinstance(other, Matrix):
+            return Vector(self._data @ other._data[:len(self), :len(self)])
+        return self.dot(other)
+
+    def __truediv__(self, other):
+        return Vector(self._data / other)
+
+    def __neg__(self):
+        return Vector(-self._data)
+
+    def __pos__(self):
+        return Vector(self._data)
+
+    def __iadd__(self, other):
+        self._data += self._values(other)
+        return self
+
+    def __isub__(self, other):
+        self._data -= self._values(other)
+        return self
+
+    def __imul__(self, other):
+        self._data *= other
+        return self
+
+    def __itruediv__(self, other):
+        self._data /= other
+        return self
+
+    def __eq__(self, other):
+        try:
+            return len(self) == len(other) and bool(np.all(self._data == self._values(other)))
+        except TypeError:
+            return False
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    # geometry
+
+    @property
+    def length(self):
+        return float(np.linalg.norm(self._data))
+
+    @length.setter
+    def length(self, value):
+        length = self.length
+        if length:
+            self._data *= value / length
+
+    magnitude = length
+
+    @property
+    def length_squared(self):
+        return float(self._data @ self._data)
+
+    def dot(self, other):
+        return float(self._data @ self._values(other))
+
+    def cross(self, other):
+        return Vector(np.cross(self._data[:3], self._values(other)[:3]))
+
+    def normalized(self):
+        length = self.length
+        return Vector(self._data / length if length else self._data)
+
+    def normalize(self):
+        length = self.length
+        if length:
+            self._data /= length
+
+    def angle(self, other, fallback=None):
+        denominator = self.length * Vector(other).length
+        if not denominator:
+            if fallback is not None:
+                return fallback
+            raise ValueError("Vector.angle(other): zero length vectors have no valid angle")
+        return math.acos(max(-1.0, min(1.0, self.dot(other) / denominator)))
+
+    def lerp(self, other, factor):
+        return Vector(self._data + (self._values(other) - self._data) * factor)
+
+    def project(self, other):
+        other = Vector(other)
+        return other * (self.dot(other) / other.length_squared)
+
+    def copy(self):
+        return Vector(self._data)
+
+    __copy__ = copy
+
+    def to_tuple(self, precision=-1):
+        if precision == -1:
+            return tuple(self._data.tolist())
+        return tuple(round(v, precision) for v in self._data.tolist())
+
+    def to_3d(self):
+        data = np.zeros(3)
+        data[:min(3, len(self))] = self._data[:3]
+        return Vector(data)
+
+    def to_4d(self):
+        data = np.zeros(4)
+        data[:min(3, len(self))] = self._data[:3]
+        data[3] = 1.0 if len(self) < 4 else self._data[3]
+        return Vector(data)
+
+    def freeze(self):
+        return self
+
+
+class Matrix:
+    """
+    Square matrix of size 3 or 4
+    """
+
+    __slots__ = ('_data',)
+
+    def __init__(self, rows=None):
+        if rows is None:
+            self._data = np.identity(4)
+        else:
+            self._data = np.array([tuple(row) for row in rows], dtype=np.float64)
+
+    @classmethod
+    def Identity(cls, size):
+        return cls(np.identity(size))
+
+    @classmethod
+    def Translation(cls, vector):
+        matrix = cls.Identity(4)
+        matrix._data[:3, 3] = tuple(vector)[:3]
+        return matrix
+
+    @classmethod
+    def Scale(cls, factor, size, axis=None):
+        matrix = cls.Identity(size)
+        if axis is None:
+            matrix._data[:3, :3] *= factor
+        else:
+            axis = Vector(axis).normalized()._data
+            matrix._data[:3, :3] += (factor - 1.0) * np.outer(axis, axis)
+        return matrix
+
+    @classmethod
+    def Rotation(cls, angle, size, axis):
+        if isinstance(axis, str):
+            axis = {'X': (1.0, 0.0, 0.0), 'Y': (0.0, 1.0, 0.0), 'Z': (0.0, 0.0, 1.0)}[axis]
+        matrix = cls.Identity(size)
+        matrix._data[:3, :3] = rotation_matrix(axis, angle)
+        return matrix
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        return (Vector.view(row) for row in self._data)
+
+    def __getitem__(self, index):
+        return Vector.view(self._data[index])
+
+    def __array__(self, dtype=None, copy=None):
+        return np.array(self._data, dtype=dtype)
+
+    def __repr__(self):
+        return "Matrix(%s)" % self._data.tolist()
+
+    def __matmul__(self, other):
+        if isinstance(other, Matrix):
+            return Matrix(self._data @ other._data)
+        other = Vector(other)
+        if len(other) == 3 and len(self) == 4:
+            return Vector((self._data @ other.to_4d()._data)[:3])
+        return Vector(self._data @ other._data)
+
+    __mul__ = __matmul__
+
+    def __eq__(self, other):
+        return isinstance(other, Matrix) and np.array_equal(self._data, other._data)
+
+    __hash__ = None
+
+    @property
+    def translation(self):
+        return Vector.view(self._data[:3, 3])
+
+    @translation.setter
+    def translation(self, value):
+        self._data[:3, 3] = tuple(value)[:3]
+
+    @property
+    def col(self):
+        return [Vector.view(column) for column in self._data.T]
+
+    @property
+    def row(self):
+        return [Vector.view(row) for row in self._data]
+
+    def copy(self):
+        return Matrix(self._data)
+
+    def inverted(self):
+        return Matrix(np.linalg.inv(self._data))
+
+    def transposed(self):
+        return Matrix(self._data.T)
+
+    def to_3x3(self):
+        return Matrix(self._data[:3, :3])
+
+    def to_4x4(self):
+        matrix = Matrix.Identity(4)
+        matrix._data[:3, :3] = self._data[:3, :3]
+        if len(self) == 4:
+            matrix._data[:] = self._data
+        return matrix
+
+
+class Color:
+
+    def __init__(self, rgb=(0.0, 0.0, 0.0)):
+        self.r, self.g, self.b = rgb
+
+    def __iter__(self):
+        return iter((self.r, self.g, self.b))
+
+
+def rotation_matrix(axis, angle):
+    """
+    3x3 rotation of angle around axis
+    """
+
+    axis = np.asarray(tuple(axis)[:3], dtype=np.float64)
+    axis = axis / (np.linalg.norm(axis) or 1.0)
+    x, y, z = axis
+    c, s = math.cos(angle), math.sin(angle)
+    t = 1.0 - c
+
+    return np.array(((t * x * x + c, t * x * y - s * z, t * x * z + s * y),
+                     (t * x * y + s * z, t * y * y + c, t * y * z - s * x),
+                     (t * x * z - s * y, t * y * z + s * x, t * z * z + c)))
@@ -0,0 +1,345 @@
+#######################################################################################################################
+# Stand-in for the rigify 2.80 functions the rigs import from rigify.utils, rigify.rigs.widgets and limb_utils
+#######################################################################################################################
+
+import math
+import re
+
+from . import bpy
+from .mathutils import Vector
+
+ORG_PREFIX = "ORG-"
+MCH_PREFIX = "MCH-"
+DEF_PREFIX = "DEF-"
+WGT_PREFIX = "WGT-"
+
+WGT_COLLECTION = "Widgets"
+
+
+class MetarigError(Exception):
+    """
+    Exception raised for errors
+    """
+
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return repr(self.message)
+
+
+#######################################################################################################################
+# Names
+#######################################################################################################################
+
+
+def strip_org(name):
+    if name.startswith(ORG_PREFIX):
+        return name[len(ORG_PREFIX):]
+    return name
+
+
+def org(name):
+    return ORG_PREFIX + name
+
+
+def make_original_name(name):
+    return ORG_PREFIX + name
+
+
+def make_mechanism_name(name):
+    return MCH_PREFIX + name
+
+
+def make_deformer_name(name):
+    return DEF_PREFIX + name
+
+
+def get_bone_name(name, btype, suffix=''):
+    if btype == 'org':
+        name = org(name)
+    elif btype == 'mch':
+        name = make_mechanism_name(name)
+    elif btype == 'ctrl':
+        name = strip_org(name)
+    elif btype == 'def':
+        name = make_deformer_name(name)
+
+    if suffix:
+        results = re.match(r'^(\S+)(\.\S+)$', name)
+        if results:
+            bname, addition = results.groups()
+            name = bname + "_" + suffix + addition
+        else:
+            name = name + "_" + suffix
+
+    return name
+
+
+#######################################################################################################################
+# Bones
+#######################################################################################################################
+
+
+def _check_edit_mode(obj, message):
+    if obj != bpy.context.active_object or bpy.context.mode != 'EDIT_ARMATURE':
+        raise MetarigError(message)
+
+
+def copy_bone(obj, bone_name, assign_name=''):
+    if bone_name not in obj.data.bones:
+        raise MetarigError("copy_bone(): bone '%s' not found, cannot copy it" % bone_name)
+
+    _check_edit_mode(obj, "Cannot copy bones outside of edit mode")
+
+    if assign_name == '':
+        assign_name = bone_name
+
+    edit_bone_1 = obj.data.edit_bones[bone_name]
+    edit_bone_2 = obj.data.edit_bones.new(assign_name)
+    bone_name_1 = bone_name
+    bone_name_2 = edit_bone_2.name
+
+    edit_bone_2.parent = edit_bone_1.parent
+    edit_bone_2.use_connect = edit_bone_1.use_connect
+
+    edit_bone_2.layers = list(edit_bone_1.layers)
+    edit_bone_2.head = Vector(edit_bone_1.head)
+    edit_bone_2.tail = Vector(edit_bone_1.tail)
+    edit_bone_2.roll = edit_bone_1.roll
+
+    edit_bone_2.use_inherit_rotation = edit_bone_1.use_inherit_rotation
+    edit_bone_2.use_inherit_scale = edit_bone_1.use_inherit_scale
+    edit_bone_2.use_local_location = edit_bone_1.use_local_location
+
+    edit_bone_2.use_deform = edit_bone_1.use_deform
+    edit_bone_2.bbone_segments = edit_bone_1.bbone_segments
+    edit_bone_2.bbone_in = edit_bone_1.bbone_in
+    edit_bone_2.bbone_out = edit_bone_1.bbone_out
+
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+    pose_bone_1 = obj.pose.bones[bone_name_1]
+    pose_bone_2 = obj.pose.bones[bone_name_2]
+
+    pose_bone_2.rotation_mode = pose_bone_1.rotation_mode
+    pose_bone_2.rotation_axis_angle = tuple(pose_bone_1.rotation_axis_angle)
+    pose_bone_2.rotation_euler = tuple(pose_bone_1.rotation_euler)
+    pose_bone_2.rotation_quaternion = tuple(pose_bone_1.rotation_quaternion)
+
+    pose_bone_2.lock_location = tuple(pose_bone_1.lock_location)
+    pose_bone_2.lock_scale = tuple(pose_bone_1.lock_scale)
+    pose_bone_2.lock_rotation = tuple(pose_bone_1.lock_rotation)
+    pose_bone_2.lock_rotation_w = pose_bone_1.lock_rotation_w
+    pose_bone_2.lock_rotations_4d = pose_bone_1.lock_rotations_4d
+
+    bpy.ops.object.mode_set(mode='EDIT')
+
+    return bone_name_2
+
+
+def flip_bone(obj, bone_name):
+    if bone_name not in obj.data.bones:
+        raise MetarigError("flip_bone(): bone '%s' not found, cannot flip it" % bone_name)
+
+    _check_edit_mode(obj, "Cannot flip bones outside of edit mode")
+
+    bone = obj.data.edit_bones[bone_name]
+    head = Vector(bone.head)
+    tail = Vector(bone.tail)
+    bone.tail = head + tail
+    bone.head = tail
+    bone.tail = head
+
+
+def put_bone(obj, bone_name, pos):
+    if bone_name not in obj.data.edit_bones:
+        raise MetarigError("put_bone(): bone '%s' not found, cannot move it" % bone_name)
+
+    _check_edit_mode(obj, "Cannot 'put' bones outside of edit mode")
+
+    bone = obj.data.edit_bones[bone_name]
+    delta = pos - bone.head
+    bone.translate(delta)
+
+
+def _align_roll(bone_e, vec, axis):
+    # rolls bone_e until axis ('x' or 'z') is as close as possible to vec
+    dot = max(-1.0, min(1.0, getattr(bone_e, axis).dot(vec)))
+    angle = math.acos(dot)
+
+    bone_e.roll += angle
+    dot1 = getattr(bone_e, axis).dot(vec)
+    bone_e.roll -= angle * 2
+    dot2 = getattr(bone_e, axis).dot(vec)
+
+    if dot1 > dot2:
+        bone_e.roll += angle * 2
+
+
+def align_bone_x_axis(obj, bone, vec):
+    bone_e = obj.data.edit_bones[bone]
+
+    vec = vec.cross(bone_e.y_axis)
+    vec.normalize()
+    _align_roll(bone_e, vec, 'z_axis')
+
+
+def align_bone_z_axis(obj, bone, vec):
+    bone_e = obj.data.edit_bones[bone]
+
+    vec = bone_e.y_axis.cross(vec)
+    vec.normalize()
+    _align_roll(bone_e, vec, 'x_axis')
+
+
+def align_bone_y_axis(obj, bone, vec):
+    bone_e = obj.data.edit_bones[bone]
+    vec.normalize()
+
+    vec = vec * bone_e.length
+
+    bone_e.tail = bone_e.head + vec
+
+
+def connected_children_names(obj, bone_name):
+    names = []
+
+    bone = obj.data.bones[bone_name]
+    while True:
+        connects = 0
+        con_name = ""
+
+        for child in bone.children:
+            if child.use_connect:
+                connects += 1
+                con_name = child.name
+
+        if connects == 1:
+            names += [con_name]
+            bone = obj.data.bones[con_name]
+        else:
+            break
+
+    return names
+
+
+#######################################################################################################################
+# Widgets
+#######################################################################################################################
+
+
+def obj_to_bone(obj, rig, bone_name):
+    if bpy.context.mode == 'EDIT_ARMATURE':
+        raise MetarigError("obj_to_bone(): does not work while in edit mode")
+
+    bone = rig.data.bones[bone_name]
+
+    obj.location = Vector(bone.head)
+    obj.scale = Vector((bone.length,) * 3)
+
+
+def ensure_widget_collection(context):
+    collection = bpy.data.collections.get(WGT_COLLECTION)
+
+    if collection is None:
+        collection = bpy.data.collections.new(WGT_COLLECTION)
+        collection.hide_viewport = True
+        collection.hide_render = True
+
+    if collection not in [context.collection] + context.collection.children_recursive:
+        context.collection.children.link(collection)
+
+    return collection
+
+
+def create_widget(rig, bone_name, bone_transform_name=None):
+    obj_name = WGT_PREFIX + rig.name + '_' + bone_name
+    scene = bpy.context.scene
+    collection = ensure_widget_collection(bpy.context)
+
+    if obj_name in scene.objects:
+        obj = scene.objects[obj_name]
+        obj_to_bone(obj, rig, bone_transform_name or bone_name)
+        return None
+
+    if obj_name in bpy.data.objects:
+        bpy.data.objects[obj_name].user_clear()
+        bpy.data.objects.remove(bpy.data.objects[obj_name])
+
+    mesh = bpy.data.meshes.new(obj_name)
+    obj = bpy.data.objects.new(obj_name, mesh)
+    collection.objects.link(obj)
+
+    obj_to_bone(obj, rig, bone_transform_name or bone_name)
+
+    return obj
+
+
+def _circle(radius, segments=16, axis='y', offset=0.0):
+    verts = []
+    for i in range(segments):
+        a = 2.0 * math.pi * i / segments
+        u, v = radius * math.cos(a), radius * math.sin(a)
+        verts.append({'x': (offset, u, v), 'y': (u, offset, v), 'z': (u, v, offset)}[axis])
+    edges = [(i, (i + 1) % segments) for i in range(segments)]
+    return verts, edges
+
+
+def _shifted(shape, dx):
+    verts, edges = shape
+    return [(x + dx, y, z) for x, y, z in verts], edges
+
+
+def _make_widget(rig, bone_name, shapes, bone_transform_name=None):
+    obj = create_widget(rig, bone_name, bone_transform_name)
+    if obj is not None:
+        verts = []
+        edges = []
+        for shape_verts, shape_edges in shapes:
+            edges += [(a + len(verts), b + len(verts)) for a, b in shape_edges]
+            verts += shape_verts
+        obj.data.from_pydata(verts, edges, [])
+        obj.data.update()
+    return obj
+
+
+def create_circle_widget(rig, bone_name, radius=1.0, head_tail=0.0, with_line=False, bone_transform_name=None):
+    shapes = [_circle(radius, 32, 'y', head_tail)]
+    if with_line:
+        shapes.append(([(0.0, 0.0, 0.0), (0.0, 1.0, 0.0)], [(0, 1)]))
+    return _make_widget(rig, bone_name, shapes, bone_transform_name)
+
+
+def create_sphere_widget(rig, bone_name, bone_transform_name=None):
+    shapes = [_circle(0.5, 24, axis) for axis in 'xyz']
+    return _make_widget(rig, bone_name, shapes, bone_transform_name)
+
+
+def create_cube_widget(rig, bone_name, radius=0.5, bone_transform_name=None):
+    r = radius
+    verts = [(x, y, z) for x in (-r, r) for y in (-r, r) for z in (-r, r)]
+    edges = [(i, j) for i in range(8) for j in range(i + 1, 8) if bin(i ^ j).count('1') == 1]
+    return _make_widget(rig, bone_name, [(verts, edges)], bone_transform_name)
+
+
+def create_jaw_widget(rig, bone_name, size=1.0, bone_transform_name=None):
+    return _make_widget(rig, bone_name, [_circle(0.5 * size, 16, 'z', 0.5)], bone_transform_name)
+
+
+def create_eye_widget(rig, bone_name, size=1.0, bone_transform_name=None):
+    return _make_widget(rig, bone_name, [_circle(0.25 * size, 16, 'y')], bone_transform_name)
+
+
+def create_eyes_widget(rig, bone_name, size=1.0, bone_transform_name=None):
+    shapes = [_shifted(_circle(0.25 * size, 16, 'y'), dx) for dx in (-0.5 * size, 0.5 * size)]
+    return _make_widget(rig, bone_name, shapes, bone_transform_name)
+
+
+def create_gear_widget(rig, bone_name, size=1.0, bone_transform_name=None):
+    return _make_widget(rig, bone_name, [_circle(0.2 * size, 24, 'y')], bone_transform_name)
+
+
+def create_ballsocket_widget(rig, bone_name, size=1.0, bone_transform_name=None):
+    shapes = [_circle(0.3 * size, 16, axis) for axis in 'xyz']
+    return _make_widget(rig, bone_name, shapes, bone_transform_name)
@@ -0,0 +1,26 @@
+#######################################################################################################################
+# Stand-in for rna_prop_ui: property UI data stored in the '_RNA_UI' ID property
+#######################################################################################################################
+
+
+def rna_idprop_ui_get(item, create=True):
+    try:
+        return item['_RNA_UI']
+    except KeyError:
+        if create:
+            item['_RNA_UI'] = {}
+            return item['_RNA_UI']
+        return None
+
+
+def rna_idprop_ui_prop_get(item, prop, create=True):
+    rna_ui = rna_idprop_ui_get(item, create)
+
+    if rna_ui is None:
+        return None
+
+    try:
+        return rna_ui[prop]
+    except KeyError:
+        rna_ui[prop] = {}
+        return rna_ui[prop]
@@ -11,16 +11,15 @@ from rna_prop_ui import rna_idprop_ui_prop_get
 from rigify.utils import copy_bone, align_bone_z_axis, align_bone_y_axis
 from rigify.utils import strip_org, make_mechanism_name
 from rigify.utils import MetarigError
-from rigify.utils import create_cube_widget
 from rigify.utils import put_bone
 from rigify.rigs.widgets import create_jaw_widget
 from .meshy_rig import MeshyRig
 from .chainy_rig import ChainyRig
 from .base_rig import BaseRig
 from .control_layers_generator import ControlLayersGenerator
-from .utils import make_constraints_from_string
-from .widgets import create_widget_from_cluster
+from .widgets import create_widget_from_cluster, create_cube_widget
 from mathutils import Vector
+from .generation_context import requires_mode
 
 script = """
 all_controls   = [%s]
@@ -48,13 +47,9 @@ class Rig(ChainyRig):
         self.layer_generator = ControlLayersGenerator(self)
 
     def get_jaw(self):
-        bpy.ops.object.mode_set(mode='EDIT')
-        edit_bones = self.obj.data.edit_bones
-
         name = ""
-        for child in edit_bones[self.bones['org'][0]].children:
-            if child.use_connect:
-                name = child.name
+        for child in self.topology.get_connected_children(self.bones['org'][0]):
+            name = child
 
         return name
 
@@ -64,13 +59,9 @@ class Rig(ChainyRig):
         :return:
         """
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        edit_bones = self.obj.data.edit_bones
-
         lip_bones = []
-        for child in edit_bones[self.bones['org'][0]].children:
-            if not child.use_connect:
-                lip_bones.append(child.name)
+        for child in self.topology.get_unconnected_children(self.bones['org'][0]):
+            lip_bones.append(child)
 
         # Rule check
         if len(lip_bones) != 4:
@@ -78,7 +69,6 @@ class Rig(ChainyRig):
 
         mouth_bones_dict = {'top': [], 'corners': [], 'bottom': []}
 
-        bpy.ops.object.mode_set(mode='OBJECT')
         pose_bones = self.obj.pose.bones
 
         for b in lip_bones:
@@ -98,17 +88,17 @@ class Rig(ChainyRig):
 
         return mouth_bones_dict
 
+    @requires_mode('EDIT')
     def orient_org_bones(self):
 
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         if self.rotation_mode == 'automatic':
             alignment_axis = edit_bones[self.main_mch].tail - edit_bones[self.base_bone].head
             align_bone_z_axis(self.obj, self.main_mch, alignment_axis)
 
+    @requires_mode('EDIT')
     def create_mch(self):
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         main_bone_name = strip_org(self.bones['org'][0])
@@ -167,8 +157,8 @@ class Rig(ChainyRig):
         # create remaining subchain def-s
         super().create_def()
 
+    @requires_mode('EDIT')
     def create_controls(self):
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         self.bones['jaw_ctrl'] = dict()
@@ -217,43 +207,40 @@ class Rig(ChainyRig):
         :return:
         """
 
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pose_bones = self.obj.pose.bones
-
-        owner = pose_bones[self.bones['jaw_mch']['mouth_lock']]
+        owner = self.bones['jaw_mch']['mouth_lock']
         subtarget = self.bones['jaw_ctrl']['jaw']
-        make_constraints_from_string(owner, self.obj, subtarget, "CT0.2WW0.0")
+        self.constraint_plan.add(owner, subtarget, "CT0.2WW0.0")
 
         influences = [1.0, 0.45, 0.1]
         for i, j_m in enumerate(self.bones['jaw_mch']['jaw_masters']):
-            owner = pose_bones[j_m]
+            owner = j_m
             subtarget = self.bones['jaw_ctrl']['jaw']
             influence = influences[i]
-            make_constraints_from_string(owner, self.obj, subtarget, "CT%sWW0.0" % influence)
+            self.constraint_plan.add(owner, subtarget, "CT%sWW0.0" % influence)
             if j_m != self.bones['jaw_mch']['jaw_masters'][-1]:
-                owner = pose_bones[j_m]
+                owner = j_m
                 subtarget = self.bones['jaw_mch']['mouth_lock']
-                make_constraints_from_string(owner, self.obj, subtarget, "CT0.0WW0.0")
+                self.constraint_plan.add(owner, subtarget, "CT0.0WW0.0")
             # add limits on upper_lip jaw_master
             if j_m == self.bones['jaw_mch']['jaw_masters'][-2]:
-                make_constraints_from_string(owner, self.obj, "", "LLmY0mZ0#LRmX%fMX0" % (-3.14/2))
+                self.constraint_plan.add(owner, "", "LLmY0mZ0#LRmX%fMX0" % (-3.14/2))
 
         for bone in self.flatten(self.bones['mouth_mch']):
-            owner = pose_bones[bone]
+            owner = bone
             subtarget = self.bones['mouth_ctrl']['main']
-            make_constraints_from_string(owner, self.obj, subtarget, "CT1.0LL0.0")
+            self.constraint_plan.add(owner, subtarget, "CT1.0LL0.0")
 
         for bone in self.flatten(self.mouth_bones):
-            owner = pose_bones[bone]
+            owner = bone
             subtarget = strip_org(bone)
-            make_constraints_from_string(owner, self.obj, subtarget, "CT1.0WW0.0")
+            self.constraint_plan.add(owner, subtarget, "CT1.0WW0.0")
 
         # make the standard bendy rig constraints
         super().make_constraints()
 
+    @requires_mode('OBJECT')
     def make_drivers(self):
 
-        bpy.ops.object.mode_set(mode='OBJECT')
         pose_bones = self.obj.pose.bones
 
         # Add mouth_lock property on jaw_master
@@ -284,13 +271,13 @@ class Rig(ChainyRig):
 
         return [script % (controls_string, self.bones['jaw_ctrl']['jaw'], prop_name)]
 
+    @requires_mode('EDIT')
     def parent_bones(self):
         """
         Parent jaw bones
         :return:
         """
 
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         # Parenting to jaw MCHs
@@ -323,9 +310,9 @@ class Rig(ChainyRig):
 
         super().parent_bones()
 
+    @requires_mode('OBJECT')
     def create_widgets(self):
 
-        bpy.ops.object.mode_set(mode='OBJECT')
         pose_bones = self.obj.pose.bones
 
         top_main = self.bones['mouth_ctrl']['top'][0]
@@ -1,4 +1,13 @@
 import bpy
+import hashlib
+from functools import wraps
+
+from .constraint_plan import ConstraintPlan
+from .control_layers_generator import ControlLayersGenerator
+from .generation_context import GenerationContext
+from .profiler import GenerationProfiler
+from .utils import get_id_property_value
+from .widgets import collect_widgets
 
 
 class BaseRig(object):
@@ -17,20 +26,103 @@ class BaseRig(object):
         self.bones = dict()
         self.bones['org'] = [bone_name]
         self.base_bone = bone_name
+        self.topology = GenerationContext.get(obj).topology
 
         # Get all the recursive ORG children of the base bone BUT the rig_type trees
-        for edit_bone in self.obj.data.edit_bones[bone_name].children:
-            if self.obj.pose.bones[edit_bone.name].rigify_type != "":
+        for child in self.topology.get_children(bone_name):
+            if self.topology.get_rigify_type(child) != "":
                 continue
             else:
-                self.bones['org'].append(edit_bone.name)
-            for child in edit_bone.children_recursive:
-                self.bones['org'].append(child.name)
+                self.bones['org'].append(child)
+            self.bones['org'].extend(self.topology.get_descendants(child))
 
         self.bones['ctrl'] = dict()
         self.bones['mch'] = dict()
         self.bones['def'] = dict()
 
+        self.constraint_plan = ConstraintPlan(self.obj)
+
+        # the post-generation passes run once every rig of the generation is generated
+        self.generated = False
+        GenerationContext.get(obj).get_cache('rigs', list).append(self)
+        self.generate = self.track_generation(self.generate)
+
+        # no-op unless the RIGS_PROFILE or RIGS_INSTRUMENT environment variable is set
+        GenerationProfiler.instrument(self)
+
+    def track_generation(self, generate):
+        """
+        Returns generate marking the rig generated and ending the generation after the last rig
+        :param generate: the generate method of the rig
+        :return:
+        """
+
+        @wraps(generate)
+        def wrapper(*args, **kwargs):
+            scripts = generate(*args, **kwargs)
+            self.generated = True
+            self.end_generation(self.obj)
+            return scripts
+
+        return wrapper
+
+    @staticmethod
+    def end_generation(obj):
+        """
+        Runs the post-generation passes, once, when every rig of the generation is generated and every glue bone
+        glued: stale and duplicate widgets are collected
+        :param obj: the armature object
+        :return:
+        """
+
+        context = GenerationContext.get(obj)
+        rigs = context.get_cache('rigs', list)
+
+        if not context.post_generation or not all(rig.generated and getattr(rig, 'glued', True) for rig in rigs):
+            return
+
+        context.post_generation = False
+        stats = collect_widgets(obj)
+
+        profiler = GenerationProfiler.get(obj)
+        if profiler is not None:
+            profiler.stats['widgets'] = stats
+            profiler.write()
+
+    def get_input_hash(self):
+        """
+        Content hash of what the rig is generated from: name, parent, head, tail, roll and connect flag of every
+        ORG bone of the rig, rig type and rigify_parameters. Must be called before the rig is generated
+        :return:
+        :rtype: str
+        """
+
+        digest = hashlib.sha1()
+        digest.update((self.__class__.__module__.split('.')[-1] + '.' + self.__class__.__name__).encode())
+
+        pose_bones = self.obj.pose.bones
+
+        for name in self.bones['org']:
+            params = pose_bones[name].rigify_parameters
+            values = sorted((key, get_id_property_value(params[key])) for key in params.keys())
+            geometry = tuple(self.topology.get_head(name)) + tuple(self.topology.get_tail(name)) + \
+                (self.topology.get_roll(name),)
+            bone = (name, self.topology.get_parent(name), self.topology.is_connected(name),
+                    self.topology.get_rigify_type(name), ' '.join('%.5f' % v for v in geometry), values)
+            digest.update(repr(bone).encode())
+
+        return digest.hexdigest()
+
+    def get_dependencies(self):
+        """
+        Base bones of the other rigs this rig reads while generating, beyond its own ORG bones.
+        When one of them is regenerated this rig is regenerated too
+        :return:
+        :rtype: list(str)
+        """
+
+        return []
+
     def orient_org_bones(self):
         """
         This function re-orients org bones so that created bones are properly aligned and cns can work
@@ -53,6 +145,22 @@ class BaseRig(object):
     def make_constraints(self):
         pass
 
+    def apply_constraints(self):
+        """
+        Creates the constraints planned in self.constraint_plan by the previous passes
+        :return:
+        """
+
+        self.constraint_plan.flush()
+
+    def apply_layers(self):
+        """
+        Applies the layer assignments queued by the assign_layers pass
+        :return:
+        """
+
+        ControlLayersGenerator.apply_layers(self.obj)
+
     def parent_bones(self):
         pass
 
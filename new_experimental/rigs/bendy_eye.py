@@ -8,15 +8,14 @@ from mathutils import Vector
 from rna_prop_ui import rna_idprop_ui_prop_get
 from rigify.utils import copy_bone, put_bone
 from rigify.utils import org, strip_org, make_deformer_name, make_mechanism_name
-from rigify.utils import create_circle_widget, create_cube_widget
 from rigify.utils import MetarigError
 from rigify.utils import align_bone_y_axis, align_bone_z_axis
 from rigify.rigs.widgets import create_eye_widget, create_eyes_widget, create_gear_widget
 from .meshy_rig import MeshyRig
 from .control_snapper import ControlSnapper
 from .control_layers_generator import ControlLayersGenerator
-from .utils import make_constraints_from_string
-from .widgets import create_widget_from_cluster
+from .widgets import create_widget_from_cluster, create_circle_widget, create_cube_widget
+from .generation_context import requires_mode
 
 script = """
 all_controls   = [%s]
@@ -49,13 +48,9 @@ class Rig(MeshyRig):
         :return:
         """
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        edit_bones = self.obj.data.edit_bones
-
         lid_bones = []
-        for child in edit_bones[self.bones['org'][0]].children:
-            if not child.use_connect:
-                lid_bones.append(child.name)
+        for child in self.topology.get_unconnected_children(self.bones['org'][0]):
+            lid_bones.append(child)
 
         # Rule check
         if len(lid_bones) != 2:
@@ -69,7 +64,7 @@ class Rig(MeshyRig):
             if len(self.get_chain_bones(lid)) != self.lid_len:
                 raise MetarigError("All lid chains must be the same length")
 
-        if edit_bones[lid_bones[0]].tail.z < edit_bones[lid_bones[1]].tail.z:
+        if self.topology.get_tail(lid_bones[0]).z < self.topology.get_tail(lid_bones[1]).z:
             eyelids_bones_dict['top'].append(lid_bones[1])
             eyelids_bones_dict['bottom'].append(lid_bones[0])
         else:
@@ -91,7 +86,6 @@ class Rig(MeshyRig):
         if not self.params.paired_eye:
             return ''
 
-        bpy.ops.object.mode_set(mode='OBJECT')
         pose_bones = self.obj.pose.bones
 
         paired_eye = org(self.params.paired_eye)
@@ -137,7 +131,6 @@ class Rig(MeshyRig):
         return [target, master]
 
     def get_driver_condition(self):
-        bpy.ops.object.mode_set(mode='OBJECT')
         pose_bones = self.obj.pose.bones
 
         has_parent = bool(pose_bones[self.base_bone].parent)
@@ -153,6 +146,26 @@ class Rig(MeshyRig):
 
         return condition
 
+    def get_dependencies(self):
+        """
+        The paired eye and, for a clustered eye, all the eyes sharing its parent: they share ctrls and mechanism
+        :return:
+        """
+
+        dependencies = super().get_dependencies()
+        pose_bones = self.obj.pose.bones
+
+        if self.params.paired_eye and org(self.params.paired_eye) in pose_bones:
+            dependencies.append(org(self.params.paired_eye))
+
+        if self.is_clustered():
+            parent = pose_bones[self.base_bone].parent
+            for pb in pose_bones:
+                if pb.rigify_type == 'bendy_eye' and pb.parent == parent and pb.name != self.base_bone:
+                    dependencies.append(pb.name)
+
+        return dependencies
+
     def is_clustered(self):
         """
         True if is a clustered eye
@@ -228,9 +241,9 @@ class Rig(MeshyRig):
 
         return [position, y_direction, z_direction]
 
+    @requires_mode('EDIT')
     def create_mch(self):
 
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         self.bones['eye_mch'] = dict()
@@ -282,9 +295,9 @@ class Rig(MeshyRig):
 
         super().create_mch()
 
+    @requires_mode('EDIT')
     def create_def(self):
 
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         self.bones['eye_def'] = dict()
@@ -296,9 +309,9 @@ class Rig(MeshyRig):
 
         super().create_def()
 
+    @requires_mode('EDIT')
     def create_controls(self):
 
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         self.bones['eye_ctrl'] = dict()
@@ -388,13 +401,13 @@ class Rig(MeshyRig):
         for ctrl in self.bones['ctrl'][bottom_chain]:
             align_bone_y_axis(self.obj, ctrl, axis)
 
+    @requires_mode('EDIT')
     def parent_bones(self):
         """
         Parent eye bones
         :return:
         """
 
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         master_ctrl = self.bones['eye_ctrl']['master_eye']
@@ -481,6 +494,7 @@ class Rig(MeshyRig):
         all_ctrls = self.get_all_ctrls()
         self.layer_generator.assign_layer(primary_ctrls, all_ctrls)
 
+    @requires_mode('OBJECT')
     def make_constraints(self):
 
         """
@@ -488,45 +502,45 @@ class Rig(MeshyRig):
         :return:
         """
 
-        bpy.ops.object.mode_set(mode='OBJECT')
         pose_bones = self.obj.pose.bones
 
         tip = self.bones['eye_mch']['eye_master_tip']
-        owner = pose_bones[tip]
+        owner = tip
         subtarget = self.bones['eye_mch']['eye_master']
-        make_constraints_from_string(owner, self.obj, subtarget, 'CL1.0WW1.0')
+        self.constraint_plan.add(owner, subtarget, 'CL1.0WW1.0')
 
         for i, e_m in enumerate(self.bones['eye_mch']['eyelid_top']):
-            owner = pose_bones[e_m]
+            owner = e_m
             subtarget = self.get_ctrl_by_index(strip_org(self.lid_bones['top'][0]), i+1)
-            make_constraints_from_string(owner, self.obj, subtarget, "DT1.0Y0.0")
+            self.constraint_plan.add(owner, subtarget, "DT1.0Y0.0")
 
         for i, e_m in enumerate(self.bones['eye_mch']['eyelid_bottom']):
-            owner = pose_bones[e_m]
+            owner = e_m
             subtarget = self.get_ctrl_by_index(strip_org(self.lid_bones['bottom'][0]), i+1)
-            make_constraints_from_string(owner, self.obj, subtarget, "DT1.0Y0.0")
+            self.constraint_plan.add(owner, subtarget, "DT1.0Y0.0")
 
-        eye_mch_name = pose_bones[self.bones['eye_mch']['eye_master']]
+        eye_mch_name = self.bones['eye_mch']['eye_master']
         subtarget = self.bones['eye_ctrl']['eye_target']
-        make_constraints_from_string(eye_mch_name, self.obj, subtarget, "DT1.0Y0.0")
+        self.constraint_plan.add(eye_mch_name, subtarget, "DT1.0Y0.0")
 
         # eye_follow cns
         if 'eyefollow' in self.bones['eye_mch']:
-            owner = pose_bones[self.bones['eye_mch']['eyefollow']]
+            owner = self.bones['eye_mch']['eyefollow']
             subtarget = pose_bones[self.base_bone].parent.name
-            if not owner.constraints:   # this is important in paired eyes not to have repeated cns
-                make_constraints_from_string(owner, self.obj, subtarget, "CT1.0WW0.0")
+            # this is important in paired eyes not to have repeated cns
+            if not pose_bones[owner].constraints and not self.constraint_plan.has(owner):
+                self.constraint_plan.add(owner, subtarget, "CT1.0WW0.0")
 
         if self.lid_len % 2 == 0:
             i = int(self.lid_len/2)
             central_ctrl_top = self.get_ctrl_by_index(strip_org(self.lid_bones['top'][0]), i)
-            owner = pose_bones[central_ctrl_top]
+            owner = central_ctrl_top
             subtarget = tip
-            make_constraints_from_string(owner, self.obj, subtarget, "CL0.5LLO0.0")
+            self.constraint_plan.add(owner, subtarget, "CL0.5LLO0.0")
             central_ctrl_bottom = self.get_ctrl_by_index(strip_org(self.lid_bones['bottom'][0]), i)
-            owner = pose_bones[central_ctrl_bottom]
+            owner = central_ctrl_bottom
             subtarget = tip
-            make_constraints_from_string(owner, self.obj, subtarget, "CL0.5LLO0.0")
+            self.constraint_plan.add(owner, subtarget, "CL0.5LLO0.0")
             influence = 0.6
             j = 1
             while True:
@@ -534,22 +548,22 @@ class Rig(MeshyRig):
                     break
 
                 ctrl_top_1 = self.get_ctrl_by_index(strip_org(self.lid_bones['top'][0]), i+j)
-                owner = pose_bones[ctrl_top_1]
+                owner = ctrl_top_1
                 subtarget = central_ctrl_top
-                make_constraints_from_string(owner, self.obj, subtarget, "CL%sLL0.0" % influence)
+                self.constraint_plan.add(owner, subtarget, "CL%sLL0.0" % influence)
                 ctrl_top_2 = self.get_ctrl_by_index(strip_org(self.lid_bones['top'][0]), i-j)
-                owner = pose_bones[ctrl_top_2]
+                owner = ctrl_top_2
                 subtarget = central_ctrl_top
-                make_constraints_from_string(owner, self.obj, subtarget, "CL%sLL0.0" % influence)
+                self.constraint_plan.add(owner, subtarget, "CL%sLL0.0" % influence)
 
                 ctrl_bottom_1 = self.get_ctrl_by_index(strip_org(self.lid_bones['bottom'][0]), i+j)
-                owner = pose_bones[ctrl_bottom_1]
+                owner = ctrl_bottom_1
                 subtarget = central_ctrl_bottom
-                make_constraints_from_string(owner, self.obj, subtarget, "CL%sLL0.0" % influence)
+                self.constraint_plan.add(owner, subtarget, "CL%sLL0.0" % influence)
                 ctrl_bottom_2 = self.get_ctrl_by_index(strip_org(self.lid_bones['bottom'][0]), i-j)
-                owner = pose_bones[ctrl_bottom_2]
+                owner = ctrl_bottom_2
                 subtarget = central_ctrl_bottom
-                make_constraints_from_string(owner, self.obj, subtarget, "CL%sLL0.0" % influence)
+                self.constraint_plan.add(owner, subtarget, "CL%sLL0.0" % influence)
 
                 influence -= 0.1
                 j += 1
@@ -557,14 +571,14 @@ class Rig(MeshyRig):
         else:
 
             top_lid_master = self.bones['eye_ctrl']['top_lid_master']
-            owner = pose_bones[top_lid_master]
+            owner = top_lid_master
             subtarget = tip
-            make_constraints_from_string(owner, self.obj, subtarget, "CL0.5LLO0.0")
+            self.constraint_plan.add(owner, subtarget, "CL0.5LLO0.0")
 
             bottom_lid_master = self.bones['eye_ctrl']['bottom_lid_master']
-            owner = pose_bones[bottom_lid_master]
+            owner = bottom_lid_master
             subtarget = tip
-            make_constraints_from_string(owner, self.obj, subtarget, "CL0.5LLO0.0")
+            self.constraint_plan.add(owner, subtarget, "CL0.5LLO0.0")
 
             influence = 0.6
             i = int((self.lid_len + 1)/2)
@@ -575,29 +589,29 @@ class Rig(MeshyRig):
                     break
 
                 ctrl_top_1 = self.get_ctrl_by_index(strip_org(self.lid_bones['top'][0]), i + j)
-                owner = pose_bones[ctrl_top_1]
+                owner = ctrl_top_1
                 subtarget = top_lid_master
-                make_constraints_from_string(owner, self.obj, subtarget, "CL%sLL0.0" % influence)
+                self.constraint_plan.add(owner, subtarget, "CL%sLL0.0" % influence)
                 ctrl_top_2 = self.get_ctrl_by_index(strip_org(self.lid_bones['top'][0]), i - 1 - j)
-                owner = pose_bones[ctrl_top_2]
-                make_constraints_from_string(owner, self.obj, subtarget, "CL%sLL0.0" % influence)
+                owner = ctrl_top_2
+                self.constraint_plan.add(owner, subtarget, "CL%sLL0.0" % influence)
 
                 ctrl_bottom_1 = self.get_ctrl_by_index(strip_org(self.lid_bones['bottom'][0]), i + j)
-                owner = pose_bones[ctrl_bottom_1]
+                owner = ctrl_bottom_1
                 subtarget = bottom_lid_master
-                make_constraints_from_string(owner, self.obj, subtarget, "CL%sLL0.0" % influence)
+                self.constraint_plan.add(owner, subtarget, "CL%sLL0.0" % influence)
                 ctrl_bottom_2 = self.get_ctrl_by_index(strip_org(self.lid_bones['bottom'][0]), i - 1 - j)
-                owner = pose_bones[ctrl_bottom_2]
-                make_constraints_from_string(owner, self.obj, subtarget, "CL%sLL0.0" % influence)
+                owner = ctrl_bottom_2
+                self.constraint_plan.add(owner, subtarget, "CL%sLL0.0" % influence)
 
                 influence -= 0.1
                 j += 1
 
         if 'eyeball_def' in self.bones['eye_def']:
-            owner = pose_bones[self.bones['eye_def']['eyeball_def']]
+            owner = self.bones['eye_def']['eyeball_def']
             target = self.obj
             subtarget = self.bones['eye_mch']['eye_master']
-            make_constraints_from_string(owner, target, subtarget, "CT1.0")
+            self.constraint_plan.add(owner, subtarget, "CT1.0", target=target)
 
         # make the standard chainy rig constraints
         super().make_constraints()
@@ -606,25 +620,19 @@ class Rig(MeshyRig):
         top_lid_chain = strip_org(self.lid_bones['top'][0])
 
         for i, lid_def in enumerate(self.bones['def'][top_lid_chain]):
-            for cns in pose_bones[lid_def].constraints:
-                if cns.type != "DAMPED_TRACK" and cns.type != "STRETCH_TO":
-                    pose_bones[lid_def].constraints.remove(cns)
-                else:
-                    cns.subtarget = self.bones['eye_mch']['eyelid_top'][i]
-                    cns.head_tail = 1.0
+            self.constraint_plan.remove(lid_def, 'chain', 'COPY_TRANSFORMS')
+            self.constraint_plan.override(lid_def, 'chain', subtarget=self.bones['eye_mch']['eyelid_top'][i],
+                                          head_tail=1.0)
 
         bottom_lid_chain = strip_org(self.lid_bones['bottom'][0])
 
         for i, lid_def in enumerate(self.bones['def'][bottom_lid_chain]):
-            for cns in pose_bones[lid_def].constraints:
-                if cns.type != "DAMPED_TRACK" and cns.type != "STRETCH_TO":
-                    pose_bones[lid_def].constraints.remove(cns)
-                else:
-                    cns.subtarget = self.bones['eye_mch']['eyelid_bottom'][i]
-                    cns.head_tail = 1.0
+            self.constraint_plan.remove(lid_def, 'chain', 'COPY_TRANSFORMS')
+            self.constraint_plan.override(lid_def, 'chain', subtarget=self.bones['eye_mch']['eyelid_bottom'][i],
+                                          head_tail=1.0)
 
+    @requires_mode('OBJECT')
     def make_drivers(self):
-        bpy.ops.object.mode_set(mode='OBJECT')
         pose_bones = self.obj.pose.bones
 
         eye_target = self.bones['eye_ctrl']['eye_target']
@@ -731,10 +739,9 @@ class Rig(MeshyRig):
 
         return [script % (default_controls_string, eye_target, prop_lid_follow_name)]
 
+    @requires_mode('OBJECT')
     def create_widgets(self):
 
-        bpy.ops.object.mode_set(mode='OBJECT')
-
         # master_eye
         eye_ctrl = self.bones['eye_ctrl']['master_eye']
         create_circle_widget(self.obj, eye_ctrl, head_tail=1.0)
@@ -768,9 +775,9 @@ class Rig(MeshyRig):
 
         super().create_widgets()
 
+    @requires_mode('EDIT')
     def cleanup(self):
 
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         # cleanup
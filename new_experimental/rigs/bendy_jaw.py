@@ -11,12 +11,12 @@ from rna_prop_ui import rna_idprop_ui_prop_get
 from rigify.utils import copy_bone, align_bone_z_axis, align_bone_y_axis
 from rigify.utils import strip_org, make_mechanism_name
 from rigify.utils import MetarigError
-from rigify.utils import create_cube_widget
 from rigify.rigs.widgets import create_jaw_widget
 from .meshy_rig import MeshyRig
 from .control_layers_generator import ControlLayersGenerator
-from .utils import make_constraints_from_string
+from .widgets import create_cube_widget
 from mathutils import Vector
+from .generation_context import requires_mode
 
 script = """
 all_controls   = [%s]
@@ -46,13 +46,9 @@ class Rig(MeshyRig):
         :return:
         """
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        edit_bones = self.obj.data.edit_bones
-
         name = ""
-        for child in edit_bones[self.bones['org'][0]].children:
-            if child.use_connect:
-                name = child.name
+        for child in self.topology.get_connected_children(self.bones['org'][0]):
+            name = child
 
         return name
 
@@ -62,13 +58,9 @@ class Rig(MeshyRig):
         :return:
         """
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        edit_bones = self.obj.data.edit_bones
-
         lip_bones = []
-        for child in edit_bones[self.bones['org'][0]].children:
-            if not child.use_connect:
-                lip_bones.append(child.name)
+        for child in self.topology.get_unconnected_children(self.bones['org'][0]):
+            lip_bones.append(child)
 
         # Rule check
         if len(lip_bones) != 4:
@@ -82,16 +74,16 @@ class Rig(MeshyRig):
             if len(self.get_chain_bones(lip)) != self.lip_len:
                 raise MetarigError("All lip chains must be the same length")
 
-        m_b_head_positions = [edit_bones[name].head for name in lip_bones]
+        m_b_head_positions = [self.topology.get_head(name) for name in lip_bones]
         head_sum = m_b_head_positions[0]
         for h in m_b_head_positions[1:]:
             head_sum = head_sum + h
         mouth_center = head_sum / 4
 
-        chin_tail_position = edit_bones[self.main_mch].tail
+        chin_tail_position = self.topology.get_tail(self.main_mch)
         mouth_chin_distance = (mouth_center - chin_tail_position).magnitude
         for m_b in lip_bones:
-            head = edit_bones[m_b].head
+            head = self.topology.get_head(m_b)
             if (head - chin_tail_position).magnitude < mouth_chin_distance:
                 mouth_bones_dict['bottom'].append(m_b)
             elif (head - chin_tail_position).magnitude > mouth_chin_distance:
@@ -102,17 +94,17 @@ class Rig(MeshyRig):
 
         return mouth_bones_dict
 
+    @requires_mode('EDIT')
     def orient_org_bones(self):
 
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         if self.rotation_mode == 'automatic':
             alignment_axis = edit_bones[self.main_mch].tail - edit_bones[self.base_bone].head
             align_bone_z_axis(self.obj, self.main_mch, alignment_axis)
 
+    @requires_mode('EDIT')
     def create_mch(self):
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         main_bone_name = strip_org(self.bones['org'][0])
@@ -141,8 +133,8 @@ class Rig(MeshyRig):
         # create remaining subchain def-s
         super().create_def()
 
+    @requires_mode('EDIT')
     def create_controls(self):
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         self.bones['jaw_ctrl'] = dict()
@@ -160,32 +152,32 @@ class Rig(MeshyRig):
         for ctrl in ctrls:
             align_bone_y_axis(self.obj, ctrl, Vector((0, 0, 1)))
 
+    @requires_mode('OBJECT')
     def make_constraints(self):
         """
         Make constraints
         :return:
         """
 
-        bpy.ops.object.mode_set(mode='OBJECT')
         pose_bones = self.obj.pose.bones
 
-        owner = pose_bones[self.bones['jaw_mch']['mouth_lock']]
+        owner = self.bones['jaw_mch']['mouth_lock']
         subtarget = self.bones['jaw_ctrl']['jaw']
-        make_constraints_from_string(owner, self.obj, subtarget, "CT0.2WW0.0")
+        self.constraint_plan.add(owner, subtarget, "CT0.2WW0.0")
 
         influence_div = 1/len(self.bones['jaw_mch']['jaw_masters'])
         for i, j_m in enumerate(self.bones['jaw_mch']['jaw_masters']):
-            owner = pose_bones[j_m]
+            owner = j_m
             subtarget = self.bones['jaw_ctrl']['jaw']
             influence = 1 - i * influence_div
-            make_constraints_from_string(owner, self.obj, subtarget, "CT%sWW0.0" % influence)
+            self.constraint_plan.add(owner, subtarget, "CT%sWW0.0" % influence)
             if j_m != self.bones['jaw_mch']['jaw_masters'][-1]:
-                owner = pose_bones[j_m]
+                owner = j_m
                 subtarget = self.bones['jaw_mch']['mouth_lock']
-                make_constraints_from_string(owner, self.obj, subtarget, "CT0.0WW0.0")
+                self.constraint_plan.add(owner, subtarget, "CT0.0WW0.0")
             # add limits on upper_lip jaw_master
             if j_m == self.bones['jaw_mch']['jaw_masters'][-2]:
-                make_constraints_from_string(owner, self.obj, "", "LLmY0mZ0#LRmX0MX%f" % (3.14/2))
+                self.constraint_plan.add(owner, "", "LLmY0mZ0#LRmX0MX%f" % (3.14/2))
 
         lip_bones = []
         lip_bones.extend(self.mouth_bones['top'])
@@ -200,22 +192,22 @@ class Rig(MeshyRig):
                 influence_share.append(total_len)
             influence_share = [val / total_len for val in influence_share]
             for i, ctrl in enumerate(self.bones['ctrl'][lip_bone][1:-1]):
-                owner = pose_bones[self.bones['ctrl'][lip_bone][i+1]]
+                owner = self.bones['ctrl'][lip_bone][i+1]
                 subtarget = self.bones['ctrl'][lip_bone][-1]
                 infl = influence_share[i]
-                make_constraints_from_string(owner, self.obj, subtarget, "CL%sLLO0.0" % infl)
+                self.constraint_plan.add(owner, subtarget, "CL%sLLO0.0" % infl)
                 subtarget = self.bones['ctrl'][lip_bone][0]
                 infl = 1 - influence_share[i]
-                make_constraints_from_string(owner, self.obj, subtarget, "CL%sLLO0.0" % infl)
-                make_constraints_from_string(owner, self.obj, subtarget, "CR1.0LLO0.0")
-                make_constraints_from_string(owner, self.obj, subtarget, "CS1.0LLO0.0")
+                self.constraint_plan.add(owner, subtarget, "CL%sLLO0.0" % infl)
+                self.constraint_plan.add(owner, subtarget, "CR1.0LLO0.0")
+                self.constraint_plan.add(owner, subtarget, "CS1.0LLO0.0")
 
         # make the standard bendy rig constraints
         super().make_constraints()
 
+    @requires_mode('OBJECT')
     def make_drivers(self):
 
-        bpy.ops.object.mode_set(mode='OBJECT')
         pose_bones = self.obj.pose.bones
 
         # Add mouth_lock property on jaw_master
@@ -246,13 +238,13 @@ class Rig(MeshyRig):
 
         return [script % (controls_string, self.bones['jaw_ctrl']['jaw'], prop_name)]
 
+    @requires_mode('EDIT')
     def parent_bones(self):
         """
         Parent jaw bones
         :return:
         """
 
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         # Parenting to jaw MCHs
@@ -10,6 +10,7 @@ from .widgets import create_widget_from_cluster
 from .meshy_rig import MeshyRig
 from .chain import Chain
 from .utils import adjust_widget
+from .generation_context import requires_mode
 
 class Rig(MeshyRig):
 
@@ -20,8 +21,8 @@ class Rig(MeshyRig):
         self.nostril_bones = self.get_nostrils()
         self.add_front_nose_chain()
 
+    @requires_mode('EDIT')
     def create_controls(self):
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         super().create_controls()
@@ -35,9 +36,9 @@ class Rig(MeshyRig):
         last_bone = self.get_chain_bones(self.base_bone)[-1]
         edit_bones[nose_master_name].tail = edit_bones[last_bone].tail
 
+    @requires_mode('OBJECT')
     def create_widgets(self):
 
-        bpy.ops.object.mode_set(mode='OBJECT')
         pose_bones = self.obj.pose.bones
         last_bone = self.get_chain_object_by_name(self.base_bone).get_chain_bone_by_index(index=-1)
         print(last_bone)
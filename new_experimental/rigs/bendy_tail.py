@@ -4,10 +4,10 @@ from .chainy_rig import ChainyRig
 from .control_layers_generator import ControlLayersGenerator
 from rigify.utils import make_mechanism_name
 from rigify.utils import flip_bone, org, strip_org, copy_bone, put_bone, align_bone_y_axis
-from rigify.utils import create_sphere_widget, create_circle_widget
 from rigify.rigs.widgets import create_ballsocket_widget
+from .widgets import create_sphere_widget, create_circle_widget
 
-from .utils import make_constraints_from_string
+from .generation_context import requires_mode
 
 
 class Rig(ChainyRig):
@@ -19,9 +19,9 @@ class Rig(ChainyRig):
 
         self.layer_generator = ControlLayersGenerator(self)
 
+    @requires_mode('EDIT')
     def create_mch(self):
 
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         super().create_mch()
@@ -53,9 +53,9 @@ class Rig(ChainyRig):
 
         self.bones['def'][chain].reverse()
 
+    @requires_mode('EDIT')
     def create_controls(self):
 
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         super().create_controls()
@@ -90,9 +90,9 @@ class Rig(ChainyRig):
         self.bones['tail_ctrl']['tail_master'] = tail_master
         ctrl_chain[-1] = tail_master
 
+    @requires_mode('EDIT')
     def parent_bones(self):
 
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         super().parent_bones()
@@ -132,9 +132,9 @@ class Rig(ChainyRig):
         tweaks = self.flatten(self.bones['tweaks'])
         self.layer_generator.assign_tweak_layers(tweaks)
 
+    @requires_mode('OBJECT')
     def make_constraints(self):
 
-        bpy.ops.object.mode_set(mode='OBJECT')
         pose_bones = self.obj.pose.bones
 
         super().make_constraints()
@@ -144,29 +144,29 @@ class Rig(ChainyRig):
         ctrl_chain = self.bones['ctrl'][strip_org(self.base_bone)]
 
         for i, def_bone in enumerate(def_chain):
-            pose_bones[def_bone].constraints[0].subtarget = tweak_chain[-i-1]
-            pose_bones[def_bone].constraints[1].subtarget = tweak_chain[-i-2]
-            pose_bones[def_bone].constraints[2].subtarget = tweak_chain[-i-2]
+            self.constraint_plan.override(def_bone, 'chain', 'COPY_TRANSFORMS', subtarget=tweak_chain[-i-1])
+            self.constraint_plan.override(def_bone, 'chain', 'DAMPED_TRACK', subtarget=tweak_chain[-i-2])
+            self.constraint_plan.override(def_bone, 'chain', 'STRETCH_TO', subtarget=tweak_chain[-i-2])
 
         for i, ctrl in enumerate(ctrl_chain):
             if ctrl != ctrl_chain[-1]:
-                owner = pose_bones[ctrl]
+                owner = ctrl
                 if i == 0:
                     subtarget = ctrl_chain[-1]
                 else:
                     subtarget = ctrl_chain[i-1]
-                make_constraints_from_string(owner, self.obj, subtarget, "CR1.0LLO")
-                owner.constraints[-1].use_y = False
+                self.constraint_plan.add(owner, subtarget, "CR1.0LLO", key='tail_rotation')
+                self.constraint_plan.override(owner, 'tail_rotation', use_y=False)
 
         first_org = self.get_chain_bones(self.base_bone)[0]
         if pose_bones[first_org].parent:
-            owner = pose_bones[self.bones['tail_mch']['rot_tail_mch']]
+            owner = self.bones['tail_mch']['rot_tail_mch']
             subtarget = pose_bones[first_org].parent.name
-            make_constraints_from_string(owner, self.obj, subtarget, "CR1.0WW")
+            self.constraint_plan.add(owner, subtarget, "CR1.0WW")
 
+    @requires_mode('OBJECT')
     def create_widgets(self):
 
-        bpy.ops.object.mode_set(mode='OBJECT')
         pose_bones = self.obj.pose.bones
 
         ctrl_chain = self.bones['ctrl'][strip_org(self.base_bone)]
@@ -184,9 +184,9 @@ class Rig(ChainyRig):
 
         super().create_widgets()
 
+    @requires_mode('EDIT')
     def cleanup(self):
 
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         for mch in self.bones['mch'][strip_org(self.base_bone)]:
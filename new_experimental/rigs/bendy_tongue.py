@@ -5,7 +5,7 @@ from .control_layers_generator import ControlLayersGenerator
 from rigify.utils import flip_bone, org, strip_org, copy_bone, put_bone, align_bone_y_axis
 from rigify.rigs.widgets import create_ballsocket_widget, create_jaw_widget
 
-from .utils import make_constraints_from_string
+from .generation_context import requires_mode
 
 
 class Rig(ChainyRig):
@@ -18,8 +18,8 @@ class Rig(ChainyRig):
 
         self.layer_generator = ControlLayersGenerator(self)
 
+    @requires_mode('EDIT')
     def create_mch(self):
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         super().create_mch()
@@ -37,8 +37,8 @@ class Rig(ChainyRig):
                 edit_bones[mch].tail = edit_bones[self.base_bone].head
                 self.bones['tongue_mch']['tongue_tip'].append(mch)
 
+    @requires_mode('EDIT')
     def create_controls(self):
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         super().create_controls()
@@ -50,8 +50,8 @@ class Rig(ChainyRig):
         flip_bone(self.obj, tongue_master_name)
         self.bones['tongue_ctrl']['tongue_master'] = tongue_master_name
 
+    @requires_mode('EDIT')
     def parent_bones(self):
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         super().parent_bones()
@@ -87,34 +87,30 @@ class Rig(ChainyRig):
 
     def make_constraints(self):
 
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pose_bones = self.obj.pose.bones
-
         super().make_constraints()
 
         for def_bone in self.bones['def'][strip_org(self.base_bone)]:
-            pose_bones[def_bone].constraints.remove(pose_bones[def_bone].constraints[0])
+            self.constraint_plan.remove(def_bone, 'chain', 'COPY_TRANSFORMS')
 
         influence_step = 1 / len(self.bones['org'])
         influence = influence_step
 
         for mch in reversed(self.bones['tongue_mch']['tongue_tip']):
-            owner = pose_bones[mch]
+            owner = mch
             subtarget = self.bones['tongue_ctrl']['tongue_master']
-            make_constraints_from_string(owner, self.obj, subtarget, "CT%sWW0.0" % influence)
+            self.constraint_plan.add(owner, subtarget, "CT%sWW0.0" % influence)
             influence += influence_step
 
+    @requires_mode('OBJECT')
     def create_widgets(self):
 
-        bpy.ops.object.mode_set(mode='OBJECT')
-
         tongue_master = self.bones['tongue_ctrl']['tongue_master']
         create_jaw_widget(self.obj, tongue_master)
 
         super().create_widgets()
 
+    @requires_mode('EDIT')
     def cleanup(self):
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         for mch in self.bones['mch'][strip_org(self.base_bone)]:
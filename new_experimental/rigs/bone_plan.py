@@ -0,0 +1,267 @@
+import bpy
+import numpy as np
+
+from .generation_context import set_mode
+
+# edit bone attributes copied from the source bone, as rigify copy_bone does: (name, dtype, values per bone)
+EDIT_ATTRIBUTES = [(name, dtype, size) for name, dtype, size in [('head', np.float32, 3),
+                                                                 ('tail', np.float32, 3),
+                                                                 ('roll', np.float32, 1),
+                                                                 ('layers', bool, 32),
+                                                                 ('use_inherit_rotation', bool, 1),
+                                                                 ('use_inherit_scale', bool, 1),
+                                                                 ('use_local_location', bool, 1),
+                                                                 ('use_deform', bool, 1),
+                                                                 ('bbone_segments', np.int32, 1),
+                                                                 ('bbone_in', np.float32, 1),
+                                                                 ('bbone_out', np.float32, 1),
+                                                                 ('bbone_x', np.float32, 1),
+                                                                 ('bbone_z', np.float32, 1)]
+                   if name in bpy.types.EditBone.bl_rna.properties]
+
+# pose bone attributes copied from the source bone and the value a new pose bone already has
+POSE_DEFAULTS = {'rotation_mode': 'QUATERNION',
+                 'rotation_quaternion': (1.0, 0.0, 0.0, 0.0),
+                 'rotation_euler': (0.0, 0.0, 0.0),
+                 'rotation_axis_angle': (0.0, 0.0, 1.0, 0.0),
+                 'lock_rotation_w': False,
+                 'lock_rotations_4d': False,
+                 'lock_rotation': (False, False, False),
+                 'lock_location': (False, False, False),
+                 'lock_scale': (False, False, False)}
+
+
+def read_pose_attributes(pose_bone):
+    values = dict()
+    for key in POSE_DEFAULTS:
+        value = getattr(pose_bone, key)
+        values[key] = value if isinstance(value, (str, bool)) else tuple(value)
+    return values
+
+
+class PlannedBone:
+    """
+    A bone waiting to be created by BonePlan.flush
+    """
+
+    def __init__(self, name, source, position, length, length_bone, length_scale, parent, use_connect):
+        self.name = name
+        self.source = source
+        self.position = position
+        self.length = length
+        self.length_bone = length_bone
+        self.length_scale = length_scale
+        self.parent = parent
+        self.use_connect = use_connect
+
+
+class BonePlan:
+    """
+    Declarative plan of the bones a rig creates. Every planned bone copies a source bone, like rigify copy_bone,
+    and can be moved and resized, like put_bone and length edits. Geometry is resolved in numpy from the bones
+    the plan uses, then the whole plan is created with one edit_bones.new sweep and only the new bones are written.
+    A plan creating a large part of the armature is read and written with foreach_get and foreach_set instead
+    """
+
+    SOURCE = 'SOURCE'   # parent placeholder: keep the parent of the source bone
+    BULK_FRACTION = 0.25    # plans creating at least this fraction of the armature bones use foreach_get/set
+
+    def __init__(self, obj):
+        """
+
+        :param obj: the armature object
+        """
+
+        self.obj = obj
+        self._bones = []
+
+    def __len__(self):
+        return len(self._bones)
+
+    def add(self, name, source, position=None, length=None, length_bone=None, length_scale=1.0, parent=None,
+            use_connect=False):
+        """
+        Plans a copy of source
+        :param name: requested name, blender makes it unique on creation
+        :param source: name of an existing bone to copy
+        :param position: new head keeping the bone vector, a point or a (bone name, 'head' or 'tail') tuple
+        :param length: new length, defaults to the length of length_bone or of source
+        :param length_bone: bone whose length is used
+        :param length_scale: factor applied to the length
+        :param parent: existing bone name, handle of a bone of the plan, None or BonePlan.SOURCE
+        :param use_connect:
+        :return: handle of the planned bone, its final name is in the list returned by flush
+        :rtype: int
+        """
+
+        self._bones.append(PlannedBone(name, source, position, length, length_bone, length_scale, parent,
+                                       use_connect))
+
+        return len(self._bones) - 1
+
+    @staticmethod
+    def read_attribute(edit_bones, attribute, dtype, size):
+        values = np.zeros(len(edit_bones) * size, dtype=dtype)
+        edit_bones.foreach_get(attribute, values)
+        return values.reshape(-1, size)
+
+    @staticmethod
+    def read_rows(edit_bones, names, attribute, dtype, size):
+        values = np.zeros((len(names), size), dtype=dtype)
+        for i, name in enumerate(names):
+            value = getattr(edit_bones[name], attribute)
+            values[i] = tuple(value) if size > 1 else value
+        return values
+
+    def get_used_bones(self):
+        """
+        Names of the existing bones the plan reads: sources, position and length bones
+        :return:
+        :rtype: list(str)
+        """
+
+        names = []
+        for bone in self._bones:
+            names.append(bone.source)
+            if isinstance(bone.position, tuple) and len(bone.position) == 2 and isinstance(bone.position[0], str):
+                names.append(bone.position[0])
+            if bone.length_bone is not None:
+                names.append(bone.length_bone)
+
+        seen = set()
+        return [name for name in names if not (name in seen or seen.add(name))]
+
+    def get_geometry(self, arrays, index):
+        """
+        Computes heads and tails of the planned bones from the current edit bones
+        :param arrays: attribute -> (bones, size) array of the edit bones the plan uses
+        :param index: bone name -> row
+        :return: heads, tails
+        """
+
+        heads = arrays['head']
+        tails = arrays['tail']
+        rows = [index[bone.source] for bone in self._bones]
+
+        new_heads = heads[rows].copy()
+        vectors = tails[rows] - heads[rows]
+        lengths = np.linalg.norm(vectors, axis=1)
+        target_lengths = lengths.copy()
+
+        for i, bone in enumerate(self._bones):
+            if bone.position is not None:
+                if isinstance(bone.position, tuple) and len(bone.position) == 2 and isinstance(bone.position[0], str):
+                    name, end = bone.position
+                    new_heads[i] = heads[index[name]] if end == 'head' else tails[index[name]]
+                else:
+                    new_heads[i] = tuple(bone.position)
+            if bone.length is not None:
+                target_lengths[i] = bone.length
+            elif bone.length_bone is not None:
+                row = index[bone.length_bone]
+                target_lengths[i] = np.linalg.norm(tails[row] - heads[row])
+            target_lengths[i] *= bone.length_scale
+
+        vectors *= (target_lengths / np.where(lengths > 0, lengths, 1.0))[:, np.newaxis]
+
+        return new_heads, new_heads + vectors
+
+    def flush(self):
+        """
+        Creates the planned bones in EDIT mode and clears the plan. The armature is left in EDIT mode
+        :return: the final names of the planned bones, in plan order
+        :rtype: list(str)
+        """
+
+        set_mode(self.obj, 'EDIT')
+
+        if not self._bones:
+            return []
+
+        edit_bones = self.obj.data.edit_bones
+        bulk = len(self._bones) >= self.BULK_FRACTION * len(edit_bones)
+
+        if bulk:
+            names = edit_bones.keys()
+            arrays = {attribute: self.read_attribute(edit_bones, attribute, dtype, size)
+                      for attribute, dtype, size in EDIT_ATTRIBUTES}
+        else:
+            names = self.get_used_bones()
+            arrays = {attribute: self.read_rows(edit_bones, names, attribute, dtype, size)
+                      for attribute, dtype, size in EDIT_ATTRIBUTES}
+        index = {name: i for i, name in enumerate(names)}
+
+        rows = [index[bone.source] for bone in self._bones]
+        new_arrays = {attribute: array[rows] for attribute, array in arrays.items()}
+        new_arrays['head'], new_arrays['tail'] = self.get_geometry(arrays, index)
+
+        source_parents = {bone.source: edit_bones[bone.source].parent for bone in self._bones
+                          if bone.parent == self.SOURCE}
+
+        # one creation sweep, then every attribute written at once
+        new_bones = [edit_bones.new(bone.name) for bone in self._bones]
+        created = [edit_bone.name for edit_bone in new_bones]
+
+        if bulk:
+            index = {name: i for i, name in enumerate(edit_bones.keys())}
+            old_rows = [index[name] for name in names]
+            new_rows = [index[name] for name in created]
+
+            for attribute, dtype, size in EDIT_ATTRIBUTES:
+                values = np.zeros((len(index), size), dtype=dtype)
+                values[old_rows] = arrays[attribute]
+                values[new_rows] = new_arrays[attribute]
+                edit_bones.foreach_set(attribute, values.ravel())
+        else:
+            for attribute, dtype, size in EDIT_ATTRIBUTES:
+                for edit_bone, value in zip(new_bones, new_arrays[attribute].tolist()):
+                    setattr(edit_bone, attribute, value if size > 1 else value[0])
+
+        for bone, edit_bone in zip(self._bones, new_bones):
+            if bone.parent == self.SOURCE:
+                parent = source_parents[bone.source]
+            elif isinstance(bone.parent, int):
+                parent = new_bones[bone.parent]
+            elif bone.parent:
+                parent = edit_bones[bone.parent]
+            else:
+                parent = None
+            if parent is not None:
+                edit_bone.parent = parent
+                edit_bone.use_connect = bone.use_connect
+
+        self.copy_pose_attributes(created)
+
+        self._bones = []
+
+        return created
+
+    def copy_pose_attributes(self, created):
+        """
+        Copies the pose bone attributes of the sources that differ from the defaults of a new pose bone.
+        Pose bones of new bones exist only out of EDIT mode, so the mode is switched only when there is something to copy
+        :param created: final names of the planned bones
+        :return:
+        """
+
+        pose_bones = self.obj.pose.bones
+        source_values = dict()
+        copies = []
+
+        for bone, name in zip(self._bones, created):
+            if bone.source not in source_values:
+                pose_bone = pose_bones.get(bone.source)
+                source_values[bone.source] = read_pose_attributes(pose_bone) if pose_bone else POSE_DEFAULTS
+            values = source_values[bone.source]
+            if values != POSE_DEFAULTS:
+                copies.append((name, values))
+
+        if not copies:
+            return
+
+        set_mode(self.obj, 'OBJECT')
+        for name, values in copies:
+            pose_bone = pose_bones[name]
+            for key, value in values.items():
+                setattr(pose_bone, key, value)
+        set_mode(self.obj, 'EDIT')
@@ -1,9 +1,10 @@
 import bpy
 from enum import Enum
-from rigify.utils import copy_bone, strip_org, make_mechanism_name, make_deformer_name
-from rigify.utils import put_bone, create_sphere_widget
+from rigify.utils import strip_org, make_mechanism_name, make_deformer_name
 
-from .utils import make_constraints_from_string
+from .bone_plan import BonePlan
+from .generation_context import GenerationContext, set_mode
+from .widgets import create_sphere_widget
 
 
 class ChainType(Enum):
@@ -50,127 +51,131 @@ class Chain:
         :rtype: list
         """
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        edit_bones = self.obj.data.edit_bones
-
-        first_name = self._base_bone
-
-        chain = [first_name]
-        # chain.extend(connected_children_names(self.obj, first_name)) DON'T USE THIS it works BAD
-
-        bone = edit_bones[first_name]
-
-        while True:
-            connects = 0
-            con_name = ""
+        topology = GenerationContext.get(self.obj).topology
 
-            for child in bone.children:
-                if child.use_connect:
-                    connects += 1
-                    con_name = child.name
-
-            if connects == 1:
-                chain += [con_name]
-                bone = edit_bones[con_name]
-            else:
-                break
-
-        return chain
+        return list(topology.get_chain(self._base_bone))
 
     @property
     def length(self):
         return len(self._bones['org'])
 
-    def make_mch_chain(self):
+    def plan_mch_chain(self, plan):
         """
-        Create all MCHs needed on a single chain
-        :return:
+        Plans all MCHs needed on a single chain
+        :param plan: BonePlan the MCHs are added to
+        :return: handles of the planned bones
         :rtype: list
         """
 
         if not self.active:
             return []
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        edit_bones = self.obj.data.edit_bones
-
         chain = self._bones['org']
-
-        self._bones['mch'] = []
+        handles = []
 
         if self.chain_type == ChainType.TYPE_MCH_BASED:
             for chain_bone in chain:
-                mch = make_mechanism_name(strip_org(chain_bone))
-                mch = copy_bone(self.obj, chain_bone, assign_name=mch)
-                edit_bones[mch].parent = None
-                edit_bones[mch].use_connect = False
-                edit_bones[mch].length *= self.MCH_SCALE
-                self._bones['mch'].append(mch)
+                handles.append(plan.add(make_mechanism_name(strip_org(chain_bone)), chain_bone,
+                                        length_scale=self.MCH_SCALE))
 
-        return self._bones['mch']
+        return handles
 
-    def make_def_chain(self):
+    def plan_def_chain(self, plan):
         """
-        Creates all DEFs in chain
-        :return:
-        :rtype:list
+        Plans all DEFs in chain
+        :param plan: BonePlan the DEFs are added to
+        :return: handles of the planned bones
+        :rtype: list
         """
 
         if not self.active:
             return []
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        edit_bones = self.obj.data.edit_bones
-
         chain = self._bones['org']
-
-        self._bones['def'] = []
+        handles = []
 
         if self.chain_type == ChainType.TYPE_MCH_BASED:
             for chain_bone in chain:
-                def_bone = make_deformer_name(strip_org(chain_bone))
-                def_bone = copy_bone(self.obj, chain_bone, assign_name=def_bone)
-                edit_bones[def_bone].parent = None
-                edit_bones[def_bone].use_connect = False
-                self._bones['def'].append(def_bone)
+                handles.append(plan.add(make_deformer_name(strip_org(chain_bone)), chain_bone))
 
-        return self._bones['def']
+        return handles
 
-    def make_ctrl_chain(self):
+    def plan_ctrl_chain(self, plan):
         """
-        Create all ctrls in chain
-        :return:
+        Plans all ctrls in chain
+        :param plan: BonePlan the ctrls are added to
+        :return: handles of the planned bones
+        :rtype: list
         """
 
         if not self.active:
             return []
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        edit_bones = self.obj.data.edit_bones
-
         chain = self._bones['org']
-
-        self._bones['ctrl'] = []
+        handles = []
 
         if self.chain_type == ChainType.TYPE_MCH_BASED:
             for chain_bone in chain:
-                ctrl = strip_org(chain_bone)
-                ctrl = copy_bone(self.obj, self.orientation_bone, assign_name=ctrl)
-                put_bone(self.obj, ctrl, edit_bones[chain_bone].head)
-                edit_bones[ctrl].length = edit_bones[self.orientation_bone].length * self.CTRL_SCALE
-                edit_bones[ctrl].parent = None
-                edit_bones[ctrl].use_connect = False
-                self._bones['ctrl'].append(ctrl)
+                handles.append(plan.add(strip_org(chain_bone), self.orientation_bone, position=(chain_bone, 'head'),
+                                        length_scale=self.CTRL_SCALE))
 
             last_name = chain[-1]
-            last_ctrl = copy_bone(self.obj, self.orientation_bone, assign_name=strip_org(last_name))
-            put_bone(self.obj, last_ctrl, edit_bones[last_name].tail)
-            edit_bones[last_ctrl].length = edit_bones[self.orientation_bone].length * self.CTRL_SCALE
-            edit_bones[last_ctrl].parent = None
-            edit_bones[last_ctrl].use_connect = False
-            self._bones['ctrl'].append(last_ctrl)
+            handles.append(plan.add(strip_org(last_name), self.orientation_bone, position=(last_name, 'tail'),
+                                    length_scale=self.CTRL_SCALE))
+
+        return handles
 
-        return self._bones['ctrl']
+    def set_planned_bones(self, bone_type, handles, created):
+        """
+        Stores the bones of a flushed plan as the bone_type bones of the chain. Inactive chains are left untouched
+        :param bone_type: 'mch', 'def' or 'ctrl'
+        :param handles: handles returned by the plan_* method
+        :param created: names returned by BonePlan.flush
+        :return: the bone_type bones of the chain
+        :rtype: list
+        """
+
+        if not self.active:
+            return []
+
+        self._bones[bone_type] = [created[handle] for handle in handles]
+
+        return self._bones[bone_type]
+
+    def make_mch_chain(self):
+        """
+        Create all MCHs needed on a single chain
+        :return:
+        :rtype: list
+        """
+
+        plan = BonePlan(self.obj)
+        handles = self.plan_mch_chain(plan)
+
+        return self.set_planned_bones('mch', handles, plan.flush())
+
+    def make_def_chain(self):
+        """
+        Creates all DEFs in chain
+        :return:
+        :rtype:list
+        """
+
+        plan = BonePlan(self.obj)
+        handles = self.plan_def_chain(plan)
+
+        return self.set_planned_bones('def', handles, plan.flush())
+
+    def make_ctrl_chain(self):
+        """
+        Create all ctrls in chain
+        :return:
+        """
+
+        plan = BonePlan(self.obj)
+        handles = self.plan_ctrl_chain(plan)
+
+        return self.set_planned_bones('ctrl', handles, plan.flush())
 
     def parent_bones(self):
         """
@@ -181,7 +186,7 @@ class Chain:
         if not self.active:
             return []
 
-        bpy.ops.object.mode_set(mode='EDIT')
+        set_mode(self.obj, 'EDIT')
         edit_bones = self.obj.data.edit_bones
 
         if self.chain_type == ChainType.TYPE_MCH_BASED:
@@ -199,29 +204,27 @@ class Chain:
                     edit_bones[ctrl].parent = edit_bones[self._base_bone].parent
                     edit_bones[ctrl].use_connect = False
 
-    def make_constraints(self):
+    def make_constraints(self, constraint_plan):
         """
         make constraints
+        :param constraint_plan: the plan of the rig owning the chain
+        :type constraint_plan: ConstraintPlan
         :return:
         """
 
         if not self.active:
             return []
 
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pose_bones = self.obj.pose.bones
-
         if self.chain_type == ChainType.TYPE_MCH_BASED:
             def_bones = self.get_chain_bones_by_type('def')
             mch_bones = self.get_chain_bones_by_type('mch')
             for i, name in enumerate(def_bones):
-                owner_pb = pose_bones[name]
                 subtarget = mch_bones[i]
-                make_constraints_from_string(owner_pb, self.obj, subtarget, "CT1.0WW")
+                constraint_plan.add(name, subtarget, "CT1.0WW", key='chain')
 
                 tail_subtarget = self.get_chain_bone_by_index(index=i+1, bone_type='ctrl')
                 if tail_subtarget:
-                    make_constraints_from_string(owner_pb, self.obj, tail_subtarget, "DT1.0#ST1.0")
+                    constraint_plan.add(name, tail_subtarget, "DT1.0#ST1.0", key='chain')
 
     def create_widgets(self, ctrl_wgt_function=create_sphere_widget, **kwargs):
         """
@@ -233,7 +236,7 @@ class Chain:
         if not self.active:
             return []
 
-        bpy.ops.object.mode_set(mode='OBJECT')
+        set_mode(self.obj, 'OBJECT')
 
         if self.chain_type == ChainType.TYPE_MCH_BASED:
             ctrl_bones = self.get_chain_bones_by_type('ctrl')
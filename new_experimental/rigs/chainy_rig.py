@@ -4,8 +4,10 @@ from rigify.utils import MetarigError
 
 from .utils import get_rig_type
 from .chain import Chain, ChainType
+from .bone_plan import BonePlan
 from .base_rig import BaseRig
 from .control_layers_generator import ControlLayersGenerator
+from .generation_context import requires_mode
 
 
 class ChainyRig(BaseRig):
@@ -28,12 +30,7 @@ class ChainyRig(BaseRig):
         if not bone:
             bone = self.base_bone
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        edit_bones = self.obj.data.edit_bones
-        bones = filter(lambda child: not child.use_connect, edit_bones[bone].children)
-        names = list(map(lambda b: b.name, bones))
-
-        return names
+        return list(self.topology.get_unconnected_children(bone))
 
     def get_chains(self):
         """
@@ -41,15 +38,11 @@ class ChainyRig(BaseRig):
         :return:
         """
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        edit_bones = self.obj.data.edit_bones
-
         chains = dict()
 
         if not self.single:
             for name in self.bones['org'][1:]:
-                eb = edit_bones[name]
-                if not eb.use_connect and eb.parent == edit_bones[self.base_bone]:
+                if not self.topology.is_connected(name) and self.topology.get_parent(name) == self.base_bone:
                     chain = Chain(self.obj, name, self.orientation_bone, chain_type=self.chain_type)
                     self.chain_objects[chain.base_name] = chain
                     chains[name] = self.get_subchains(name)
@@ -77,30 +70,7 @@ class ChainyRig(BaseRig):
         :return:
         """
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        edit_bones = self.obj.data.edit_bones
-
-        chain = [first_name]
-        # chain.extend(connected_children_names(self.obj, first_name)) DON'T USE THIS it works BAD
-
-        bone = edit_bones[first_name]
-
-        while True:
-            connects = 0
-            con_name = ""
-
-            for child in bone.children:
-                if child.use_connect:
-                    connects += 1
-                    con_name = child.name
-
-            if connects == 1:
-                chain += [con_name]
-                bone = edit_bones[con_name]
-            else:
-                break
-
-        return chain
+        return list(self.topology.get_chain(first_name))
 
     def get_subchains(self, name, exclude=None):
         """
@@ -111,9 +81,6 @@ class ChainyRig(BaseRig):
         :return:
         """
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        edit_bones = self.obj.data.edit_bones
-
         if exclude is None:
             exclude = []
 
@@ -121,14 +88,14 @@ class ChainyRig(BaseRig):
 
         chain = self.get_chain_object_by_name(name)
 
-        for bone in edit_bones[name].children:
-            if self.obj.pose.bones[bone.name].rigify_type == "" and not bone.use_connect and bone.name not in exclude:
-                subchain = Chain(self.obj, bone.name, self.orientation_bone, chain_type=chain.chain_type, parent=chain)
+        for bone in self.topology.get_unconnected_children(name):
+            if self.topology.get_rigify_type(bone) == "" and bone not in exclude:
+                subchain = Chain(self.obj, bone, self.orientation_bone, chain_type=chain.chain_type, parent=chain)
                 if subchain.length != chain.length:
                     raise MetarigError("Subchains of chain starting with %s are not the same length! assign a rig_type/"
                                        "unconnected children of main bone of chain" % name)
                 else:
-                    subchains.append(bone.name)
+                    subchains.append(bone)
                     self.chain_objects[subchain.base_name] = subchain
 
         return subchains
@@ -138,23 +105,36 @@ class ChainyRig(BaseRig):
         Get bone defining orientation of ctrls
         :return:
         """
-        bpy.ops.object.mode_set(mode='EDIT')
 
-        orientation_bone = self.obj.pose.bones[self.base_bone]
+        orientation_bone = self.base_bone
 
         while True:
-            if orientation_bone.parent is None:
+            parent = self.topology.get_parent(orientation_bone)
+            if parent is None:
                 break
-            elif orientation_bone.parent.rigify_type != "":
-                module = get_rig_type(orientation_bone.parent.rigify_type)
+            elif self.topology.get_rigify_type(parent) != "":
+                module = get_rig_type(self.topology.get_rigify_type(parent))
                 if issubclass(module.Rig, ChainyRig):
-                    orientation_bone = orientation_bone.parent
+                    orientation_bone = parent
                 else:
                     break
             else:
                 break
 
-        return orientation_bone.name
+        return orientation_bone
+
+    def get_dependencies(self):
+        """
+        ctrls are oriented on the base bone of the outermost ChainyRig parent
+        :return:
+        """
+
+        dependencies = super().get_dependencies()
+
+        if self.orientation_bone != self.base_bone:
+            dependencies.append(self.orientation_bone)
+
+        return dependencies
 
     def get_chain_object_by_name(self, name):
         """
@@ -177,35 +157,35 @@ class ChainyRig(BaseRig):
         chain = self.get_chain_object_by_name(name)
         chain.active = active
 
-    def create_mch(self):
+    def create_chain_bones(self, bone_type, plan_chain):
+        """
+        Plans the bone_type bones of every chain and subchain in one BonePlan and creates them with a single flush
+        :param bone_type: 'mch', 'def' or 'ctrl'
+        :param plan_chain: Chain method adding the bones of a chain to a plan
+        :return:
+        """
+
+        plan = BonePlan(self.obj)
+        planned = []
 
         for name in self.chains:
-            chain = self.get_chain_object_by_name(name)
-            self.bones['mch'][chain.base_name] = chain.make_mch_chain()
+            for chain_name in [name] + list(self.chains[name]):
+                chain = self.get_chain_object_by_name(chain_name)
+                planned.append((chain, plan_chain(chain, plan)))
 
-            for subname in self.chains[name]:
-                subchain = self.get_chain_object_by_name(subname)
-                self.bones['mch'][subchain.base_name] = subchain.make_mch_chain()
+        created = plan.flush()
 
-    def create_def(self):
+        for chain, handles in planned:
+            self.bones[bone_type][chain.base_name] = chain.set_planned_bones(bone_type, handles, created)
 
-        for name in self.chains:
-            chain = self.get_chain_object_by_name(name)
-            self.bones['def'][chain.base_name] = chain.make_def_chain()
+    def create_mch(self):
+        self.create_chain_bones('mch', Chain.plan_mch_chain)
 
-            for subname in self.chains[name]:
-                subchain = self.get_chain_object_by_name(subname)
-                self.bones['def'][subchain.base_name] = subchain.make_def_chain()
+    def create_def(self):
+        self.create_chain_bones('def', Chain.plan_def_chain)
 
     def create_controls(self):
-
-        for name in self.chains:
-            chain = self.get_chain_object_by_name(name)
-            self.bones['ctrl'][chain.base_name] = chain.make_ctrl_chain()
-
-            for subname in self.chains[name]:
-                subchain = self.get_chain_object_by_name(subname)
-                self.bones['ctrl'][subchain.base_name] = subchain.make_ctrl_chain()
+        self.create_chain_bones('ctrl', Chain.plan_ctrl_chain)
 
     def get_ctrl_by_index(self, chain, index):
         """
@@ -222,13 +202,13 @@ class ChainyRig(BaseRig):
 
         return ctrl_chain[index]
 
+    @requires_mode('EDIT')
     def parent_bones(self):
         """
         Specify bone parenting
         :return:
         """
 
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         for chain in self.chain_objects:
@@ -257,15 +237,12 @@ class ChainyRig(BaseRig):
         :return:
         """
 
-        bpy.ops.object.mode_set(mode='OBJECT')
-
         for chain_object in self.chain_objects:
-            self.chain_objects[chain_object].make_constraints()
+            self.chain_objects[chain_object].make_constraints(self.constraint_plan)
 
+    @requires_mode('OBJECT')
     def create_widgets(self):
 
-        bpy.ops.object.mode_set(mode='OBJECT')
-
         for chain_object in self.chain_objects:
             self.chain_objects[chain_object].create_widgets()
 
@@ -290,6 +267,8 @@ class ChainyRig(BaseRig):
         # following passes should be made ONLY when ctrls are completely defined
         self.assign_layers()
         self.make_constraints()
+        self.apply_constraints()
+        self.apply_layers()
         self.create_widgets()
         rig_ui_script = self.make_drivers()
 
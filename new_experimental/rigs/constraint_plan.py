@@ -0,0 +1,150 @@
+from collections import OrderedDict
+
+from .utils import compile_constraints_string, apply_constraint_spec
+from .generation_context import set_mode
+
+
+class PlannedConstraint:
+    """
+    A constraint waiting to be created by ConstraintPlan.flush
+    """
+
+    def __init__(self, target, subtarget, spec):
+        """
+
+        :param target: the target object
+        :param subtarget: the bone subtarget name
+        :param spec:
+        :type spec: ConstraintSpec
+        """
+
+        self.target = target
+        self.subtarget = subtarget
+        self.spec = spec
+        self.overrides = OrderedDict()
+
+
+class ConstraintPlan:
+    """
+    Collects the constraints of a rig during its passes and creates only the final set in a single OBJECT mode sweep.
+    Planned constraints are keyed by (owner, key, constraint type, occurrence of the type in the fstring) so later
+    passes can override or remove them. Planned parenting (PA) is applied in EDIT mode before the sweep
+    """
+
+    def __init__(self, obj):
+        """
+
+        :param obj: the armature object
+        """
+
+        self.obj = obj
+        self._owners = OrderedDict()
+        self._auto_key = 0
+
+    def add(self, owner, subtarget, fstring, key=None, target=None):
+        """
+        Plans the constraints described by fstring on owner. Adding an existing key replaces the planned constraints
+        of the same type and occurrence, clauses of the same type in one fstring are all kept
+        :param owner: the owner bone name
+        :param subtarget: the bone subtarget name
+        :param fstring: formatted string
+        :param key: name used to address the constraints later, unique if not given
+        :param target: the target object, defaults to the armature
+        :return:
+        """
+
+        if key is None:
+            key = self._auto_key
+            self._auto_key += 1
+
+        if target is None:
+            target = self.obj
+
+        planned = self._owners.setdefault(owner, OrderedDict())
+
+        occurrences = dict()
+        for spec in compile_constraints_string(fstring):
+            occurrence = occurrences.get(spec.type, 0)
+            occurrences[spec.type] = occurrence + 1
+            planned[(key, spec.type, occurrence)] = PlannedConstraint(target, subtarget, spec)
+
+    def get(self, owner, key=None, cns_type=None):
+        """
+        Returns the planned constraints of owner matching key and cns_type
+        :param owner: the owner bone name
+        :param key:
+        :param cns_type: blender constraint type
+        :return:
+        :rtype: list(PlannedConstraint)
+        """
+
+        planned = self._owners.get(owner, dict())
+
+        return [planned[k] for k in planned if (key is None or k[0] == key) and (cns_type is None or k[1] == cns_type)]
+
+    def has(self, owner, key=None, cns_type=None):
+        return bool(self.get(owner, key, cns_type))
+
+    def override(self, owner, key, cns_type=None, **props):
+        """
+        Overrides properties of the planned constraints matching key and cns_type
+        :param owner: the owner bone name
+        :param key:
+        :param cns_type: blender constraint type
+        :param props: constraint properties. target and subtarget are accepted too
+        :return:
+        """
+
+        for planned in self.get(owner, key, cns_type):
+            for attr in props:
+                if attr in ('target', 'subtarget'):
+                    setattr(planned, attr, props[attr])
+                else:
+                    planned.overrides[attr] = props[attr]
+
+    def remove(self, owner, key, cns_type=None):
+        """
+        Removes the planned constraints matching key and cns_type
+        :param owner: the owner bone name
+        :param key:
+        :param cns_type: blender constraint type
+        :return:
+        """
+
+        planned = self._owners.get(owner, dict())
+
+        for k in list(planned):
+            if k[0] == key and (cns_type is None or k[1] == cns_type):
+                del planned[k]
+
+    def flush(self):
+        """
+        Creates all the planned constraints grouped per pose bone and empties the plan
+        :return:
+        """
+
+        if not self._owners:
+            return
+
+        parents = [(owner, planned) for owner in self._owners for planned in self._owners[owner].values()
+                   if planned.spec.type == 'PARENTING']
+
+        if parents:
+            set_mode(self.obj, 'EDIT')
+            for owner, planned in parents:
+                edit_bones = planned.target.data.edit_bones
+                edit_bones[owner].parent = edit_bones[planned.subtarget]
+
+        set_mode(self.obj, 'OBJECT')
+        pose_bones = self.obj.pose.bones
+
+        for owner in self._owners:
+            owner_pb = pose_bones[owner]
+            for planned in self._owners[owner].values():
+                if planned.spec.type == 'PARENTING':
+                    continue
+                const = apply_constraint_spec(owner_pb, planned.target, planned.subtarget, planned.spec)
+                for attr, value in planned.overrides.items():
+                    setattr(const, attr, value)
+
+        self._owners.clear()
@@ -1,4 +1,6 @@
 import bpy
+from .generation_context import GenerationContext
+from .utils import assign_layers
 
 
 class ControlLayersGenerator:
@@ -34,15 +36,7 @@ class ControlLayersGenerator:
         :return:
         """
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        edit_bones = self.obj.data.edit_bones
-
-        for bone in primary_ctrls:
-            if self.rig.primary_layers:
-                edit_bones[bone].layers = self.rig.params.primary_layers
-        for bone in all_ctrls:
-            if self.rig.secondary_layers and bone not in primary_ctrls:
-                edit_bones[bone].layers = self.rig.params.secondary_layers
+        self.assign_rig_layers(primary_ctrls=primary_ctrls, all_ctrls=all_ctrls)
 
     def assign_tweak_layers(self, tweaks):
         """
@@ -52,13 +46,52 @@ class ControlLayersGenerator:
         :return:
         """
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        edit_bones = self.obj.data.edit_bones
+        self.assign_rig_layers(tweaks=tweaks)
+
+    def assign_rig_layers(self, primary_ctrls=(), all_ctrls=(), tweaks=()):
+        """
+        Queues the layer assignment of the rig ctrls. Ctrls in all_ctrls and not in primary_ctrls are secondary.
+        Queued assignments are applied by apply_layers
+        :param primary_ctrls:
+        :type primary_ctrls: list(str)
+        :param all_ctrls:
+        :type all_ctrls: list(str)
+        :param tweaks:
+        :type tweaks: list(str)
+        :return:
+        """
+
+        queue = GenerationContext.get(self.obj).get_cache('layer_assignments', list)
+
+        if self.rig.primary_layers and primary_ctrls:
+            queue.append((list(primary_ctrls), list(self.rig.params.primary_layers)))
+
+        if self.rig.secondary_layers and all_ctrls:
+            primary = set(primary_ctrls)
+            secondary_ctrls = [bone for bone in all_ctrls if bone not in primary]
+            queue.append((secondary_ctrls, list(self.rig.params.secondary_layers)))
+
+        if self.rig.tweak_layers and tweaks:
+            queue.append((list(tweaks), list(self.rig.params.tweak_layers)))
+
+    @staticmethod
+    def apply_layers(obj):
+        """
+        Applies all the queued layer assignments, of one or many rigs, in a single pass over obj.data.bones.
+        It works in OBJECT mode so no edit mode round trip is needed
+        :param obj: the armature object
+        :return:
+        """
+
+        context = GenerationContext.get(obj)
+        queue = context.get_cache('layer_assignments', list)
 
-        for bone in tweaks:
-            if self.rig.tweak_layers:
-                edit_bones[bone].layers = self.rig.params.tweak_layers
+        if not queue:
+            return
 
+        context.set_mode('OBJECT')
+        assign_layers(obj.data.bones, queue)
+        del queue[:]
 
     @staticmethod
     def add_layer_parameters(params):
@@ -1,5 +1,99 @@
 import bpy
+import numpy as np
+from mathutils.kdtree import KDTree
 from rigify.utils import copy_bone
+from .generation_context import requires_mode
+from .utils import get_layer_mask, get_ctrl_mask
+
+
+def cluster_positions(heads, tolerances, parents=None):
+    """
+    Greedy clustering of coincident positions backed by a kd-tree.
+    Every position not yet clustered collects all the following free positions within its own tolerance
+    :param heads: positions
+    :type heads: list(Vector)
+    :param tolerances: per position distance below which two positions are considered equal
+    :type tolerances: list(float)
+    :param parents: if given only positions with the same parent are clustered
+    :type parents: list(str)
+    :return: clusters as lists of indices, in input order
+    :rtype: list(list(int))
+    """
+
+    kd = KDTree(len(heads))
+    for i, head in enumerate(heads):
+        kd.insert(head, i)
+    kd.balance()
+
+    clusters = []
+    clustered = [False] * len(heads)
+
+    for i, head in enumerate(heads):
+        if clustered[i]:
+            continue
+        cluster = [i]
+        clustered[i] = True
+        for co, j, dist in kd.find_range(head, tolerances[i]):
+            if clustered[j] or (parents is not None and parents[j] != parents[i]):
+                continue
+            cluster.append(j)
+        cluster[1:] = sorted(cluster[1:])
+        for j in cluster[1:]:
+            clustered[j] = True
+        clusters.append(cluster)
+
+    return clusters
+
+
+class ControlPositionIndex:
+    """
+    Kd-tree over the heads of all the ctrl bones of an armature (bones not on the last 4 mechanism layers).
+    Meant to be built once the regular rigs are generated and shared through the GenerationContext
+    """
+
+    def __init__(self, obj):
+        """
+        Must be built in EDIT mode
+        :param obj: the armature object
+        """
+
+        edit_bones = obj.data.edit_bones
+        count = len(edit_bones)
+
+        is_ctrl = get_ctrl_mask(get_layer_mask(edit_bones))
+
+        heads = np.zeros(count * 3, dtype=np.float32)
+        edit_bones.foreach_get('head', heads)
+        heads.shape = (count, 3)
+        tails = np.zeros(count * 3, dtype=np.float32)
+        edit_bones.foreach_get('tail', tails)
+        tails.shape = (count, 3)
+
+        indices = np.flatnonzero(is_ctrl)
+        names = edit_bones.keys()
+        self.names = [names[i] for i in indices]
+        self.lengths = np.linalg.norm(tails[indices] - heads[indices], axis=1)
+        self.max_length = float(self.lengths.max()) if len(indices) else 0.0
+
+        self._kd = KDTree(len(indices))
+        for i, head in enumerate(heads[indices]):
+            self._kd.insert(head, i)
+        self._kd.balance()
+
+    def find(self, position, relative_error):
+        """
+        Returns the ctrls whose head is closer to position than their length * relative_error, in armature order
+        :param position:
+        :type position: Vector
+        :param relative_error: position error relative to bone length
+        :return:
+        :rtype: list(str)
+        """
+
+        found = [i for co, i, dist in self._kd.find_range(position, self.max_length * relative_error)
+                 if dist <= self.lengths[i] * relative_error]
+
+        return [self.names[i] for i in sorted(found)]
 
 
 class ControlSnapper:
@@ -19,6 +113,8 @@ class ControlSnapper:
         self.obj = obj
         self.bones = bones
 
+        self._ctrl_index = None     # ctrl name -> list of (chain, index) in self.bones['ctrl']
+
     def flatten(self, bones):
         """
         Flattens a bones dictionary
@@ -36,6 +132,59 @@ class ControlSnapper:
         else:
             return bones
 
+    def _build_ctrl_index(self):
+        self._ctrl_index = dict()
+
+        for chain in self.bones['ctrl']:
+            ctrls = self.bones['ctrl'][chain]
+            if not isinstance(ctrls, list):
+                continue
+            for i, ctrl in enumerate(ctrls):
+                self._ctrl_index.setdefault(ctrl, []).append((chain, i))
+
+    def _is_at(self, ctrl, chain, index):
+        ctrls = self.bones['ctrl'].get(chain)
+        return isinstance(ctrls, list) and index < len(ctrls) and ctrls[index] == ctrl
+
+    def get_ctrl_positions(self, ctrl):
+        """
+        Returns where ctrl is stored in self.bones['ctrl'].
+        The reverse index is rebuilt only when the rig changed the ctrl lists behind the snapper's back
+        :param ctrl: ctrl name
+        :return:
+        :rtype: list(tuple(str, int))
+        """
+
+        positions = self._ctrl_index.get(ctrl) if self._ctrl_index is not None else None
+
+        if positions is None or not all(self._is_at(ctrl, chain, i) for chain, i in positions):
+            self._build_ctrl_index()
+            positions = self._ctrl_index.get(ctrl, [])
+
+        return list(positions)
+
+    def replace_ctrl(self, old_ctrl, new_ctrl, exclude=()):
+        """
+        Replaces old_ctrl with new_ctrl in all the ctrl chains, keeping the reverse index up to date
+        :param old_ctrl:
+        :param new_ctrl:
+        :param exclude: chains to leave untouched
+        :return:
+        """
+
+        kept = []
+        for chain, i in self.get_ctrl_positions(old_ctrl):
+            if chain in exclude:
+                kept.append((chain, i))
+                continue
+            self.bones['ctrl'][chain][i] = new_ctrl
+            self._ctrl_index.setdefault(new_ctrl, []).append((chain, i))
+
+        if kept:
+            self._ctrl_index[old_ctrl] = kept
+        else:
+            self._ctrl_index.pop(old_ctrl, None)
+
     def update_parent(self, old_parent, new_parent):
         """
         Moving parent from old to new
@@ -44,12 +193,89 @@ class ControlSnapper:
         :return:
         """
 
-        bpy.ops.object.mode_set(mode='EDIT')
+        self.update_parents({old_parent: new_parent}, remove=False)
+
+    @staticmethod
+    def resolve_mapping(mapping):
+        """
+        Follows chains of merges (a -> b, b -> c) so that every old bone maps to its final replacement
+        :param mapping: old name -> new name
+        :type mapping: dict
+        :return:
+        :rtype: dict
+        """
+
+        resolved = dict()
+
+        for old in mapping:
+            new = mapping[old]
+            visited = {old}
+            while new in mapping and new not in visited:
+                visited.add(new)
+                new = mapping[new]
+            resolved[old] = new
+
+        return resolved
+
+    @requires_mode('EDIT')
+    def update_parents(self, mapping, remove=True):
+        """
+        Moves the children of every old bone in mapping to its new bone in a single sweep over the edit bones,
+        then removes the old bones
+        :param mapping: old name -> new name
+        :type mapping: dict
+        :param remove: remove the old bones
+        :return:
+        """
+
+        if not mapping:
+            return
+
         edit_bones = self.obj.data.edit_bones
+        resolved = self.resolve_mapping(mapping)
 
-        for child in edit_bones[old_parent].children:
-            child.parent = edit_bones[new_parent]
+        for eb in edit_bones:
+            parent = eb.parent
+            if parent is None or parent.name not in resolved:
+                continue
+            new_parent = resolved[parent.name]
+            if new_parent != eb.name:
+                eb.parent = edit_bones[new_parent]
 
+        if remove:
+            for old in resolved:
+                if old in edit_bones:
+                    edit_bones.remove(edit_bones[old])
+
+    @requires_mode('EDIT')
+    def get_aggregates(self, ctrls, same_parent=True):
+        """
+        Returns the groups of ctrls sharing the same head position, each ctrl bone is read only once
+        :param ctrls:
+        :type ctrls: list(str)
+        :param same_parent: only group ctrls with the same parent
+        :return:
+        :rtype: list(list(str))
+        """
+
+        edit_bones = self.obj.data.edit_bones
+
+        heads = []
+        tolerances = []
+        parents = []
+        for ctrl in ctrls:
+            eb = edit_bones[ctrl]
+            heads.append(eb.head.copy())
+            tolerances.append(eb.length * self.POSITION_RELATIVE_ERROR)
+            parents.append(eb.parent.name if eb.parent else None)
+
+        if not same_parent:
+            parents = None
+
+        return [[ctrls[i] for i in cluster]
+                for cluster in cluster_positions(heads, tolerances, parents) if len(cluster) > 1]
+
+    @requires_mode('EDIT')
     def aggregate_ctrls(self, same_parent=True):
         """
         Aggregate controls should be called before constraining but AFTER parenting
@@ -58,45 +284,25 @@ class ControlSnapper:
         :return:
         """
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        edit_bones = self.obj.data.edit_bones
-
-        aggregates = []
-
-        all_ctrls = self.flatten(self.bones['ctrl'])
-
-        while 1:
-            ctrl = all_ctrls[0]
-            aggregate = [ctrl]
-            for ctrl2 in all_ctrls[1:]:
-                error = edit_bones[ctrl].length * self.POSITION_RELATIVE_ERROR
-                if (edit_bones[ctrl].head - edit_bones[ctrl2].head).magnitude <= error \
-                        and (not same_parent or edit_bones[ctrl].parent == edit_bones[ctrl2].parent):
-                    aggregate.append(ctrl2)
-            for element in aggregate:
-                all_ctrls.remove(element)
-            if len(aggregate) > 1:
-                aggregates.append(aggregate)
-            if not all_ctrls:
-                break
+        aggregates = self.get_aggregates(self.flatten(self.bones['ctrl']), same_parent=same_parent)
 
         if aggregates:
             self.bones['ctrl']['aggregate'] = []
+            self._build_ctrl_index()
+
+        mapping = dict()
 
         for aggregate in aggregates:
             name = self.get_aggregate_name(aggregate)
             aggregate_ctrl = copy_bone(self.obj, aggregate[0], name)
+            self._ctrl_index.setdefault(aggregate_ctrl, []).append(('aggregate',
+                                                                    len(self.bones['ctrl']['aggregate'])))
             self.bones['ctrl']['aggregate'].append(aggregate_ctrl)
             for ctrl in aggregate:
-                self.update_parent(ctrl, aggregate_ctrl)
-                edit_bones.remove(edit_bones[ctrl])
-                for chain in self.bones['ctrl']:
-                    if chain == 'aggregate':
-                        continue
-                    if ctrl in self.bones['ctrl'][chain]:
-                        i = self.bones['ctrl'][chain].index(ctrl)
-                        self.bones['ctrl'][chain][i] = aggregate_ctrl
-                        continue
+                mapping[ctrl] = aggregate_ctrl
+                self.replace_ctrl(ctrl, aggregate_ctrl, exclude=('aggregate',))
+
+        self.update_parents(mapping)
 
     def get_aggregate_name(self, aggregate):
         """
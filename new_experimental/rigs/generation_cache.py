@@ -0,0 +1,508 @@
+import bpy
+import gzip
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+from rigify.rigs.widgets import create_widget
+
+from .bone_plan import BonePlan, EDIT_ATTRIBUTES, POSE_DEFAULTS, read_pose_attributes
+from .generation_context import set_mode
+from .utils import get_cache_dir, get_source_version, get_id_property_value, make_widget_name
+from .widget_library import read_mesh_shape, write_mesh_shape
+
+CACHE_VERSION = 1       # bump when the entry format changes, older entries are then never hit
+MAX_ENTRIES = 256       # per rig module, the least recently used entries are deleted beyond it
+
+SELF = '<self>'         # stands for the generated armature object, whatever its name
+SKIPPED_PROPS = ('rigify_type', 'rigify_parameters')
+
+
+class CacheMiss(Exception):
+    """
+    Raised when a generation result can't be cached
+    """
+    pass
+
+
+#######################################################################################################################
+# Keys
+#######################################################################################################################
+
+
+def get_module_version(rig_class):
+    """
+    Version of the code generating rig_class: hash of the sources of the rig module, of the modules of its base
+    classes and of every module of the same package they use
+    :param rig_class:
+    :return:
+    :rtype: str
+    """
+
+    module = sys.modules[rig_class.__module__]
+    package = module.__name__.rsplit('.', 1)[0] + '.'
+
+    modules = [sys.modules[cls.__module__] for cls in rig_class.__mro__ if cls.__module__ in sys.modules]
+    modules = [m for m in modules if m.__name__.startswith(package)]
+    found = set(m.__name__ for m in modules)
+
+    for m in modules:
+        for value in list(vars(m).values()):
+            if isinstance(value, type(m)):
+                name = value.__name__
+            else:
+                name = getattr(value, '__module__', None)
+            if isinstance(name, str) and name.startswith(package) and name not in found and name in sys.modules:
+                found.add(name)
+                modules.append(sys.modules[name])
+
+    digest = hashlib.sha1()
+    for path in sorted(getattr(m, '__file__', None) or '' for m in modules):
+        if path:
+            digest.update(get_source_version(path).encode())
+
+    return digest.hexdigest()
+
+
+#######################################################################################################################
+# Cache
+#######################################################################################################################
+
+
+class GenerationCache:
+    """
+    On-disk cache of what rigs produced: bones, constraints, drivers, custom properties and widgets.
+    A rig whose inputs, dependencies and module version match an entry is replayed from it with bulk writes
+    instead of running its passes. Entries are gzipped json files named <rig module>.<module version>.<key>,
+    storing an entry deletes the entries of the other versions of its module
+    """
+
+    def __init__(self, path):
+        """
+
+        :param path: the cache directory
+        """
+
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @staticmethod
+    def get():
+        """
+        Returns the generation cache or None if the cache is off
+        :return:
+        :rtype: GenerationCache
+        """
+
+        path = get_cache_dir("generations")
+
+        if path is None:
+            return None
+
+        return GenerationCache(path)
+
+    @staticmethod
+    def make_key(input_hash, version, dependencies):
+        """
+        :param input_hash: BaseRig.get_input_hash of the rig
+        :param version: module version of the rig
+        :param dependencies: (base bone, input hash, module version) of the rigs it depends on
+        :return:
+        :rtype: str
+        """
+
+        digest = hashlib.sha1()
+        digest.update(repr((CACHE_VERSION, input_hash, version, sorted(dependencies))).encode())
+
+        return digest.hexdigest()
+
+    def get_entry_path(self, module, version, key):
+        return os.path.join(self.path, "%s.%s.%s.json.gz" % (module, version[:12], key[:24]))
+
+    def load(self, module, version, key):
+        """
+        Returns the entry stored under key or None
+        :param module: rig module name
+        :param version:
+        :param key:
+        :return:
+        :rtype: dict
+        """
+
+        path = self.get_entry_path(module, version, key)
+
+        try:
+            with gzip.open(path, 'rt') as f:
+                entry = json.load(f)
+            os.utime(path, None)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+
+        return entry
+
+    def store(self, module, version, key, entry):
+        path = self.get_entry_path(module, version, key)
+
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with gzip.open(path + ".tmp", 'wb') as f:
+                f.write(json.dumps(entry, separators=(',', ':')).encode())
+            os.replace(path + ".tmp", path)
+        except OSError:
+            return
+
+        self.stores += 1
+        self.prune(module, version)
+
+    def prune(self, module, version):
+        """
+        Deletes the entries of other versions of module and the least recently used ones beyond MAX_ENTRIES
+        :param module:
+        :param version:
+        :return:
+        """
+
+        prefix = module + '.'
+        current = []
+
+        try:
+            for name in os.listdir(self.path):
+                if not name.startswith(prefix) or not name.endswith('.json.gz'):
+                    continue
+                path = os.path.join(self.path, name)
+                if name[len(prefix):].startswith(version[:12] + '.'):
+                    current.append((os.path.getmtime(path), path))
+                else:
+                    os.remove(path)
+            for mtime, path in sorted(current)[:max(0, len(current) - MAX_ENTRIES)]:
+                os.remove(path)
+        except OSError:
+            return
+
+    def get_report(self):
+        return {'hits': self.hits, 'misses': self.misses, 'stores': self.stores}
+
+
+#######################################################################################################################
+# Capture
+#######################################################################################################################
+
+
+def get_struct_properties(struct):
+    """
+    Names of the writable properties of a constraint, driver target or fcurve modifier
+    :param struct:
+    :return:
+    """
+
+    rna = getattr(struct, 'bl_rna', None)
+
+    if rna is not None:
+        return [p.identifier for p in rna.properties if not p.is_readonly and p.identifier != 'rna_type']
+
+    return [key for key in vars(struct) if not key.startswith('_')]
+
+
+def to_json_value(value, obj):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, bpy.types.Object):
+        return {'object': SELF if value == obj else value.name}
+    if isinstance(value, bpy.types.ID):
+        raise CacheMiss("%r can't be cached" % value)
+    return [to_json_value(v, obj) for v in value]
+
+
+def from_json_value(value, obj):
+    if isinstance(value, dict):
+        return obj if value['object'] == SELF else bpy.data.objects.get(value['object'])
+    return value
+
+
+def read_properties(struct, obj, exclude=('name', 'type')):
+    """
+    Writable properties of struct as [name, value] pairs, ID pointers other than objects can't be cached
+    :param struct:
+    :param obj: the armature object
+    :param exclude:
+    :return:
+    """
+
+    properties = []
+
+    for key in get_struct_properties(struct):
+        if key in exclude:
+            continue
+        try:
+            properties.append([key, to_json_value(getattr(struct, key), obj)])
+        except TypeError:
+            continue    # struct pointers
+
+    return properties
+
+
+def write_properties(struct, properties, obj):
+    for key, value in properties:
+        value = from_json_value(value, obj)
+        # enum flags are read as lists but only accept sets
+        for candidate in ((value, set(value)) if isinstance(value, list) else (value,)):
+            try:
+                setattr(struct, key, candidate)
+                break
+            except (AttributeError, TypeError, ValueError):
+                continue
+
+
+def get_bone_states(obj, names=None):
+    """
+    State of the bones of obj, compared before and after a rig runs to find the bones it changed without creating
+    them
+    :param obj: the armature object
+    :param names: bones to read, all of them when None
+    :return: bone name -> comparable state
+    :rtype: dict
+    """
+
+    set_mode(obj, 'EDIT')
+    edit_bones = obj.data.edit_bones
+    index = dict((name, i) for i, name in enumerate(edit_bones.keys()))
+    names = [name for name in names if name in index] if names is not None else list(index)
+    rows = [index[name] for name in names]
+    parents = [edit_bones[name].parent.name if edit_bones[name].parent else None for name in names]
+    columns = [BonePlan.read_attribute(edit_bones, attribute, dtype, size)[rows]
+               for attribute, dtype, size in EDIT_ATTRIBUTES + [('use_connect', bool, 1)]]
+
+    set_mode(obj, 'OBJECT')
+    pose_bones = obj.pose.bones
+
+    states = dict()
+    for i, name in enumerate(names):
+        pb = pose_bones[name]
+        states[name] = (parents[i], b''.join(column[i].tobytes() for column in columns),
+                        sorted(read_pose_attributes(pb).items()),
+                        pb.custom_shape.name if pb.custom_shape else None,
+                        pb.custom_shape_transform.name if pb.custom_shape_transform else None,
+                        pb.bone_group.name if pb.bone_group else None,
+                        repr(sorted((key, get_id_property_value(pb[key])) for key in pb.keys())))
+
+    return states
+
+
+def capture(obj, record, org_bones, changed, references, widgets, scripts):
+    """
+    Serializes what a rig produced: its new bones and the final state of the other bones it changed, their pose
+    attributes and custom properties, their constraints and the ones it added to other bones, its drivers and
+    widget shapes
+    :param obj: the armature object
+    :param record: incremental record of the rig, see incremental.record_outputs
+    :param org_bones: ORG bones of the rig
+    :param changed: other bones the rig changed, see get_bone_states
+    :param references: bones outside the rig its outputs refer to
+    :param widgets: names of the widget objects the rig created
+    :param scripts: what the rig generate returned
+    :return: the cache entry or None if the outputs can't be cached
+    :rtype: dict
+    """
+
+    created = record['bones']
+    names = created + [name for name in org_bones if name not in created]
+    names += [name for name in changed if name not in names]
+
+    set_mode(obj, 'EDIT')
+    edit_bones = obj.data.edit_bones
+    index = dict((name, i) for i, name in enumerate(edit_bones.keys()))
+    rows = [index[name] for name in names]
+
+    bones = {'names': names,
+             'created': len(created),
+             'parents': [edit_bones[name].parent.name if edit_bones[name].parent else None for name in names]}
+    for attribute, dtype, size in EDIT_ATTRIBUTES + [('use_connect', bool, 1)]:
+        bones[attribute] = BonePlan.read_attribute(edit_bones, attribute, dtype, size)[rows].ravel().tolist()
+
+    set_mode(obj, 'OBJECT')
+    pose_bones = obj.pose.bones
+    widget_bones = dict((make_widget_name(name, obj.name), name) for name in obj.data.bones.keys())
+
+    try:
+        pose = dict()
+        created_set = set(created)
+        for name in names:
+            pb = pose_bones[name]
+            values = [[key, value] for key, value in read_pose_attributes(pb).items()
+                      if value != POSE_DEFAULTS[key] or name not in created_set]
+            if pb.custom_shape:
+                shape = pb.custom_shape.name
+                values.append(['custom_shape', {'widget': widget_bones[shape]} if shape in widget_bones
+                               else {'object': shape}])
+            if pb.custom_shape_transform:
+                values.append(['custom_shape_transform', pb.custom_shape_transform.name])
+            if pb.bone_group:
+                values.append(['bone_group', pb.bone_group.name])
+            props = [[key, get_id_property_value(pb[key])] for key in pb.keys() if key not in SKIPPED_PROPS]
+            if values or props:
+                pose[name] = {'values': values, 'props': props}
+
+        foreign = set(tuple(c) for c in record['constraints'])
+        constraints = []
+        for name in created + sorted(set(owner for owner, cns in foreign)):
+            for cns in pose_bones[name].constraints:
+                if name in created or (name, cns.name) in foreign:
+                    constraints.append([name, cns.name, cns.type, read_properties(cns, obj)])
+
+        drivers = []
+        for path, index in record['drivers']:
+            fcurve = obj.animation_data.drivers.find(path, index=index)
+            driver = fcurve.driver
+            variables = [[var.name, var.type, [read_properties(target, obj, exclude=()) for target in var.targets]]
+                         for var in driver.variables]
+            modifiers = [[modifier.type, read_properties(modifier, obj)] for modifier in fcurve.modifiers]
+            drivers.append({'path': path, 'index': index, 'type': driver.type, 'expression': driver.expression,
+                            'use_self': driver.use_self, 'variables': variables, 'modifiers': modifiers})
+
+        meshes = []
+        mesh_index = dict()
+        widget_list = []
+        for name in widgets:
+            widget = bpy.data.objects[name]
+            bone = widget_bones.get(name)
+            if bone is None or widget.type != 'MESH':
+                raise CacheMiss("widget %s is not placed on a bone" % name)
+            if widget.data.name not in mesh_index:
+                shape = read_mesh_shape(widget.data)
+                if shape is None:
+                    raise CacheMiss("widget %s has faces" % name)
+                mesh_index[widget.data.name] = len(meshes)
+                meshes.append([np.round(shape[0], 6).ravel().tolist(), shape[1].ravel().tolist()])
+            widget_list.append([bone, mesh_index[widget.data.name]])
+
+    except CacheMiss:
+        return None
+
+    return {'bones': bones,
+            'pose': pose,
+            'constraints': constraints,
+            'drivers': drivers,
+            'widgets': widget_list,
+            'meshes': meshes,
+            'references': sorted(references),
+            'scripts': scripts}
+
+
+#######################################################################################################################
+# Replay
+#######################################################################################################################
+
+
+def replay(obj, entry):
+    """
+    Writes a cache entry to obj: bones are created in one sweep and written with foreach_set, then pose data,
+    constraints, drivers and widgets are written in a single OBJECT mode pass
+    :param obj: the armature object
+    :param entry: cache entry made by capture
+    :return: False, leaving obj untouched, when the bones the entry creates exist or the ones it uses don't
+    :rtype: bool
+    """
+
+    bones = entry['bones']
+    names = bones['names']
+    created = names[:bones['created']]
+
+    set_mode(obj, 'EDIT')
+    edit_bones = obj.data.edit_bones
+
+    if any(name in edit_bones for name in created):
+        return False
+    existing = set(names[len(created):]) | set(entry['references']) | set(p for p in bones['parents'] if p)
+    if any(name not in edit_bones for name in existing - set(created)):
+        return False
+
+    for name in created:
+        edit_bones.new(name)
+
+    index = dict((name, i) for i, name in enumerate(edit_bones.keys()))
+    rows = [index[name] for name in names]
+
+    # connected bones would snap to their old parent
+    for name in names:
+        edit_bones[name].use_connect = False
+
+    for attribute, dtype, size in EDIT_ATTRIBUTES:
+        if attribute in bones:
+            values = BonePlan.read_attribute(edit_bones, attribute, dtype, size)
+            values[rows] = np.array(bones[attribute], dtype=dtype).reshape(-1, size)
+            edit_bones.foreach_set(attribute, values.ravel())
+
+    for name, parent, use_connect in zip(names, bones['parents'], bones['use_connect']):
+        edit_bones[name].parent = edit_bones[parent] if parent else None
+        edit_bones[name].use_connect = use_connect
+
+    set_mode(obj, 'OBJECT')
+    pose_bones = obj.pose.bones
+
+    meshes = [None] * len(entry['meshes'])
+    for bone, i in entry['widgets']:
+        widget = create_widget(obj, bone)
+        if widget is None:
+            continue
+        if meshes[i] is None:
+            verts, edges = entry['meshes'][i]
+            write_mesh_shape(widget.data, np.array(verts).reshape(-1, 3), np.array(edges).reshape(-1, 2))
+            meshes[i] = widget.data
+        else:
+            old_mesh = widget.data
+            widget.data = meshes[i]
+            if old_mesh.users == 0:
+                bpy.data.meshes.remove(old_mesh)
+
+    for name, pose in entry['pose'].items():
+        pb = pose_bones[name]
+        for key, value in pose['values']:
+            if key == 'custom_shape':
+                value = bpy.data.objects.get(make_widget_name(value['widget'], obj.name) if 'widget' in value
+                                             else value['object'])
+            elif key == 'custom_shape_transform':
+                value = pose_bones[value]
+            elif key == 'bone_group':
+                groups = obj.pose.bone_groups
+                value = groups[value] if value in groups else groups.new(value)
+            setattr(pb, key, value)
+        for key, value in pose['props']:
+            pb[key] = value
+
+    for owner, name, cns_type, properties in entry['constraints']:
+        cns = pose_bones[owner].constraints.new(cns_type)
+        cns.name = name
+        write_properties(cns, properties, obj)
+
+    for recorded in entry['drivers']:
+        # without an index driver_add drives every channel of an array property and returns a list
+        fcurve = obj.driver_add(recorded['path'], recorded['index']) if recorded['index'] is not None else \
+            obj.driver_add(recorded['path'])
+        driver = fcurve.driver
+        driver.type = recorded['type']
+        driver.expression = recorded['expression']
+        driver.use_self = recorded['use_self']
+        for name, var_type, targets in recorded['variables']:
+            var = driver.variables.new()
+            var.name = name
+            var.type = var_type
+            for target, properties in zip(var.targets, targets):
+                # the id is only accepted once its type is set
+                write_properties(target, sorted(properties, key=lambda p: p[0] != 'id_type'), obj)
+        modifiers = list(fcurve.modifiers)
+        for i, (modifier_type, properties) in enumerate(recorded['modifiers']):
+            if i < len(modifiers) and modifiers[i].type == modifier_type:
+                modifier = modifiers[i]
+            else:
+                modifier = fcurve.modifiers.new(modifier_type)
+            write_properties(modifier, properties, obj)
+        for modifier in modifiers[len(recorded['modifiers']):]:
+            fcurve.modifiers.remove(modifier)
+
+    return True
@@ -0,0 +1,168 @@
+import bpy
+from functools import wraps
+
+from .topology import ArmatureTopology
+
+
+class GenerationContext:
+    """
+    Per-armature state shared by all the rigs taking part in a generation.
+    Tracks the object mode so that redundant mode switches become no-ops
+    and holds the armature topology snapshot
+    """
+
+    _contexts = dict()
+
+    def __init__(self, obj):
+        """
+
+        :param obj: the armature object being generated
+        """
+
+        self.obj = obj
+        self.rig_id = self.get_rig_id(obj)
+
+        self.transitions = 0    # real bpy.ops.object.mode_set calls
+        self.elided = 0         # requested switches that were already satisfied
+
+        # BaseRig.end_generation runs the post-generation passes when the last rig ends,
+        # a generator running them itself turns it off
+        self.post_generation = True
+
+        self._topology = None
+        self._caches = dict()
+
+    @staticmethod
+    def get_rig_id(obj):
+        """
+        Rigify stamps a fresh rig_id on the armature data every generation
+        :param obj:
+        :return:
+        """
+
+        return obj.data.get('rig_id', None)
+
+    @classmethod
+    def get(cls, obj):
+        """
+        Returns the context of obj, creating a new one on a new generation
+        :param obj:
+        :return:
+        :rtype: GenerationContext
+        """
+
+        context = cls._contexts.get(obj.name)
+
+        if context is None or context.obj != obj or context.rig_id != cls.get_rig_id(obj):
+            context = cls(obj)
+            cls._contexts[obj.name] = context
+
+        return context
+
+    @classmethod
+    def release(cls, obj):
+        """
+        Drops the context of obj. Next call to get will start a new generation
+        :param obj:
+        :return:
+        """
+
+        if obj.name in cls._contexts:
+            del cls._contexts[obj.name]
+
+    @property
+    def mode(self):
+        return self.obj.mode
+
+    def set_mode(self, mode):
+        """
+        Switches obj to mode only if it is not already there
+        :param mode: 'EDIT', 'OBJECT' or 'POSE'
+        :return:
+        """
+
+        if self.obj.mode == mode:
+            self.elided += 1
+            return
+
+        bpy.ops.object.mode_set(mode=mode)
+        self.transitions += 1
+
+    @property
+    def topology(self):
+        """
+        The armature topology, built on first access of the generation
+        :return:
+        :rtype: ArmatureTopology
+        """
+
+        if self._topology is None:
+            self.set_mode('EDIT')
+            self._topology = ArmatureTopology(self.obj)
+
+        return self._topology
+
+    @topology.setter
+    def topology(self, topology):
+        """
+        Sets the topology the rigs are built from, when it is not the one of obj as it is now
+        :param topology:
+        :return:
+        """
+
+        self._topology = topology
+
+    def get_cache(self, key, factory):
+        """
+        Returns the per-generation object stored under key, building it with factory on first request
+        :param key:
+        :param factory: callable with no arguments
+        :return:
+        """
+
+        if key not in self._caches:
+            self._caches[key] = factory()
+
+        return self._caches[key]
+
+    def drop_cache(self, key):
+        self._caches.pop(key, None)
+
+    def get_mode_stats(self):
+        """
+        Returns the mode switch counters
+        :return:
+        :rtype: dict
+        """
+
+        return {'transitions': self.transitions, 'elided': self.elided}
+
+
+def set_mode(obj, mode):
+    """
+    Scheduled replacement for bpy.ops.object.mode_set
+    :param obj: the armature object
+    :param mode:
+    :return:
+    """
+
+    GenerationContext.get(obj).set_mode(mode)
+
+
+def requires_mode(mode):
+    """
+    Decorator declaring the mode a rig pass needs. The pass owner must have an obj attribute
+    :param mode:
+    :return:
+    """
+
+    def decorator(method):
+
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            set_mode(self.obj, mode)
+            return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -1,10 +1,13 @@
 import bpy
+import time
 
 from rigify.utils import make_deformer_name, make_mechanism_name
 from rigify.utils import strip_org, copy_bone, put_bone
 
 from .base_rig import BaseRig
-from .utils import make_constraints_from_string
+from .control_snapper import ControlPositionIndex
+from .generation_context import GenerationContext, requires_mode, set_mode
+from .profiler import GenerationProfiler
 
 class Rig(BaseRig):
 
@@ -14,26 +17,41 @@ class Rig(BaseRig):
         super().__init__(obj, bone_name, params)
 
         self.glue_mode = params.glue_mode
-        self.bones['ctrl']['all_ctrls'] = self.get_all_armature_ctrls()
 
         self.bbones = params.bbones
 
+        self.bridged = False
+        self.glued = False
+
+        # all the glue bones of the generation are glued together by glue_all
+        GenerationContext.get(obj).get_cache('glue_rigs', list).append(self)
+
+    @property
+    def ctrl_position_index(self):
+        """
+        Position index of all the armature ctrls, shared by all the glue bones of the generation.
+        It is built on first use, when the regular rigs are already generated
+        :return:
+        :rtype: ControlPositionIndex
+        """
+
+        context = GenerationContext.get(self.obj)
+
+        def build():
+            context.set_mode('EDIT')
+            return ControlPositionIndex(self.obj)
+
+        return context.get_cache('ctrl_position_index', build)
+
     def get_all_armature_ctrls(self):
         """
         Get all the ctrl bones in self.obj armature
         :return:
         """
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pose_bones = self.obj.pose.bones
-        all_ctrls = []
 
-        for pb in pose_bones:
-            forbidden_layers = pb.bone.layers[-4:]
-            if not (True in forbidden_layers):
-                all_ctrls.append(pb.name)
-
-        return all_ctrls
+        return list(self.ctrl_position_index.names)
 
+    @requires_mode('EDIT')
     def get_ctrls_by_position(self, position, groups=None, relative_error=0):
         """
         Returns the controls closest to position in given relative_error range and subchain
@@ -47,20 +65,17 @@ class Rig(BaseRig):
         :rtype: list(str)
         """
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        edit_bones = self.obj.data.edit_bones
+        if not relative_error:
+            relative_error = self.POSITION_RELATIVE_ERROR
 
-        bones_in_range = []
+        if not groups:
+            return self.ctrl_position_index.find(position, relative_error)
 
-        if groups:
-            keys = groups
-        else:
-            keys = self.bones['ctrl'].keys()
+        edit_bones = self.obj.data.edit_bones
 
-        if not relative_error:
-            relative_error = self.POSITION_RELATIVE_ERROR
+        bones_in_range = []
 
-        for k in keys:
+        for k in groups:
             for name in self.bones['ctrl'][k]:
                 error = edit_bones[name].length * relative_error
                 if (edit_bones[name].head - position).magnitude <= error:
@@ -81,7 +96,7 @@ class Rig(BaseRig):
         if not self.params.add_glue_def:
             return
 
-        bpy.ops.object.mode_set(mode='EDIT')
+        set_mode(self.obj, 'EDIT')
         edit_bones = self.obj.data.edit_bones
 
         def_bone = make_deformer_name(strip_org(self.base_bone))
@@ -92,8 +107,8 @@ class Rig(BaseRig):
         edit_bones[def_bone].layers = DEF_LAYER
         edit_bones[def_bone].use_deform = True
 
+    @requires_mode('EDIT')
     def create_mch(self):
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         mch_bone = make_mechanism_name(strip_org(self.base_bone))
@@ -114,33 +129,30 @@ class Rig(BaseRig):
             put_bone(self.obj, mch_bone, edit_bones[b].tail)
             edit_bones[mch_bone].layers = MCH_LAYER
 
+    @requires_mode('EDIT')
     def make_glue_constraints(self):
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pose_bones = self.obj.pose.bones
+        edit_bones = self.obj.data.edit_bones
 
         # Glue bones Constraints
         glue_bone = self.base_bone
-        head_ctrls = self.get_ctrls_by_position(pose_bones[glue_bone].head)
+        head_ctrls = self.get_ctrls_by_position(edit_bones[glue_bone].head)
         if not head_ctrls:
             return
-        tail_ctrls = self.get_ctrls_by_position(pose_bones[glue_bone].tail)
+        tail_ctrls = self.get_ctrls_by_position(edit_bones[glue_bone].tail)
         if not tail_ctrls:
             return
 
         # todo solve for tail_ctrls and head_ctrl len > 1
-        owner_pb = pose_bones[tail_ctrls[0]]
-        make_constraints_from_string(owner_pb, target=self.obj, subtarget=head_ctrls[0],
-                                     fstring=self.params.glue_string)
+        owner = tail_ctrls[0]
+        self.constraint_plan.add(owner, subtarget=head_ctrls[0], fstring=self.params.glue_string)
 
         if 'glue_def' in self.bones:
-            owner_pb = pose_bones[self.bones['glue_def']]
-            make_constraints_from_string(owner_pb, target=self.obj, subtarget=head_ctrls[0],
-                                         fstring="CL1.0WW0.0")
-            make_constraints_from_string(owner_pb, target=self.obj, subtarget=tail_ctrls[0],
-                                         fstring="DT1.0#ST1.0")
+            owner = self.bones['glue_def']
+            self.constraint_plan.add(owner, subtarget=head_ctrls[0], fstring="CL1.0WW0.0")
+            self.constraint_plan.add(owner, subtarget=tail_ctrls[0], fstring="DT1.0#ST1.0")
 
+    @requires_mode('EDIT')
     def make_def_mediation(self):
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         def_parent = self.get_def_by_org(edit_bones[self.base_bone].parent.name)
@@ -154,21 +166,16 @@ class Rig(BaseRig):
 
         edit_bones[self.bones['glue_mch']].parent = edit_bones[def_parent]
 
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pose_bones = self.obj.pose.bones
-
-        owner_pb = pose_bones[self.bones['glue_mch']]
+        owner = self.bones['glue_mch']
         subtarget = def_child
-        make_constraints_from_string(owner_pb, target=self.obj, subtarget=subtarget,
-                                     fstring="CR0.5LLO")
+        self.constraint_plan.add(owner, subtarget=subtarget, fstring="CR0.5LLO")
 
-        owner_pb = pose_bones[self.base_bone]
+        owner = self.base_bone
         subtarget = self.bones['glue_mch']
-        make_constraints_from_string(owner_pb, target=self.obj, subtarget=subtarget,
-                                     fstring="CT1.0WW")
+        self.constraint_plan.add(owner, subtarget=subtarget, fstring="CT1.0WW")
 
+    @requires_mode('EDIT')
     def make_bridge(self):
-        bpy.ops.object.mode_set(mode='EDIT')
         edit_bones = self.obj.data.edit_bones
 
         glue_bone = self.base_bone
@@ -187,26 +194,35 @@ class Rig(BaseRig):
         edit_bones[self.bones['glue_mch'][1]].parent = edit_bones[tail]
         edit_bones[self.bones['glue_def']].parent = edit_bones[self.bones['glue_mch'][0]]
 
-        bpy.ops.object.mode_set(mode='OBJECT')
+        # CNS
+        self.constraint_plan.add(self.bones['glue_def'], subtarget=tail, fstring="ST1.0")
+        self.constraint_plan.add(glue_bone, subtarget=head, fstring="CT1.0WW")
+
+        self.bridged = True
+
+    @requires_mode('OBJECT')
+    def make_bridge_handles(self):
+        """
+        Bridge bbone settings, they live on bones and pose bones so they are set in OBJECT mode
+        :return:
+        """
+
+        if not self.bridged:
+            return
+
         pose_bones = self.obj.pose.bones
 
         self.obj.data.bones[self.bones['glue_def']].bbone_segments = self.bbones
 
-        # CNS
         def_pb = pose_bones[self.bones['glue_def']]
-        make_constraints_from_string(def_pb, target=self.obj, subtarget=tail, fstring="ST1.0")
-
-        owner_pb = pose_bones[glue_bone]
-        make_constraints_from_string(owner_pb, target=self.obj, subtarget=head, fstring="CT1.0WW")
-
         if 'bbone_custom_handle_start' in dir(def_pb) and 'bbone_custom_handle_end' in dir(def_pb):
             def_pb.bbone_custom_handle_start = pose_bones[self.bones['glue_mch'][0]]
             def_pb.bbone_custom_handle_end = pose_bones[self.bones['glue_mch'][1]]
             def_pb.use_bbone_custom_handles = True
 
-    def glue(self):
+    def glue_edit(self):
         """
-        Glue pass
+        EDIT mode part of the glue pass: creates the glue bones, parents them and plans the constraints
         :return:
         """
 
@@ -221,6 +237,75 @@ class Rig(BaseRig):
             self.create_mch()
             self.make_bridge()
 
+    def glue_pose(self):
+        """
+        OBJECT mode part of the glue pass: bridge handles and planned constraints
+        :return:
+        """
+
+        if self.glue_mode == "bridge":
+            self.make_bridge_handles()
+
+        self.apply_constraints()
+
+    @classmethod
+    def glue_all(cls, obj):
+        """
+        Glues all the glue bones of the generation not glued yet: every bone is created in a single EDIT session
+        and every constraint in a single OBJECT sweep
+        :param obj: the armature object
+        :return: per glue mode rig counts, mode switches and timings of the two stages
+        :rtype: dict
+        """
+
+        context = GenerationContext.get(obj)
+        rigs = [rig for rig in context.get_cache('glue_rigs', list) if not rig.glued]
+
+        if not rigs:
+            return None
+
+        start_stats = context.get_mode_stats()
+
+        context.set_mode('EDIT')
+        start = time.perf_counter()
+        for rig in rigs:
+            rig.glue_edit()
+        edit_time = time.perf_counter() - start
+
+        context.set_mode('OBJECT')
+        start = time.perf_counter()
+        for rig in rigs:
+            rig.glue_pose()
+            rig.glued = True
+        pose_time = time.perf_counter() - start
+
+        end_stats = context.get_mode_stats()
+
+        stats = dict()
+        stats['modes'] = {mode: 0 for mode in ('glue', 'def_mediator', 'bridge')}
+        for rig in rigs:
+            stats['modes'][rig.glue_mode] += 1
+        stats['edit_time'] = edit_time
+        stats['pose_time'] = pose_time
+        stats['transitions'] = end_stats['transitions'] - start_stats['transitions']
+        stats['elided'] = end_stats['elided'] - start_stats['elided']
+
+        profiler = GenerationProfiler.get(obj)
+        if profiler is not None:
+            profiler.stats['glue'] = stats
+
+        cls.end_generation(obj)
+
+        return stats
+
+    def glue(self):
+        """
+        Glue pass. The first glue bone reaching it glues all the glue bones of the generation at once
+        :return:
+        """
+
+        if not self.glued:
+            self.glue_all(self.obj)
 
     def generate(self):
         """
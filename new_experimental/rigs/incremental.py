@@ -0,0 +1,493 @@
+import bpy
+import json
+import re
+import uuid
+
+from .generation_cache import GenerationCache, get_module_version, get_bone_states, capture, replay
+from .generation_context import GenerationContext
+from .profiler import GenerationProfiler
+from .utils import get_rig_type, get_id_property_value, make_widget_name, ORG_PREFIX, WGT_PREFIX
+from .widgets import collect_widgets
+
+RECORDS_KEY = 'rig_records'     # armature data property: json of what every rig of the last generation produced
+GLUE_GROUP = '__glue__'         # glue bones are glued all at once, their outputs are recorded together
+STAGING_SUFFIX = '.staging'
+
+SYNCED_ATTRIBUTES = ['layers', 'use_deform', 'use_inherit_rotation', 'use_inherit_scale', 'use_local_location',
+                     'bbone_segments', 'bbone_in', 'bbone_out', 'bbone_x', 'bbone_z']
+
+BONE_PATH = re.compile(r'pose\.bones\["([^"]+)"\]')
+
+
+def read_records(obj):
+    """
+    Records of the last generation of obj, None if it was not generated by IncrementalGenerator
+    :param obj:
+    :return: {'rigs': base bone -> record, 'glue': record or None}
+    :rtype: dict
+    """
+
+    records = obj.data.get(RECORDS_KEY)
+
+    if not records:
+        return None
+
+    return json.loads(records)
+
+
+def write_records(obj, records):
+    obj.data[RECORDS_KEY] = json.dumps(records, sort_keys=True, separators=(',', ':'))
+
+
+def get_armature_state(obj):
+    """
+    Names of the bones, constraints and drivers of obj. Taken in OBJECT mode, where the pose is in sync
+    :param obj:
+    :return:
+    :rtype: tuple(set)
+    """
+
+    GenerationContext.get(obj).set_mode('OBJECT')
+
+    bones = set(obj.data.bones.keys())
+    constraints = set((pb.name, cns.name) for pb in obj.pose.bones for cns in pb.constraints)
+    drivers = set()
+    if obj.animation_data:
+        drivers = set((fcurve.data_path, fcurve.array_index) for fcurve in obj.animation_data.drivers)
+
+    return bones, constraints, drivers
+
+
+def record_outputs(obj, state):
+    """
+    What was added to obj since state: new bones, constraints on bones that existed before and new drivers.
+    Constraints of the new bones go away with them
+    :param obj:
+    :param state: get_armature_state before the passes
+    :return: the record and the names of the bones its outputs refer to, the new ones excluded
+    :rtype: tuple(dict, set)
+    """
+
+    bones_before, constraints_before, drivers_before = state
+    bones_after, constraints_after, drivers_after = get_armature_state(obj)
+
+    bones = [name for name in obj.data.bones.keys() if name not in bones_before]
+    constraints = sorted((owner, name) for owner, name in constraints_after - constraints_before
+                         if owner in bones_before)
+    drivers = sorted(drivers_after - drivers_before)
+
+    pose_bones = obj.pose.bones
+    referenced = set()
+
+    for name in bones:
+        parent = obj.data.bones[name].parent
+        if parent:
+            referenced.add(parent.name)
+        referenced.update(getattr(cns, 'subtarget', '') for cns in pose_bones[name].constraints)
+
+    for owner, name in constraints:
+        referenced.add(owner)
+        referenced.add(getattr(pose_bones[owner].constraints[name], 'subtarget', ''))
+
+    for path, index in drivers:
+        referenced.update(BONE_PATH.findall(path))
+        fcurve = obj.animation_data.drivers.find(path, index=index)
+        for variable in fcurve.driver.variables:
+            for target in variable.targets:
+                if target.id == obj:
+                    referenced.add(target.bone_target)
+                    referenced.update(BONE_PATH.findall(target.data_path))
+
+    referenced.difference_update(bones)
+    referenced.discard('')
+
+    record = {'bones': bones,
+              'constraints': [list(c) for c in constraints],
+              'drivers': [list(d) for d in drivers],
+              'references': []}
+
+    return record, referenced
+
+
+def make_rig(obj, bone_name):
+    pose_bone = obj.pose.bones[bone_name]
+    return get_rig_type(pose_bone.rigify_type).Rig(obj, bone_name, pose_bone.rigify_parameters)
+
+
+class IncrementalGenerator:
+    """
+    Generates a metarig into an armature, regenerating only the rigs whose inputs changed.
+    The armature data keeps, for every rig of the last generation, its input hash and the bones, constraints
+    and drivers it produced. A rig is torn down and rebuilt when its hash changed or when a rig it depends on is:
+    the rigs named by its get_dependencies and the rigs owning the bones its outputs refer to.
+    Glue bones match ctrls by position, they are all rebuilt as soon as any rig is.
+    Rigs to build whose inputs were generated before, in this armature or another one, are replayed from the
+    GenerationCache instead of running their passes.
+    Rigify's generate operator does not use it: it runs through generate() below, e.g. from headless.generate
+    or a script inside blender
+    """
+
+    def __init__(self, metarig, obj=None, name='rig'):
+        """
+
+        :param metarig: metarig armature object
+        :param obj: armature generated from metarig before, None for a new armature
+        :param name: name of the new armature
+        """
+
+        self.metarig = metarig
+        self.obj = obj
+        self.name = name
+
+        self.rigs = []      # rigs generated by the last generate call
+        self.scripts = []   # ui scripts of the rigs generated by the last generate call
+        self.stats = dict()
+
+    def copy_metarig(self, name):
+        """
+        Copies the metarig to a new armature object with ORG- bones, as the generation starts from
+        :param name:
+        :return:
+        """
+
+        obj = self.metarig.copy()
+        obj.data = self.metarig.data.copy()
+        obj.name = name
+        obj.data.name = name
+        bpy.context.collection.objects.link(obj)
+        bpy.context.view_layer.objects.active = obj
+
+        for bone in list(obj.data.bones):
+            bone.name = ORG_PREFIX + bone.name
+
+        if RECORDS_KEY in obj.data:
+            del obj.data[RECORDS_KEY]
+        obj.data['rig_id'] = uuid.uuid4().hex[:16]
+
+        return obj
+
+    @staticmethod
+    def get_rig_bones(topology):
+        """
+        Bones with a rigify_type, parents first as rigify sorts them
+        :param topology:
+        :return:
+        """
+
+        depths = dict()
+        for name in topology.names:
+            parent = topology.get_parent(name)
+            depths[name] = depths[parent] + 1 if parent is not None else 0
+
+        return sorted((name for name in topology.names if topology.get_rigify_type(name)), key=lambda b: depths[b])
+
+    @staticmethod
+    def get_dirty_rigs(records, hashes, dependencies, glue):
+        """
+        Rigs to regenerate and rigs of the last generation to tear down
+        :param records: records of the last generation
+        :param hashes: base bone -> input hash of the rigs to generate
+        :param dependencies: base bone -> get_dependencies of the rigs to generate
+        :param glue: base bones of the glue rigs
+        :return: dirty base bones, the base bones whose outputs are torn down (GLUE_GROUP for the glue outputs)
+        :rtype: tuple(set)
+        """
+
+        old = records['rigs']
+
+        dirty = set(base for base in hashes if base not in old or old[base]['hash'] != hashes[base])
+        changed = dirty | (set(old) - set(hashes))
+
+        while True:
+            if changed and (glue or records['glue']):
+                dirty.update(glue)
+                changed.update(glue)
+                changed.add(GLUE_GROUP)
+
+            grown = set(base for base in hashes if base not in dirty and
+                        changed.intersection(dependencies[base] + old.get(base, {}).get('references', [])))
+            if not grown:
+                break
+
+            dirty.update(grown)
+            changed.update(grown)
+
+        teardown = set(base for base in changed if base in old)
+        if GLUE_GROUP in changed and records['glue']:
+            teardown.add(GLUE_GROUP)
+
+        return dirty, teardown
+
+    def remove_outputs(self, obj, records, everything=False):
+        """
+        Removes the drivers, constraints, bones and widgets recorded in records
+        :param obj:
+        :param records:
+        :param everything: remove all the bones and drivers of obj, it has no records
+        :return:
+        """
+
+        context = GenerationContext.get(obj)
+        context.set_mode('OBJECT')
+
+        bones = []
+        pose_bones = obj.pose.bones
+
+        if everything:
+            if obj.animation_data:
+                for fcurve in list(obj.animation_data.drivers):
+                    obj.driver_remove(fcurve.data_path, fcurve.array_index)
+            bones = obj.data.bones.keys()
+
+        for record in records:
+            for path, index in record['drivers']:
+                obj.driver_remove(path, index)
+            for owner, name in record['constraints']:
+                pose_bone = pose_bones.get(owner)
+                if pose_bone and name in pose_bone.constraints:
+                    pose_bone.constraints.remove(pose_bone.constraints[name])
+            bones.extend(record['bones'])
+
+        context.set_mode('EDIT')
+        edit_bones = obj.data.edit_bones
+
+        for name in bones:
+            edit_bone = edit_bones.get(name)
+            if edit_bone:
+                edit_bones.remove(edit_bone)
+            widget = bpy.data.objects.get(make_widget_name(name, obj.name))
+            if widget:
+                bpy.data.objects.remove(widget, do_unlink=True)
+
+        return len(bones)
+
+    def sync_org_bones(self, obj, staging, topology, names, produced):
+        """
+        Writes the ORG bones names of obj as they are in the staging copy of the metarig, creating the missing
+        ones. ORG bones that left the metarig are removed
+        :param obj:
+        :param staging: metarig copy, in OBJECT mode
+        :param topology: topology of staging
+        :param names: ORG bones to write
+        :param produced: bones of obj produced by the rigs that are kept
+        :return:
+        """
+
+        bones = staging.data.bones
+        pose_bones = staging.pose.bones
+        attributes = dict()
+        pose = dict()
+
+        for name in names:
+            attributes[name] = [get_id_property_value(getattr(bones[name], a)) for a in SYNCED_ATTRIBUTES]
+            params = pose_bones[name].rigify_parameters
+            pose[name] = (pose_bones[name].rigify_type,
+                          dict((key, get_id_property_value(params[key])) for key in params.keys()))
+
+        bpy.context.view_layer.objects.active = obj
+        context = GenerationContext.get(obj)
+        context.set_mode('EDIT')
+        edit_bones = obj.data.edit_bones
+
+        for name in edit_bones.keys():
+            if name.startswith(ORG_PREFIX) and name not in topology and name not in produced:
+                edit_bones.remove(edit_bones[name])
+
+        for name in names:
+            edit_bone = edit_bones.get(name) or edit_bones.new(name)
+            edit_bone.use_connect = False
+            edit_bone.head = topology.get_head(name)
+            edit_bone.tail = topology.get_tail(name)
+            edit_bone.roll = topology.get_roll(name)
+            for attribute, value in zip(SYNCED_ATTRIBUTES, attributes[name]):
+                setattr(edit_bone, attribute, value)
+
+        for name in names:
+            parent = topology.get_parent(name)
+            edit_bones[name].parent = edit_bones[parent] if parent is not None else None
+            edit_bones[name].use_connect = topology.is_connected(name)
+
+        context.set_mode('OBJECT')
+
+        for name in names:
+            rigify_type, values = pose[name]
+            params = obj.pose.bones[name].rigify_parameters
+            obj.pose.bones[name].rigify_type = rigify_type
+            for key in params.keys():
+                if key not in values:
+                    del params[key]
+            for key, value in values.items():
+                params[key] = value
+
+    def generate(self):
+        """
+        Generates the metarig. Without an armature to update, the staging copy of the metarig becomes the armature
+        and every rig is generated. Otherwise the torn down rigs are regenerated on it and the staging copy,
+        only used to hash the rig inputs, is deleted
+        :return: the generated armature object
+        """
+
+        if bpy.context.object is not None and bpy.context.object.mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT')
+
+        full = self.obj is None
+        staging = self.copy_metarig(self.name if full else self.obj.name + STAGING_SUFFIX)
+        topology = GenerationContext.get(staging).topology
+
+        staged = [make_rig(staging, name) for name in self.get_rig_bones(topology)]
+        hashes = dict((rig.base_bone, rig.get_input_hash()) for rig in staged)
+        dependencies = dict((rig.base_bone, rig.get_dependencies()) for rig in staged)
+        glue = set(rig.base_bone for rig in staged if hasattr(rig, 'glue'))
+
+        records = None if full else read_records(self.obj)
+
+        if full:
+            obj = staging
+            rigs = staged
+            records = {'rigs': dict(), 'glue': None}
+            self.stats = {'removed_bones': 0}
+        else:
+            obj = self.obj
+            everything = records is None
+            if everything:
+                records = {'rigs': dict(), 'glue': None}
+                dirty, teardown = set(hashes), set()
+            else:
+                dirty, teardown = self.get_dirty_rigs(records, hashes, dependencies, glue)
+
+            GenerationContext.get(staging).set_mode('OBJECT')
+            bpy.context.view_layer.objects.active = obj
+
+            obj.data['rig_id'] = uuid.uuid4().hex[:16]
+            context = GenerationContext.get(obj)
+            context.topology = topology
+
+            removed = [records['glue'] if base == GLUE_GROUP else records['rigs'][base] for base in teardown]
+            self.stats = {'removed_bones': self.remove_outputs(obj, removed, everything)}
+            if GLUE_GROUP in teardown:
+                records['glue'] = None
+            for base in teardown:
+                records['rigs'].pop(base, None)
+            for base in set(records['rigs']) - set(hashes):
+                del records['rigs'][base]
+
+            kept = set()
+            for rig in staged:
+                if rig.base_bone not in dirty:
+                    kept.update(rig.bones['org'])
+            produced = set()
+            for record in records['rigs'].values():
+                produced.update(record['bones'])
+            if records['glue']:
+                produced.update(records['glue']['bones'])
+
+            self.sync_org_bones(obj, staging, topology, [n for n in topology.names if n not in kept], produced)
+
+            context.set_mode('EDIT')
+            rigs = [make_rig(obj, rig.base_bone) for rig in staged if rig.base_bone in dirty]
+
+            GenerationContext.release(staging)
+            staging_data = staging.data
+            bpy.data.objects.remove(staging, do_unlink=True)
+            bpy.data.armatures.remove(staging_data)
+
+        # widgets are collected below, once the custom shapes of the replayed rigs are assigned too
+        GenerationContext.get(obj).post_generation = False
+
+        cache = GenerationCache.get()
+        versions = dict((rig.base_bone, get_module_version(type(rig))) for rig in staged)
+        references = dict()
+        self.scripts = []
+        replayed = 0
+
+        for rig in rigs:
+            base = rig.base_bone
+            module = type(rig).__module__.split('.')[-1]
+            key = GenerationCache.make_key(hashes[base], versions[base],
+                                           [(dep, hashes.get(dep), versions.get(dep)) for dep in dependencies[base]])
+
+            state = get_armature_state(obj)
+            entry = cache.load(module, versions[base], key) if cache and base not in glue else None
+            if entry is not None and replay(obj, entry):
+                scripts = entry['scripts']
+                replayed += 1
+            else:
+                entry = None
+                if cache and base not in glue:
+                    before = get_bone_states(obj)
+                    widgets = set(o.name for o in bpy.data.objects if o.name.startswith(WGT_PREFIX + obj.name + '_'))
+                scripts = rig.generate()
+
+            record, references[base] = record_outputs(obj, state)
+            record['hash'] = hashes[base]
+            records['rigs'][base] = record
+            if scripts:
+                self.scripts.append(scripts)
+
+            if cache and entry is None and base not in glue:
+                widgets = [o.name for o in bpy.data.objects
+                           if o.name.startswith(WGT_PREFIX + obj.name + '_') and o.name not in widgets]
+                after = get_bone_states(obj, list(before))
+                changed = [name for name in before if name in after and before[name] != after[name]]
+                entry = capture(obj, record, rig.bones['org'], changed, references[base], widgets, scripts)
+                if entry is not None:
+                    cache.store(module, versions[base], key, entry)
+
+        glue_rigs = [rig for rig in rigs if hasattr(rig, 'glue')]
+        if glue_rigs:
+            state = get_armature_state(obj)
+            for rig in glue_rigs:
+                rig.glue()
+            records['glue'], references[GLUE_GROUP] = record_outputs(obj, state)
+
+        GenerationContext.get(obj).set_mode('OBJECT')
+
+        for pb in obj.pose.bones:
+            widget = bpy.data.objects.get(make_widget_name(pb.name, obj.name))
+            if widget is not None and pb.custom_shape is None:
+                pb.custom_shape = widget
+
+        # every custom shape is assigned, stale and duplicate widgets can be collected
+        self.stats['widgets'] = collect_widgets(obj)
+        profiler = GenerationProfiler.get(obj)
+        if profiler is not None:
+            profiler.stats['widgets'] = self.stats['widgets']
+            profiler.write()
+
+        owners = dict()
+        for base, record in records['rigs'].items():
+            owners.update((name, base) for name in record['bones'])
+        if records['glue']:
+            owners.update((name, GLUE_GROUP) for name in records['glue']['bones'])
+
+        for base, names in references.items():
+            record = records['glue'] if base == GLUE_GROUP else records['rigs'][base]
+            record['references'] = sorted(set(owners[n] for n in names if n in owners) - {base})
+
+        write_records(obj, records)
+
+        self.obj = obj
+        self.rigs = rigs
+        self.stats['generated_rigs'] = len(rigs) - replayed
+        self.stats['replayed_rigs'] = replayed
+        if cache:
+            self.stats['cache'] = cache.get_report()
+        GenerationContext.get(obj).get_cache('generation_stats', dict).update(self.stats)
+
+        return obj
+
+
+def generate(metarig, obj=None, name='rig'):
+    """
+    Generates metarig, regenerating only what changed when obj was generated from it before
+    :param metarig: metarig armature object
+    :param obj: armature to update, None to generate a new one
+    :param name: name of the new armature
+    :return: the generated armature object and the rigs that were generated
+    :rtype: tuple
+    """
+
+    generator = IncrementalGenerator(metarig, obj, name)
+    obj = generator.generate()
+
+    return obj, generator.rigs
@@ -0,0 +1,126 @@
+import bpy
+import os
+from functools import wraps
+
+INSTRUMENT_ENV = "RIGS_INSTRUMENT"  # path of the summary table, instrumentation is off when unset
+
+COUNTERS = ['mode_set', 'copy_bone', 'put_bone', 'edit_bones.remove', 'constraints.new', 'driver_add']
+COUNTED_FUNCTIONS = ['copy_bone', 'put_bone']
+DRIVER_OWNERS = ['Object', 'PoseBone', 'Constraint']   # bpy.types whose driver_add calls are counted
+
+
+def get_instrument_path():
+    return os.environ.get(INSTRUMENT_ENV) or None
+
+
+def counted(function, count, accept=None):
+    """
+    Wraps function so that its calls are counted
+    :param function:
+    :param count: called with no argument for every counted call
+    :param accept: predicate on the call arguments, every call is counted if None
+    :return:
+    """
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        if accept is None or accept(*args, **kwargs):
+            count()
+        return function(*args, **kwargs)
+
+    wrapper.counted = True
+
+    return wrapper
+
+
+def is_mode_set(operator, *args, **kwargs):
+    return getattr(operator, '_module', None) == 'object' and getattr(operator, '_func', None) == 'mode_set'
+
+
+class CallCounters:
+    """
+    Counts the calls of COUNTERS while installed, GenerationProfiler installs them while a pass runs.
+    copy_bone and put_bone are replaced by a counted version in the rig module namespaces, mode_set is counted
+    on the python operator wrapper of bpy.ops, edit_bones.remove and constraints.new on the class of the
+    collections and driver_add on the bpy.types of DRIVER_OWNERS. Blender resolves the methods of its RNA
+    collections before python attributes: those counters can't be installed and are reported unavailable
+    """
+
+    def __init__(self, count):
+        """
+
+        :param count: called with the counter name for every counted call
+        """
+
+        self.count = count
+        self.namespaces = []    # globals of the modules the bone functions are counted in
+        self.originals = []     # (owner, name, original or None when inherited)
+        self.unavailable = set()
+
+    def add_namespace(self, namespace):
+        if not any(n is namespace for n in self.namespaces):
+            self.namespaces.append(namespace)
+
+    def replace(self, owner, name, counter, accept=None):
+        """
+        Replaces the attribute name of the class owner with its counted version
+        :return: True if the counted version is in place
+        :rtype: bool
+        """
+
+        function = getattr(owner, name, None)
+        if function is None:
+            return False
+        if getattr(function, 'counted', False):
+            return True
+
+        original = vars(owner).get(name)
+        try:
+            setattr(owner, name, counted(function, lambda: self.count(counter), accept))
+        except (TypeError, AttributeError):
+            return False
+
+        self.originals.append((owner, name, original))
+        return True
+
+    def install(self, obj):
+        """
+        Installs the counters
+        :param obj: the armature object being generated
+        :return:
+        """
+
+        for namespace in self.namespaces:
+            for name in COUNTED_FUNCTIONS:
+                function = namespace.get(name)
+                if callable(function) and not getattr(function, 'counted', False):
+                    self.originals.append((namespace, name, function))
+                    namespace[name] = counted(function, lambda name=name: self.count(name))
+
+        collections = [('mode_set', type(bpy.ops.object.mode_set), '__call__', is_mode_set),
+                       ('edit_bones.remove', type(obj.data.edit_bones), 'remove', None)]
+        if obj.pose and obj.pose.bones:
+            collections.append(('constraints.new', type(obj.pose.bones[0].constraints), 'new', None))
+
+        for counter, owner, name, accept in collections:
+            if not self.replace(owner, name, counter, accept):
+                self.unavailable.add(counter)
+
+        if not all([self.replace(getattr(bpy.types, owner), 'driver_add', 'driver_add')
+                    for owner in DRIVER_OWNERS if hasattr(bpy.types, owner)]):
+            self.unavailable.add('driver_add')
+
+    def remove(self):
+        """
+        Puts the original functions back
+        :return:
+        """
+
+        for owner, name, function in reversed(self.originals):
+            if isinstance(owner, dict):
+                owner[name] = function
+            elif function is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, function)
+        self.originals = []
@@ -31,6 +31,8 @@ class MeshyRig(ChainyRig):
 
         self.assign_layers()
         self.make_constraints()
+        self.apply_constraints()
+        self.apply_layers()
         self.create_widgets()
         rig_ui_script = self.make_drivers()
 
@@ -0,0 +1,243 @@
+import json
+import os
+import sys
+import time
+from inspect import isfunction
+
+from .generation_context import GenerationContext
+from .instrumentation import COUNTERS, CallCounters, get_instrument_path
+
+PROFILE_ENV = "RIGS_PROFILE"    # path of the json report, profiling is off when unset
+
+PASSES = ['orient_org_bones', 'create_mch', 'create_def', 'create_controls', 'parent_bones', 'aggregate_ctrls',
+          'assign_layers', 'make_constraints', 'apply_constraints', 'apply_layers', 'create_widgets', 'make_drivers',
+          'cleanup', 'glue']
+
+
+def get_profile_path():
+    return os.environ.get(PROFILE_ENV) or None
+
+
+class GenerationProfiler:
+    """
+    Opt-in profiler of the rig passes. Every pass of every rig instance records wall time, mode switches,
+    bones created and removed, constraints and drivers added, and the calls of the COUNTERS it made itself.
+    The report is written as json to the RIGS_PROFILE path and as folded stacks (flame graph input) next to it,
+    the calls summary table to the RIGS_INSTRUMENT path, every time a rig generate or glue pass ends
+    """
+
+    def __init__(self, obj, path, table_path=None):
+        """
+
+        :param obj: the armature object being generated
+        :param path: json report path, None to only write the summary table
+        :param table_path: calls summary table path, None to only write the json report
+        """
+
+        self.obj = obj
+        self.path = path
+        self.table_path = table_path
+        self.records = []   # one per rig instance
+        self.stack = []     # open frames
+        self.folded = dict()    # stack string -> self time in microseconds
+        self.stats = dict()     # stats of the passes run once per generation, e.g. glue
+        self.counters = CallCounters(self.count)    # installed while the outermost pass runs
+
+        package = __name__.rsplit('.', 1)[0]
+        for name, module in list(sys.modules.items()):
+            if module is not None and name.startswith(package + '.'):
+                self.counters.add_namespace(vars(module))
+
+    @staticmethod
+    def get(obj):
+        """
+        Returns the profiler of the generation or None if profiling and instrumentation are off
+        :param obj:
+        :return:
+        :rtype: GenerationProfiler
+        """
+
+        path = get_profile_path()
+        table_path = get_instrument_path()
+
+        if path is None and table_path is None:
+            return None
+
+        return GenerationContext.get(obj).get_cache('profiler', lambda: GenerationProfiler(obj, path, table_path))
+
+    @staticmethod
+    def instrument(rig):
+        """
+        Wraps the passes of a rig instance, and its generate, when profiling is on
+        :param rig: a BaseRig instance
+        :return:
+        """
+
+        profiler = GenerationProfiler.get(rig.obj)
+
+        if profiler is None:
+            return
+
+        record = {'rig': rig.__class__.__module__.split('.')[-1] + '.' + rig.__class__.__name__,
+                  'bone': rig.base_bone,
+                  'passes': []}
+        profiler.records.append(record)
+
+        # rig modules loaded from a base path are not in sys.modules
+        for cls in type(rig).__mro__:
+            for attribute in vars(cls).values():
+                if isfunction(attribute):
+                    profiler.counters.add_namespace(attribute.__globals__)
+                    break
+
+        for name in PASSES + ['generate']:
+            method = getattr(rig, name, None)
+            if callable(method):
+                setattr(rig, name, profiler.wrap(record, name, method))
+
+    def get_counters(self):
+        obj = self.obj
+
+        if obj.mode == 'EDIT':
+            bones = set(obj.data.edit_bones.keys())
+        else:
+            bones = set(obj.data.bones.keys())
+
+        constraints = sum(len(pb.constraints) for pb in obj.pose.bones)
+        drivers = len(obj.animation_data.drivers) if obj.animation_data else 0
+
+        return bones, constraints, drivers, GenerationContext.get(obj).transitions
+
+    def count(self, name):
+        """
+        Adds a call of the counter name to the innermost pass running
+        :param name:
+        :return:
+        """
+
+        if self.stack:
+            self.stack[-1]['calls'][name] += 1
+
+    def wrap(self, record, name, method):
+        """
+        Returns method timed and counted as the pass name of record
+        :param record:
+        :param name:
+        :param method:
+        :return:
+        """
+
+        frame_name = record['rig'] + ':' + record['bone']
+
+        def wrapper(*args, **kwargs):
+            # top frames carry the rig, passes called by other passes nest below them
+            label = name if self.stack else frame_name + ';' + name
+            frame = {'label': label, 'children_time': 0.0, 'calls': {counter: 0 for counter in COUNTERS}}
+            if not self.stack:
+                self.counters.install(self.obj)
+            self.stack.append(frame)
+            bones, constraints, drivers, transitions = self.get_counters()
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                end_bones, end_constraints, end_drivers, end_transitions = self.get_counters()
+                self.stack.pop()
+
+                if self.stack:
+                    self.stack[-1]['children_time'] += elapsed
+
+                stack = ';'.join([f['label'] for f in self.stack] + [label])
+                self_time = int((elapsed - frame['children_time']) * 1e6)
+                self.folded[stack] = self.folded.get(stack, 0) + self_time
+
+                record['passes'].append({'pass': name,
+                                         'time': elapsed,
+                                         'mode_switches': end_transitions - transitions,
+                                         'bones_created': len(end_bones - bones),
+                                         'bones_removed': len(bones - end_bones),
+                                         'constraints_added': end_constraints - constraints,
+                                         'drivers_added': end_drivers - drivers,
+                                         'calls': frame['calls']})
+
+                if not self.stack:
+                    self.counters.remove()
+                    if name in ('generate', 'glue'):
+                        self.write()
+
+        return wrapper
+
+    def get_report(self):
+        """
+        Returns the per rig records, their per pass totals and the generation level stats
+        :return:
+        :rtype: dict
+        """
+
+        totals = dict()
+        for record in self.records:
+            for entry in record['passes']:
+                total = totals.setdefault(entry['pass'], {key: 0 for key in entry if key not in ('pass', 'calls')})
+                for key in total:
+                    if key != 'calls':
+                        total[key] += entry[key]
+                calls = total.setdefault('calls', {counter: 0 for counter in COUNTERS})
+                for counter in COUNTERS:
+                    calls[counter] += entry['calls'][counter]
+
+        return {'armature': self.obj.name, 'rigs': self.records, 'totals': totals, 'stats': self.stats,
+                'unavailable_counters': sorted(self.counters.unavailable)}
+
+    def get_table(self):
+        """
+        Returns the calls summary table: a row per rig class and pass, a total row per rig class, heaviest rig first.
+        Counters that couldn't be installed show '-'
+        :return:
+        :rtype: str
+        """
+
+        order = {name: i for i, name in enumerate(PASSES + ['generate'])}
+        counts = dict()     # rig class -> pass -> counter -> calls
+        for record in self.records:
+            for entry in record['passes']:
+                calls = counts.setdefault(record['rig'], dict()).setdefault(
+                    entry['pass'], {counter: 0 for counter in COUNTERS})
+                for counter in COUNTERS:
+                    calls[counter] += entry['calls'][counter]
+
+        totals = dict()
+        for rig_class, passes in counts.items():
+            totals[rig_class] = {counter: sum(calls[counter] for calls in passes.values()) for counter in COUNTERS}
+
+        def format_calls(calls):
+            return ['-' if counter in self.counters.unavailable else calls[counter] for counter in COUNTERS]
+
+        row = "%-24s %-18s" + " %17s" * len(COUNTERS)
+        lines = [row % tuple(['rig', 'pass'] + COUNTERS)]
+
+        for rig_class in sorted(totals, key=lambda r: (-sum(totals[r].values()), r)):
+            passes = counts[rig_class]
+            for pass_name in sorted(passes, key=lambda p: order.get(p, -1)):
+                lines.append(row % tuple([rig_class, pass_name] + format_calls(passes[pass_name])))
+            lines.append(row % tuple([rig_class, 'total'] + format_calls(totals[rig_class])))
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        """
+        Writes the json report and the folded stacks, and the calls summary table
+        :return:
+        """
+
+        if self.path is not None:
+            with open(self.path, 'w') as f:
+                json.dump(self.get_report(), f, indent=1)
+
+            with open(os.path.splitext(self.path)[0] + '.folded', 'w') as f:
+                for stack in sorted(self.folded):
+                    f.write("%s %d\n" % (stack, self.folded[stack]))
+
+        if self.table_path is not None:
+            with open(self.table_path, 'w') as f:
+                f.write(self.get_table())
@@ -6,6 +6,7 @@ from .widgets import create_chain_widget
 from rigify.utils import make_mechanism_name
 from rna_prop_ui import rna_idprop_ui_prop_get
 from rigify.rigs.limbs.limb_utils import get_bone_name
+from .generation_context import requires_mode, set_mode
 
 
 class Rig:
@@ -46,7 +47,7 @@ class Rig:
 
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode='EDIT')
+        set_mode(self.obj, 'EDIT')
         eb = self.obj.data.edit_bones
 
         if not pivot:
@@ -98,7 +99,7 @@ class Rig:
     def create_deform(self):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode='EDIT')
+        set_mode(self.obj, 'EDIT')
 
         def_bones = []
         for o in org_bones:
@@ -106,7 +107,7 @@ class Rig:
             def_name = copy_bone(self.obj, o, def_name)
             def_bones.append(def_name)
 
-        bpy.ops.object.mode_set(mode='POSE')
+        set_mode(self.obj, 'POSE')
         # Create bbone segments
         for bone in def_bones:
             self.obj.data.bones[bone].bbone_segments = self.bbones
@@ -117,7 +118,7 @@ class Rig:
         else:
             self.obj.data.bones[def_bones[0]].bbone_easein = 1.0
             self.obj.data.bones[def_bones[-1]].bbone_easeout = 1.0
-        bpy.ops.object.mode_set(mode='EDIT')
+        set_mode(self.obj, 'EDIT')
 
         conv_def = ""
         if self.params.conv_bone and self.params.conv_def:
@@ -130,7 +131,7 @@ class Rig:
     def create_chain(self):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode='EDIT')
+        set_mode(self.obj, 'EDIT')
         eb = self.obj.data.edit_bones
 
         twk, mch, mch_ctrl, ctrl = [], [], [], []
@@ -292,9 +293,9 @@ class Rig:
             'conv': conv_twk
         }
 
+    @requires_mode('EDIT')
     def parent_bones(self, bones):
 
-        bpy.ops.object.mode_set(mode='EDIT')
         eb = self.obj.data.edit_bones
 
         # Parent deform bones
@@ -353,8 +354,8 @@ class Rig:
 
         return
 
+    @requires_mode('OBJECT')
     def make_constraint(self, bone, constraint):
-        bpy.ops.object.mode_set(mode='OBJECT')
         pb = self.obj.pose.bones
 
         owner_pb = pb[bone]
@@ -463,8 +464,8 @@ class Rig:
 
         return
 
+    @requires_mode('OBJECT')
     def stick_to_bendy_bones(self, bones):
-        bpy.ops.object.mode_set(mode='OBJECT')
         deform = bones['def']
         pb = self.obj.pose.bones
 
@@ -486,8 +487,8 @@ class Rig:
                 def_pb.bbone_custom_handle_end = mch_end
             def_pb.use_bbone_custom_handles = True
 
+    @requires_mode('OBJECT')
     def create_drivers(self, bones):
-        bpy.ops.object.mode_set(mode='OBJECT')
         pb = self.obj.pose.bones
 
         # Setting the torso's props
@@ -529,8 +530,8 @@ class Rig:
             drv_modifier.coefficients[0] = 1.0
             drv_modifier.coefficients[1] = -1.0
 
+    @requires_mode('OBJECT')
     def locks_and_widgets(self, bones):
-        bpy.ops.object.mode_set(mode='OBJECT')
         pb = self.obj.pose.bones
 
         # Locks
@@ -648,9 +649,9 @@ class Rig:
                 bones['chain']['ctrl'][-1] = bname
                 break
 
+    @requires_mode('EDIT')
     def generate(self):
 
-        bpy.ops.object.mode_set(mode='EDIT')
         eb = self.obj.data.edit_bones
 
         bones = {}
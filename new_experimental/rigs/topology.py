@@ -0,0 +1,172 @@
+import numpy as np
+from mathutils import Vector
+
+
+class ArmatureTopology:
+    """
+    Immutable snapshot of the armature bone hierarchy taken at the start of a generation.
+    Rig constructors query it instead of walking live edit bones. Bones created by the rigs are not part of it
+    """
+
+    def __init__(self, obj):
+        """
+        Must be built in EDIT mode
+        :param obj: the armature object
+        """
+
+        edit_bones = obj.data.edit_bones
+        pose_bones = obj.pose.bones
+        count = len(edit_bones)
+
+        self.names = tuple(eb.name for eb in edit_bones)
+        self._index = {name: i for i, name in enumerate(self.names)}
+
+        parents = [eb.parent.name if eb.parent else None for eb in edit_bones]
+        self._parents = tuple(parents)
+        self._rigify_types = tuple(pose_bones[name].rigify_type if name in pose_bones else ""
+                                   for name in self.names)
+
+        self.use_connect = np.zeros(count, dtype=bool)
+        edit_bones.foreach_get('use_connect', self.use_connect)
+        self.heads = np.zeros(count * 3, dtype=np.float32)
+        edit_bones.foreach_get('head', self.heads)
+        self.heads.shape = (count, 3)
+        self.tails = np.zeros(count * 3, dtype=np.float32)
+        edit_bones.foreach_get('tail', self.tails)
+        self.tails.shape = (count, 3)
+        self.rolls = np.zeros(count, dtype=np.float32)
+        edit_bones.foreach_get('roll', self.rolls)
+
+        for array in (self.use_connect, self.heads, self.tails, self.rolls):
+            array.setflags(write=False)
+
+        children = [[] for i in range(count)]
+        for i, parent in enumerate(parents):
+            if parent is not None:
+                children[self._index[parent]].append(i)
+        self._children = tuple(tuple(c) for c in children)
+
+        # depth and pre-order enter/exit indices make ancestry an O(1) test
+        self._depth = [0] * count
+        self._enter = [0] * count
+        self._exit = [0] * count
+        self._preorder = []
+        counter = 0
+        stack = [(i, False) for i in reversed(range(count)) if parents[i] is None]
+        while stack:
+            i, done = stack.pop()
+            if done:
+                self._exit[i] = counter
+                continue
+            self._enter[i] = counter
+            self._preorder.append(i)
+            counter += 1
+            stack.append((i, True))
+            for c in reversed(self._children[i]):
+                self._depth[c] = self._depth[i] + 1
+                stack.append((c, False))
+
+        self._chains = dict()
+        self._descendants = dict()
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def get_parent(self, name):
+        return self._parents[self._index[name]]
+
+    def get_children(self, name):
+        """
+        Children names in armature order
+        :param name:
+        :return:
+        :rtype: tuple(str)
+        """
+
+        return tuple(self.names[c] for c in self._children[self._index[name]])
+
+    def get_connected_children(self, name):
+        return tuple(self.names[c] for c in self._children[self._index[name]] if self.use_connect[c])
+
+    def get_unconnected_children(self, name):
+        return tuple(self.names[c] for c in self._children[self._index[name]] if not self.use_connect[c])
+
+    def get_connected_child(self, name):
+        """
+        Returns the connected child of name, None if there is none or the chain forks
+        :param name:
+        :return:
+        """
+
+        connected = self.get_connected_children(name)
+        if len(connected) == 1:
+            return connected[0]
+
+        return None
+
+    def is_connected(self, name):
+        return bool(self.use_connect[self._index[name]])
+
+    def get_rigify_type(self, name):
+        return self._rigify_types[self._index[name]]
+
+    def get_head(self, name):
+        return Vector(self.heads[self._index[name]])
+
+    def get_tail(self, name):
+        return Vector(self.tails[self._index[name]])
+
+    def get_roll(self, name):
+        return float(self.rolls[self._index[name]])
+
+    def is_ancestor(self, ancestor, name):
+        """
+        True if ancestor is a proper ancestor of name
+        :param ancestor:
+        :param name:
+        :return:
+        """
+
+        a = self._index[ancestor]
+        i = self._index[name]
+
+        return self._enter[a] < self._enter[i] < self._exit[a]
+
+    def get_chain(self, first_name):
+        """
+        Names of the chain starting with first_name. The chain stops on the last bone or where the bones fork
+        :param first_name:
+        :return:
+        :rtype: tuple(str)
+        """
+
+        chain = self._chains.get(first_name)
+
+        if chain is None:
+            chain = [first_name]
+            child = self.get_connected_child(first_name)
+            while child is not None:
+                chain.append(child)
+                child = self.get_connected_child(child)
+            chain = tuple(chain)
+            self._chains[first_name] = chain
+
+        return chain
+
+    def get_descendants(self, name):
+        """
+        All the descendants of name ordered like EditBone.children_recursive (by depth, then armature order)
+        :param name:
+        :return:
+        :rtype: tuple(str)
+        """
+
+        descendants = self._descendants.get(name)
+
+        if descendants is None:
+            a = self._index[name]
+            found = sorted(self._preorder[self._enter[a] + 1:self._exit[a]], key=lambda i: (self._depth[i], i))
+            descendants = tuple(self.names[i] for i in found)
+            self._descendants[name] = descendants
+
+        return descendants
@@ -7,8 +7,14 @@ import random
 import time
 import re
 import os
+import sys
+import hashlib
+import numpy as np
+from collections import namedtuple
+from functools import lru_cache
 from mathutils import Vector, Matrix, Color
 from rna_prop_ui import rna_idprop_ui_prop_get
+from rigify.utils import MetarigError
 
 RIG_DIR = "rigs"  # Name of the directory where rig types are kept
 METARIG_DIR = "metarigs"  # Name of the directory where metarigs are kept
@@ -21,6 +27,12 @@ ROOT_NAME = "root"   # Name of the root bone.
 
 WGT_LAYERS = [x == 19 for x in range(0, 20)]  # Widgets go on the last scene layer.
 
+MAX_NAME_LENGTH = 63  # Blender truncates ID names beyond it
+
+CACHE_ENV = "RIGS_CACHE"  # Directory of the persistent caches, they are off when it is set to an empty string
+CACHE_DIR = "rig_cache"  # Caches directory in the blender user scripts directory
+BLEND_RELATIVE = "//"  # RIGS_CACHE prefix of a directory relative to the saved .blend, as in blender paths
+
 MODULE_NAME = "rigify"  # Windows/Mac blender is weird, so __package__ doesn't work
 
 outdated_types = {"pitchipoy.limbs.super_limb": "limbs.super_limb",
@@ -51,7 +63,14 @@ outdated_types = {"pitchipoy.limbs.super_limb": "limbs.super_limb",
 #=============================================
 
 
-def adjust_widget(mesh, axis='y', offset=0.0):
+def get_widget_adjust_matrix(axis='y', offset=0.0):
+    """
+    Returns the matrix aligning a widget built along y to axis and moving it by offset along it
+    :param axis: 'x', 'y', 'z' optionally prefixed by '-'
+    :param offset:
+    :return:
+    :rtype: Matrix
+    """
 
     if axis[0] == '-':
         s = -1
@@ -73,8 +92,28 @@ def adjust_widget(mesh, axis='y', offset=0.0):
         rot_matrix = Matrix.Rotation(s*math.pi/2, 4, 'X')
         trans_matrix = Matrix.Translation((0.0, 0.0, offset))
 
-    for vert in mesh.vertices:
-        vert.co = (trans_matrix @ rot_matrix @ vert.co.to_4d()).to_3d()
+    return trans_matrix @ rot_matrix
+
+
+def adjust_widget(mesh, axis='y', offset=0.0):
+    """
+    Transforms all the widget vertices at once with a single matrix multiply
+    :param mesh:
+    :param axis: 'x', 'y', 'z' optionally prefixed by '-'
+    :param offset:
+    :return:
+    """
+
+    matrix = np.array(get_widget_adjust_matrix(axis, offset))
+
+    count = len(mesh.vertices)
+    co = np.zeros(count * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', co)
+    co.shape = (count, 3)
+
+    co = co @ matrix[:3, :3].T + matrix[:3, 3]
+
+    mesh.vertices.foreach_set('co', co.astype(np.float32).ravel())
 
 
 #=============================================
@@ -82,279 +121,415 @@ def adjust_widget(mesh, axis='y', offset=0.0):
 #=============================================
 
 
-def make_constraints_from_string(owner, target, subtarget, fstring):
+CONSTRAINT_CACHE_SIZE = 512    # number of distinct fstrings kept compiled
+
+CONSTRAINT_SPACE = {'L': 'LOCAL', 'W': 'WORLD', 'P': 'POSE'}
+
+TRANSFORM_TYPE = {'CL': 'COPY_LOCATION', 'CR': 'COPY_ROTATION', 'CS': 'COPY_SCALE', 'CT': 'COPY_TRANSFORMS'}
+LIMIT_TYPE = {'LL': 'LIMIT_LOCATION', 'LR': 'LIMIT_ROTATION', 'LS': 'LIMIT_SCALE'}
+TRACK_TYPE = {'DT': 'DAMPED_TRACK', 'TT': 'TRACK_TO', 'ST': 'STRETCH_TO'}
+RELATIONSHIP_TYPE = {'PA': 'PARENTING'}
+
+TRACK_AXIS = {'X': 'TRACK_X', '-X': 'TRACK_NEGATIVE_X', 'Y': 'TRACK_Y', '-Y': 'TRACK_NEGATIVE_Y',
+              'Z': 'TRACK_Z', '-Z': 'TRACK_NEGATIVE_Z'}
+
+# regex is (type)(influence*)(space-space*)(use_offset*)(head_tail*)
+TRANSFORM_REGEX = re.compile(r'^(CL|CR|CS|CT)([0-9]*\.?[0-9]+)*([LWP]{2})*(O*)([0-9]*\.?[0-9]+)*$')
+# regex is (type)(influence*)(limits:mXmYmZMXMYMZxx.xxx*)(use_transform_limit*)(owner_space*)
+# numbers are written unambiguously so that matching never backtracks over the limit clauses
+LIMIT_NUMBER = r'(?:[0-9]+(?:\.[0-9]+)?|\.[0-9]+)'
+LIMIT_REGEX = re.compile(r'^(LL|LR|LS)(%s)?((?:[mM][XYZ]-?%s)*)(T?)([WLP]?)$' % (LIMIT_NUMBER, LIMIT_NUMBER))
+LIMIT_CLAUSE_REGEX = re.compile(r'([mM])([XYZ])(-?%s)' % LIMIT_NUMBER)
+
+# (use attribute, value attribute) set by a limit clause for each limit type and bound (m = min, M = max)
+LIMIT_ATTRIBUTES = {
+    'LIMIT_LOCATION': {'m': ('use_min_%s', 'min_%s'), 'M': ('use_max_%s', 'max_%s')},
+    'LIMIT_ROTATION': {'m': ('use_limit_%s', 'min_%s'), 'M': ('use_limit_%s', 'max_%s')},
+    'LIMIT_SCALE': {'m': ('use_min_%s', 'min_%s'), 'M': ('use_max_%s', 'max_%s')},
+}
+# regex is (type)(influence*)(track_axis*)(space-space*)(head_tail*)
+TRACK_REGEX = re.compile(r'^(TT|DT|ST)([0-9]*\.?[0-9]+)*(-*[XYZ])*([LWP]{2})*([0-9]*\.?[0-9]+)*$')
+# regex is (type)
+RELATION_REGEX = re.compile(r'^(PA)$')
+
+ConstraintSpec = namedtuple('ConstraintSpec', ['type', 'targeted', 'props'])
+ConstraintSpec.__doc__ = """
+Immutable compiled constraint: type is the blender constraint type, targeted tells if target/subtarget are set
+and props is a tuple of (attribute, value) pairs (influence, spaces, limits, head_tail...) in assignment order
+"""
+
+
+@lru_cache(maxsize=CONSTRAINT_CACHE_SIZE)
+def compile_constraints_string(fstring):
     """
-    Creates and applies constraints on owner bone based on formatted string
-    :param owner: the owner pose_bone
-    :param target: the target object
-    :param subtarget: the bone subtarget name
+    Compiles a formatted string into a tuple of ConstraintSpec. Results are memoized
     :param fstring: formatted string
     :return:
+    :rtype: tuple(ConstraintSpec)
     """
 
-    separator = '#'
-    cns_blocks = fstring.split(separator)
+    specs = []
 
-    transform_type = ['CL', 'CR', 'CS', 'CT']
-    limit_type = ['LL', 'LR', 'LS']
-    track_type = ['DT', 'TT', 'ST']
-    relationship_type = ['PA']
+    for cns in fstring.split('#'):
 
-    for cns in cns_blocks:
+        if not cns:
+            continue
 
-        if cns[0:2] in transform_type:
-            make_transform_constraint_from_string(owner, target, subtarget, cns)
+        if cns[0:2] in TRANSFORM_TYPE:
+            specs.append(compile_transform_constraint(cns))
+        elif cns[0:2] in LIMIT_TYPE:
+            specs.append(compile_limit_constraint(cns))
+        elif cns[0:2] in TRACK_TYPE:
+            specs.append(compile_track_constraint(cns))
+        elif cns[0:2] in RELATIONSHIP_TYPE:
+            specs.append(compile_relation_constraint(cns))
+        else:
+            raise MetarigError("Unknown constraint type '%s' in constraint string '%s'" % (cns[0:2], fstring))
 
-        if cns[0:2] in limit_type:
-            make_limit_constraint_from_string(owner, cns)
+    return tuple(specs)
 
-        if cns[0:2] in track_type:
-            make_track_constraint_from_string(owner, target, subtarget, cns)
 
-        if cns[0:2] in relationship_type:
-            make_relation_constraint_from_string(owner, target, subtarget, cns)
+def match_constraint_string(regex, fstring):
+    re_object = regex.match(fstring)
+    if not re_object:
+        raise MetarigError("Badly formatted constraint string '%s'" % fstring)
+    return re_object.groups()
 
 
-def make_transform_constraint_from_string(owner, target, subtarget, fstring):
+def compile_transform_constraint(fstring):
 
-    # regex is (type)(influence*)(space-space*)(use_offset*)(head_tail*)
-    regex = '^(CL|CR|CS|CT)([0-9]*\.?[0-9]+)*([LWP]{2})*(O*)([0-9]*\.?[0-9]+)*$'
+    cns_props = match_constraint_string(TRANSFORM_REGEX, fstring)
 
-    constraint_type = {'CL': 'COPY_LOCATION', 'CR': 'COPY_ROTATION', 'CS': 'COPY_SCALE', 'CT': 'COPY_TRANSFORMS'}
-    constraint_space = {'L': 'LOCAL', 'W': 'WORLD', 'P': 'POSE'}
+    cns_type = TRANSFORM_TYPE[cns_props[0]]
 
-    re_object = re.match(regex, fstring)
-    if not re_object:
-        return
-    else:
-        cns_props = re_object.groups()
-
-    cns_type = constraint_type[cns_props[0]]
-    const = owner.constraints.new(cns_type)
-    const.target = target
-    const.subtarget = subtarget
-
-    if cns_type == 'COPY_LOCATION':
-        const.influence = float(cns_props[1]) if bool(cns_props[1]) else 1.0
-        const.target_space = constraint_space[cns_props[2][0]] if bool(cns_props[2]) else "LOCAL"
-        const.owner_space = constraint_space[cns_props[2][1]] if bool(cns_props[2]) else "LOCAL"
-        const.use_offset = bool(cns_props[3])
-        const.head_tail = float(cns_props[4]) if bool(cns_props[4]) else 0.0
-    if cns_type == 'COPY_ROTATION':
-        const.influence = float(cns_props[1]) if bool(cns_props[1]) else 1.0
-        const.target_space = constraint_space[cns_props[2][0]] if bool(cns_props[2]) else "LOCAL"
-        const.owner_space = constraint_space[cns_props[2][1]] if bool(cns_props[2]) else "LOCAL"
-        const.use_offset = bool(cns_props[3])
-    if cns_type == 'COPY_SCALE':
-        const.influence = float(cns_props[1]) if bool(cns_props[1]) else 1.0
-        const.target_space = constraint_space[cns_props[2][0]] if bool(cns_props[2]) else "LOCAL"
-        const.owner_space = constraint_space[cns_props[2][1]] if bool(cns_props[2]) else "LOCAL"
-        const.use_offset = bool(cns_props[3])
-    if cns_type == 'COPY_TRANSFORMS':
-        const.influence = float(cns_props[1]) if bool(cns_props[1]) else 1.0
-        const.target_space = constraint_space[cns_props[2][0]] if bool(cns_props[2]) else "LOCAL"
-        const.owner_space = constraint_space[cns_props[2][1]] if bool(cns_props[2]) else "LOCAL"
-        const.head_tail = float(cns_props[4]) if bool(cns_props[4]) else 0.0
+    props = [('influence', float(cns_props[1]) if bool(cns_props[1]) else 1.0),
+             ('target_space', CONSTRAINT_SPACE[cns_props[2][0]] if bool(cns_props[2]) else "LOCAL"),
+             ('owner_space', CONSTRAINT_SPACE[cns_props[2][1]] if bool(cns_props[2]) else "LOCAL")]
 
+    if cns_type != 'COPY_TRANSFORMS':
+        props.append(('use_offset', bool(cns_props[3])))
+    if cns_type in ('COPY_LOCATION', 'COPY_TRANSFORMS'):
+        props.append(('head_tail', float(cns_props[4]) if bool(cns_props[4]) else 0.0))
 
-def make_limit_constraint_from_string(owner, fstring):
+    return ConstraintSpec(cns_type, True, tuple(props))
 
-    regular_expressions = {'LL': '^(LL)([0-9]*\.?[0-9]+)*(([mM]{1}[XYZ]{1}-?[0-9]*\.?[0-9]+)+)*(T)*(W|L|P)*$',
-                           'LR': '^(LR)([0-9]*\.?[0-9]+)*(([mM]{1}[XYZ]{1}-?[0-9]*\.?[0-9]+)+)*(T)*(W|L|P)*$',
-                           'LS': '^(LS)([0-9]*\.?[0-9]+)*(([mM]{1}[XYZ]{1}-?[0-9]*\.?[0-9]+)+)*(T)*(W|L|P)*$'}
 
-    # regex is (type)(influence*)(limits:mXmYmZMXMYMZxx.xxx*)(use_transform_limit*)(owner_space*)
-    regex = regular_expressions[fstring[0:2]]
+def compile_limit_constraint(fstring):
 
-    constraint_type = {'LL': 'LIMIT_LOCATION', 'LR': 'LIMIT_ROTATION', 'LS': 'LIMIT_SCALE'}
-    constraint_space = {'L': 'LOCAL', 'W': 'WORLD', 'P': 'POSE'}
+    cns_props = match_constraint_string(LIMIT_REGEX, fstring)
 
-    re_object = re.match(regex, fstring)
-    if not re_object:
-        return
-    else:
-        cns_props = re_object.groups()
-
-    cns_type = constraint_type[cns_props[0]]
-    const = owner.constraints.new(cns_type)
-
-    if cns_type == 'LIMIT_LOCATION':
-        const.influence = float(cns_props[1]) if bool(cns_props[1]) else 1.0
-        const.use_transform_limit = bool(cns_props[-2])
-        const.owner_space = constraint_space[cns_props[-1]] if bool(cns_props[-1]) else "LOCAL"
-        limits = cns_props[2]
-        limit = cns_props[3]
-        while 1:
-            if not limits:
-                break
-            if limit[0:2] == 'mX':
-                const.use_min_x = True
-                const.min_x = float(limit[2:])
-            if limit[0:2] == 'mY':
-                const.use_min_y = True
-                const.min_y = float(limit[2:])
-            if limit[0:2] == 'mZ':
-                const.use_min_z = True
-                const.min_z = float(limit[2:])
-            if limit[0:2] == 'MX':
-                const.use_max_x = True
-                const.max_x = float(limit[2:])
-            if limit[0:2] == 'MY':
-                const.use_max_y = True
-                const.max_y = float(limit[2:])
-            if limit[0:2] == 'MZ':
-                const.use_max_z = True
-                const.max_z = float(limit[2:])
-            limits = limits[:-len(limit)]
-            o = re.search('(([mM]{1}[XYZ]{1}-?[0-9]*\.?[0-9]+)+)*', limits)
-            limits = o.groups()[0]
-            limit = o.groups()[1]
-
-    if cns_type == 'LIMIT_ROTATION':
-        const.influence = float(cns_props[1]) if bool(cns_props[1]) else 1.0
-        const.use_transform_limit = bool(cns_props[-2])
-        const.owner_space = constraint_space[cns_props[-1]] if bool(cns_props[-1]) else "LOCAL"
-        limits = cns_props[2]
-        limit = cns_props[3]
-        while 1:
-            if not limits:
-                break
-            if limit[0:2] == 'mX':
-                const.use_limit_x = True
-                const.min_x = float(limit[2:])
-            if limit[0:2] == 'mY':
-                const.use_limit_y = True
-                const.min_y = float(limit[2:])
-            if limit[0:2] == 'mZ':
-                const.use_limit_z = True
-                const.min_z = float(limit[2:])
-            if limit[0:2] == 'MX':
-                const.use_limit_x = True
-                const.max_x = float(limit[2:])
-            if limit[0:2] == 'MY':
-                const.use_limit_y = True
-                const.max_y = float(limit[2:])
-            if limit[0:2] == 'MZ':
-                const.use_limit_z = True
-                const.max_z = float(limit[2:])
-            limits = limits[:-len(limit)]
-            o = re.search('(([mM]{1}[XYZ]{1}-?[0-9]*\.?[0-9]+)+)*', limits)
-            limits = o.groups()[0]
-            limit = o.groups()[1]
-
-    if cns_type == 'LIMIT_SCALE':
-        const.influence = float(cns_props[1]) if bool(cns_props[1]) else 1.0
-        const.use_transform_limit = bool(cns_props[-2])
-        const.owner_space = constraint_space[cns_props[-1]] if bool(cns_props[-1]) else "LOCAL"
-        limits = cns_props[2]
-        limit = cns_props[3]
-        while 1:
-            if not limits:
-                break
-            if limit[0:2] == 'mX':
-                const.use_min_x = True
-                const.min_x = float(limit[2:])
-            if limit[0:2] == 'mY':
-                const.use_min_y = True
-                const.min_y = float(limit[2:])
-            if limit[0:2] == 'mZ':
-                const.use_min_z = True
-                const.min_z = float(limit[2:])
-            if limit[0:2] == 'MX':
-                const.use_max_x = True
-                const.max_x = float(limit[2:])
-            if limit[0:2] == 'MY':
-                const.use_max_y = True
-                const.max_y = float(limit[2:])
-            if limit[0:2] == 'MZ':
-                const.use_max_z = True
-                const.max_z = float(limit[2:])
-            limits = limits[:-len(limit)]
-            o = re.search('(([mM]{1}[XYZ]{1}-?[0-9]*\.?[0-9]+)+)*', limits)
-            limits = o.groups()[0]
-            limit = o.groups()[1]
+    cns_type = LIMIT_TYPE[cns_props[0]]
 
+    props = [('influence', float(cns_props[1]) if bool(cns_props[1]) else 1.0),
+             ('use_transform_limit', bool(cns_props[-2])),
+             ('owner_space', CONSTRAINT_SPACE[cns_props[-1]] if bool(cns_props[-1]) else "LOCAL")]
 
-def make_track_constraint_from_string(owner, target, subtarget, fstring):
+    props.extend(parse_limit_clauses(cns_type, cns_props[2]))
 
-    # regex is (type)(influence*)(track_axis*)(space-space*)(head_tail*)
-    regex = '^(TT|DT|ST)([0-9]*\.?[0-9]+)*(-*[XYZ])*([LWP]{2})*([0-9]*\.?[0-9]+)*$'
+    return ConstraintSpec(cns_type, False, tuple(props))
 
-    constraint_type = {'DT': 'DAMPED_TRACK', 'TT': 'TRACK_TO', 'ST': 'STRETCH_TO'}
-    constraint_space = {'L': 'LOCAL', 'W': 'WORLD', 'P': 'POSE'}
-    track_axis = {'X': 'TRACK_X', '-X': 'TRACK_NEGATIVE_X', 'Y': 'TRACK_Y', '-Y': 'TRACK_NEGATIVE_Y',
-                  'Z': 'TRACK_Z', '-Z': 'TRACK_NEGATIVE_Z'}
 
-    re_object = re.match(regex, fstring)
-    if not re_object:
-        return
-    else:
-        cns_props = re_object.groups()
+def parse_limit_clauses(cns_type, limits):
+    """
+    Parses all the limit clauses (e.g. mX0.5MZ-1) of a LIMIT_* constraint in a single scan.
+    When the same bound is given twice the first clause wins
+    :param cns_type: LIMIT_LOCATION, LIMIT_ROTATION or LIMIT_SCALE
+    :param limits: the limit clauses substring
+    :return: (attribute, value) pairs
+    :rtype: list
+    """
+
+    attributes = LIMIT_ATTRIBUTES[cns_type]
+    bounds = dict()
+
+    for bound, axis, value in LIMIT_CLAUSE_REGEX.findall(limits):
+        if (bound, axis) not in bounds:
+            bounds[(bound, axis)] = float(value)
+
+    props = []
+    for (bound, axis), value in bounds.items():
+        use_attr, value_attr = attributes[bound]
+        axis = axis.lower()
+        props.append((use_attr % axis, True))
+        props.append((value_attr % axis, value))
+
+    return props
+
+
+def compile_track_constraint(fstring):
 
-    cns_type = constraint_type[cns_props[0]]
-    const = owner.constraints.new(cns_type)
-    const.target = target
-    const.subtarget = subtarget
+    cns_props = match_constraint_string(TRACK_REGEX, fstring)
 
-    if cns_type == 'DAMPED_TRACK':
-        const.influence = float(cns_props[1]) if bool(cns_props[1]) else 1.0
-        const.track_axis = track_axis[cns_props[2]] if bool(cns_props[2]) else "TRACK_Y"
-        const.head_tail = float(cns_props[4]) if bool(cns_props[4]) else 0.0
+    cns_type = TRACK_TYPE[cns_props[0]]
 
+    props = [('influence', float(cns_props[1]) if bool(cns_props[1]) else 1.0)]
+
+    if cns_type != 'STRETCH_TO':
+        props.append(('track_axis', TRACK_AXIS[cns_props[2]] if bool(cns_props[2]) else "TRACK_Y"))
     if cns_type == 'TRACK_TO':
-        const.influence = float(cns_props[1]) if bool(cns_props[1]) else 1.0
-        const.track_axis = track_axis[cns_props[2]] if bool(cns_props[2]) else "TRACK_Y"
-        const.target_space = constraint_space[cns_props[3][0]] if bool(cns_props[3]) else "LOCAL"
-        const.owner_space = constraint_space[cns_props[3][1]] if bool(cns_props[3]) else "LOCAL"
-        const.head_tail = float(cns_props[4]) if bool(cns_props[4]) else 0.0
+        props.append(('target_space', CONSTRAINT_SPACE[cns_props[3][0]] if bool(cns_props[3]) else "LOCAL"))
+        props.append(('owner_space', CONSTRAINT_SPACE[cns_props[3][1]] if bool(cns_props[3]) else "LOCAL"))
+    props.append(('head_tail', float(cns_props[4]) if bool(cns_props[4]) else 0.0))
+
+    return ConstraintSpec(cns_type, True, tuple(props))
+
+
+def compile_relation_constraint(fstring):
+
+    cns_props = match_constraint_string(RELATION_REGEX, fstring)
+
+    return ConstraintSpec(RELATIONSHIP_TYPE[cns_props[0]], True, ())
+
+
+def apply_constraint_spec(owner, target, subtarget, spec):
+    """
+    Applies a compiled constraint on owner bone
+    :param owner: the owner pose_bone
+    :param target: the target object
+    :param subtarget: the bone subtarget name
+    :param spec:
+    :type spec: ConstraintSpec
+    :return: the new constraint or None for relationships
+    """
+
+    if spec.type == 'PARENTING':
+        target.data.edit_bones[owner.name].parent = target.data.edit_bones[subtarget]
+        return None
+
+    const = owner.constraints.new(spec.type)
+    if spec.targeted:
+        const.target = target
+        const.subtarget = subtarget
+
+    for attr, value in spec.props:
+        setattr(const, attr, value)
+
+    return const
+
+
+def make_constraints_from_string(owner, target, subtarget, fstring):
+    """
+    Creates and applies constraints on owner bone based on formatted string
+    :param owner: the owner pose_bone
+    :param target: the target object
+    :param subtarget: the bone subtarget name
+    :param fstring: formatted string
+    :return:
+    """
 
-    if cns_type == 'STRETCH_TO':
-        const.influence = float(cns_props[1]) if bool(cns_props[1]) else 1.0
-        const.head_tail = float(cns_props[4]) if bool(cns_props[4]) else 0.0
+    for spec in compile_constraints_string(fstring):
+        apply_constraint_spec(owner, target, subtarget, spec)
+
+
+def make_transform_constraint_from_string(owner, target, subtarget, fstring):
+    apply_constraint_spec(owner, target, subtarget, compile_transform_constraint(fstring))
+
+
+def make_limit_constraint_from_string(owner, fstring):
+    apply_constraint_spec(owner, None, "", compile_limit_constraint(fstring))
+
+
+def make_track_constraint_from_string(owner, target, subtarget, fstring):
+    apply_constraint_spec(owner, target, subtarget, compile_track_constraint(fstring))
 
 
 def make_relation_constraint_from_string(owner, target, subtarget, fstring):
+    apply_constraint_spec(owner, target, subtarget, compile_relation_constraint(fstring))
+
+#=============================================
+# Layer utilities
+#=============================================
 
-    # regex is (type)
-    regex = '^(PA)$'
+MCH_LAYERS = 4  # the last MCH_LAYERS layers hold MCH DEF and ORG bones, ctrls are on none of them
 
-    constraint_type = {'PA': 'PARENTING'}
 
-    re_object = re.match(regex, fstring)
-    if not re_object:
+def get_layer_mask(bones):
+    """
+    Reads the layers of all bones at once
+    :param bones: obj.data.bones or obj.data.edit_bones
+    :return: (len(bones), 32) bool array
+    :rtype: numpy.ndarray
+    """
+
+    mask = np.zeros(len(bones) * 32, dtype=bool)
+    bones.foreach_get('layers', mask)
+    mask.shape = (len(bones), 32)
+
+    return mask
+
+
+def set_layer_mask(bones, mask):
+    """
+    Writes the layers of all bones at once
+    :param bones: obj.data.bones or obj.data.edit_bones
+    :param mask: (len(bones), 32) bool array
+    :return:
+    """
+
+    bones.foreach_set('layers', np.ascontiguousarray(mask, dtype=bool).ravel())
+
+
+def get_ctrl_mask(mask):
+    """
+    Rows of a layer mask that belong to ctrls, i.e. bones on none of the mechanism layers
+    :param mask: (N, 32) bool array
+    :return: (N,) bool array
+    """
+
+    return ~mask[:, -MCH_LAYERS:].any(axis=1)
+
+
+def assign_layers(bones, assignments):
+    """
+    Assigns layers to many bones with a single read and a single write of the collection
+    :param bones: obj.data.bones or obj.data.edit_bones
+    :param assignments: list of (bone names, 32 bools layers) applied in order
+    :return:
+    """
+
+    assignments = [(names, layers) for names, layers in assignments if names]
+    if not assignments:
         return
-    else:
-        cns_props = re_object.groups()
 
-    cns_type = constraint_type[cns_props[0]]
+    index = {name: i for i, name in enumerate(bones.keys())}
+    mask = get_layer_mask(bones)
 
-    if cns_type == 'PARENTING':
-        target.data.edit_bones[owner.name].parent = target.data.edit_bones[subtarget]
+    for names, layers in assignments:
+        rows = [index[name] for name in names]
+        mask[rows] = np.asarray(layers, dtype=bool)
+
+    set_layer_mask(bones, mask)
 
 #=============================================
 # Misc
 #=============================================
 
 
-def get_rig_type(rig_type, base_path=''):
-    """ Fetches a rig module by name, and returns it.
+def make_widget_name(bone_name, rig_name=''):
+    """ Name of the widget object of a bone, truncated as blender does.
+    Without rig_name, the name of a widget not prefixed with its armature name.
+    """
+    if rig_name:
+        return (WGT_PREFIX + rig_name + '_' + bone_name)[:MAX_NAME_LENGTH]
+    return (WGT_PREFIX + bone_name)[:MAX_NAME_LENGTH]
+
+
+def get_cache_dir(name):
+    """ Directory of the persistent cache name: in rig_cache of the blender user scripts directory by default.
+    RIGS_CACHE overrides it, a path starting with // is relative to the saved .blend (opt-in, unsaved files use
+    the default) and an empty RIGS_CACHE turns the caches off, returning None.
+    """
+    path = os.environ.get(CACHE_ENV)
+
+    if path is not None and path.startswith(BLEND_RELATIVE):
+        if bpy.data.filepath:
+            path = os.path.join(os.path.dirname(bpy.data.filepath), path[len(BLEND_RELATIVE):])
+        else:
+            path = None
+
+    if path is None:
+        path = bpy.utils.user_resource('SCRIPTS', path=CACHE_DIR, create=True)
+
+    if not path:
+        return None
+
+    return os.path.join(path, name)
+
+
+_source_versions = dict()   # source path -> (mtime, sha1 of the source)
+
+
+def get_source_version(path):
+    """ sha1 of a source file, read again only when its mtime changes.
+    """
+    mtime = os.path.getmtime(path)
+    version = _source_versions.get(path)
+
+    if version is None or version[0] != mtime:
+        with open(path, 'rb') as f:
+            version = (mtime, hashlib.sha1(f.read()).hexdigest())
+        _source_versions[path] = version
+
+    return version[1]
+
+
+def get_id_property_value(value):
+    """ Plain python value of an ID property: property arrays become lists and groups dicts.
+    """
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    if hasattr(value, 'to_list'):
+        return value.to_list()
+    return value
+
+
+_rig_type_registry = dict()    # (rig_type, base_path) -> (module, source path, source mtime)
+
+
+def _get_source_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except (OSError, TypeError):
+        return None
+
+
+def _load_rig_type(rig_type, base_path='', reload=False):
+    """ Imports a rig module and returns it together with its source path.
     """
     if not base_path:
         name = ".%s.%s" % (RIG_DIR, rig_type)
         submod = importlib.import_module(name, package=MODULE_NAME)
-        importlib.reload(submod)
-    else:
-        if '.' in rig_type:
-            module_subpath = str.join(os.sep, rig_type.split('.'))
-            package = rig_type.split('.')[0]
+        if reload:
+            importlib.reload(submod)
+        return submod, getattr(submod, '__file__', None)
+
+    if '.' in rig_type:
+        module_subpath = str.join(os.sep, rig_type.split('.'))
+        package = rig_type.split('.')[0]
+        importlib.import_module(package)
+        for sub in rig_type.split('.')[1:]:
+            package = '.'.join([package, sub])
             importlib.import_module(package)
-            for sub in rig_type.split('.')[1:]:
-                package = '.'.join([package, sub])
-                importlib.import_module(package)
-        else:
-            module_subpath = rig_type
+    else:
+        module_subpath = rig_type
+
+    path = base_path + module_subpath + '.py'
+    spec = importlib.util.spec_from_file_location(rig_type, path)
+    submod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(submod)
+    return submod, path
+
+
+def _is_imported(rig_type, base_path=''):
+    """ Tells if the rig module was imported before the registry saw it, e.g. at add-on registration.
+    """
+    if base_path:
+        return False
+    return importlib.util.resolve_name(".%s.%s" % (RIG_DIR, rig_type), MODULE_NAME) in sys.modules
 
-        spec = importlib.util.spec_from_file_location(rig_type, base_path + module_subpath + '.py')
-        submod = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(submod)
-    return submod
\ No newline at end of file
+
+def get_rig_type(rig_type, base_path=''):
+    """ Fetches a rig module by name, and returns it.
+    Modules are imported once and kept in a registry, they are reloaded only when their source file changes.
+    A module imported before its first lookup is reloaded then, its source may have changed since
+    """
+    key = (rig_type, base_path)
+    entry = _rig_type_registry.get(key)
+
+    if entry:
+        submod, path, mtime = entry
+        if _get_source_mtime(path) == mtime:
+            return submod
+
+    submod, path = _load_rig_type(rig_type, base_path, reload=entry is not None or _is_imported(rig_type, base_path))
+    _rig_type_registry[key] = (submod, path, _get_source_mtime(path))
+
+    return submod
+
+
+def reload_all():
+    """ Reloads every rig module in the registry. Meant for rig development
+    """
+    for rig_type, base_path in list(_rig_type_registry):
+        submod, path = _load_rig_type(rig_type, base_path, reload=True)
+        _rig_type_registry[(rig_type, base_path)] = (submod, path, _get_source_mtime(path))
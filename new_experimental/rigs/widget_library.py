@@ -0,0 +1,206 @@
+import atexit
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+
+from .utils import get_cache_dir, get_source_version
+
+LIBRARY_VERSION = 1     # bump when the library format changes
+PACKAGE = __name__.rsplit('.', 1)[0]
+# modules whose functions build the widget shapes
+WIDGET_MODULES = [PACKAGE + '.widgets', PACKAGE + '.utils', 'rigify.utils', 'rigify.rigs.widgets']
+
+
+def get_library_key():
+    """
+    Key of the shapes the current code builds: library format version, rigify version and sources of the
+    widget modules. A library saved with another key is ignored
+    :return:
+    :rtype: str
+    """
+
+    rigify = sys.modules.get('rigify')
+    digest = hashlib.sha1()
+    digest.update(repr((LIBRARY_VERSION, getattr(rigify, 'bl_info', {}).get('version'))).encode())
+
+    for name in WIDGET_MODULES:
+        path = getattr(sys.modules.get(name), '__file__', None)
+        if path:
+            digest.update(get_source_version(path).encode())
+
+    return digest.hexdigest()
+
+
+class WidgetLibrary:
+    """
+    On-disk library of widget shapes (verts and edges) keyed by the widget shape parameters.
+    index.json maps every shape key to its slice of verts.npy and edges.npy, which are memory-mapped on load.
+    Shapes added during the session are written back by save, at the latest when blender exits.
+    The library is dropped when the widget code changes, see get_library_key
+    """
+
+    _library = None
+
+    def __init__(self, path):
+        """
+
+        :param path: the library directory, None to keep the shapes for the session only
+        """
+
+        self.path = path
+        self.key = get_library_key()
+        self.shapes = dict()    # key -> (verts start, verts count, edges start, edges count)
+        self.verts = np.zeros((0, 3), dtype=np.float32)
+        self.edges = np.zeros((0, 2), dtype=np.int32)
+        self.pending = dict()   # key -> (verts, edges) not saved yet
+
+        self.load()
+
+    @classmethod
+    def get(cls):
+        """
+        Returns the library of the session, loading it on first request
+        :return:
+        :rtype: WidgetLibrary
+        """
+
+        if cls._library is None:
+            cls._library = cls(get_cache_dir("widgets"))
+            atexit.register(cls._library.save)
+
+        return cls._library
+
+    @staticmethod
+    def make_key(shape_key):
+        return repr(shape_key)
+
+    def load(self):
+        if self.path is None:
+            return
+
+        index_path = os.path.join(self.path, "index.json")
+
+        if not os.path.exists(index_path):
+            return
+
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+            if index.get('key') != self.key:
+                return
+            verts = np.load(os.path.join(self.path, "verts.npy"), mmap_mode='r')
+            edges = np.load(os.path.join(self.path, "edges.npy"), mmap_mode='r')
+        except (OSError, ValueError):
+            return
+
+        self.shapes = {key: tuple(value) for key, value in index['shapes'].items()}
+        self.verts = verts
+        self.edges = edges
+
+    def get_shape(self, shape_key):
+        """
+        Returns verts and edges of a shape or None if the library does not have it
+        :param shape_key:
+        :return: (V, 3) float32 array, (E, 2) int32 array
+        """
+
+        key = self.make_key(shape_key)
+
+        if key in self.pending:
+            return self.pending[key]
+
+        if key not in self.shapes:
+            return None
+
+        v_start, v_count, e_start, e_count = self.shapes[key]
+
+        return self.verts[v_start:v_start + v_count], self.edges[e_start:e_start + e_count]
+
+    def add_shape(self, shape_key, verts, edges):
+        """
+        Adds a shape to the library. It is written on disk by save
+        :param shape_key:
+        :param verts:
+        :param edges:
+        :return:
+        """
+
+        key = self.make_key(shape_key)
+
+        if key not in self.shapes:
+            self.pending[key] = (np.asarray(verts, dtype=np.float32).reshape(-1, 3),
+                                 np.asarray(edges, dtype=np.int32).reshape(-1, 2))
+
+    def save(self):
+        """
+        Writes the library with the pending shapes merged in
+        :return:
+        """
+
+        if not self.pending or self.path is None:
+            return
+
+        verts = [np.array(self.verts)]
+        edges = [np.array(self.edges)]
+        shapes = dict(self.shapes)
+        v_total = len(self.verts)
+        e_total = len(self.edges)
+
+        for key, (v, e) in self.pending.items():
+            shapes[key] = (v_total, len(v), e_total, len(e))
+            verts.append(v)
+            edges.append(e)
+            v_total += len(v)
+            e_total += len(e)
+
+        # files are written aside and swapped in, the current ones may still be memory-mapped
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            for name, array in (("verts.npy", np.concatenate(verts)), ("edges.npy", np.concatenate(edges))):
+                with open(os.path.join(self.path, name + ".tmp"), 'wb') as f:
+                    np.save(f, array)
+                os.replace(os.path.join(self.path, name + ".tmp"), os.path.join(self.path, name))
+            with open(os.path.join(self.path, "index.json.tmp"), 'w') as f:
+                json.dump({'key': self.key, 'shapes': shapes}, f)
+            os.replace(os.path.join(self.path, "index.json.tmp"), os.path.join(self.path, "index.json"))
+        except OSError:
+            return
+
+        self.pending.clear()
+        self.load()
+
+
+def read_mesh_shape(mesh):
+    """
+    Reads verts and edges of a widget mesh in bulk. Returns None for meshes with faces, they are not stored
+    :param mesh:
+    :return:
+    """
+
+    if len(mesh.polygons):
+        return None
+
+    verts = np.zeros(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', verts)
+    edges = np.zeros(len(mesh.edges) * 2, dtype=np.int32)
+    mesh.edges.foreach_get('vertices', edges)
+
+    return verts.reshape(-1, 3), edges.reshape(-1, 2)
+
+
+def write_mesh_shape(mesh, verts, edges):
+    """
+    Fills an empty widget mesh in bulk
+    :param mesh:
+    :param verts: (V, 3) array
+    :param edges: (E, 2) array
+    :return:
+    """
+
+    mesh.vertices.add(len(verts))
+    mesh.vertices.foreach_set('co', np.ascontiguousarray(verts, dtype=np.float32).ravel())
+    mesh.edges.add(len(edges))
+    mesh.edges.foreach_set('vertices', np.ascontiguousarray(edges, dtype=np.int32).ravel())
+    mesh.update()
@@ -1,6 +1,237 @@
-from mathutils import Matrix, Vector
-from math import pi, sin, cos
+import bpy
+import hashlib
+import numpy as np
+from functools import wraps
 from rigify.rigs.widgets import create_widget
+from rigify.utils import create_sphere_widget as rigify_sphere_widget
+from rigify.utils import create_circle_widget as rigify_circle_widget
+from rigify.utils import create_cube_widget as rigify_cube_widget
+
+from .generation_context import GenerationContext
+from .utils import WGT_PREFIX, adjust_widget, make_widget_name
+from .widget_library import WidgetLibrary, read_mesh_shape, write_mesh_shape
+
+
+class WidgetCache:
+    """
+    Per-generation cache of widget meshes keyed by the widget shape parameters.
+    Widget objects are scaled to their bone, so ctrls with the same shape parameters can share one mesh
+    """
+
+    def __init__(self):
+        self.meshes = dict()
+        self.hits = 0
+        self.misses = 0
+        self.library_hits = 0
+
+    @staticmethod
+    def get(rig):
+        """
+        Returns the widget cache of the rig generation
+        :param rig: the armature object
+        :return:
+        :rtype: WidgetCache
+        """
+
+        return GenerationContext.get(rig).get_cache('widget_cache', WidgetCache)
+
+    @staticmethod
+    def make_key(function, kwargs):
+        shape = tuple(sorted((k, v) for k, v in kwargs.items() if k != 'bone_transform_name'))
+        return function.__name__, shape
+
+    def lookup(self, key):
+        """
+        Returns the cached mesh for key or None. A mesh removed from the blend data counts as a miss
+        :param key:
+        :return:
+        """
+
+        mesh = self.meshes.get(key)
+
+        if mesh is not None and mesh.name not in bpy.data.meshes:
+            del self.meshes[key]
+            mesh = None
+
+        return mesh
+
+    def get_report(self):
+        """
+        Returns the cache statistics. Every hit is a widget mesh that was not built,
+        library hits are meshes loaded from the widget library instead of being built procedurally
+        :return:
+        :rtype: dict
+        """
+
+        total = self.hits + self.misses
+
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'library_hits': self.library_hits,
+                'hit_rate': self.hits / total if total else 0.0,
+                'meshes': len(self.meshes),
+                'meshes_saved': self.hits}
+
+
+def get_widget_object(rig, bone_name):
+    """
+    Returns the widget object of bone_name if it exists
+    :param rig:
+    :param bone_name:
+    :return:
+    """
+
+    for name in (make_widget_name(bone_name, rig.name), make_widget_name(bone_name)):
+        if name in bpy.data.objects:
+            return bpy.data.objects[name]
+
+    return None
+
+
+def cached_widget(function):
+    """
+    Decorates a widget creation function f(rig, bone_name, **shape) so that widgets with the same shape
+    parameters share a single mesh. New meshes are loaded from the widget library when it has the shape,
+    otherwise they are built by function and added to the library
+    :param function:
+    :return:
+    """
+
+    @wraps(function)
+    def wrapper(rig, bone_name, *args, **kwargs):
+        if args:
+            # positional shape parameters can't be told apart from bone_transform_name
+            return function(rig, bone_name, *args, **kwargs)
+
+        cache = WidgetCache.get(rig)
+        key = cache.make_key(function, kwargs)
+        mesh = cache.lookup(key)
+
+        if mesh is None:
+            library = WidgetLibrary.get()
+            shape = library.get_shape(key)
+
+            if shape is not None:
+                obj = create_widget(rig, bone_name, kwargs.get('bone_transform_name'))
+                if obj is not None:
+                    write_mesh_shape(obj.data, *shape)
+                    cache.meshes[key] = obj.data
+                    cache.misses += 1
+                    cache.library_hits += 1
+                return obj
+
+            result = function(rig, bone_name, **kwargs)
+            obj = get_widget_object(rig, bone_name)
+            if obj is not None and obj.type == 'MESH':
+                cache.meshes[key] = obj.data
+                cache.misses += 1
+                shape = read_mesh_shape(obj.data)
+                if shape is not None:
+                    library.add_shape(key, *shape)
+            return result
+
+        obj = create_widget(rig, bone_name, kwargs.get('bone_transform_name'))
+        if obj is not None:
+            old_mesh = obj.data
+            obj.data = mesh
+            if old_mesh.users == 0:
+                bpy.data.meshes.remove(old_mesh)
+            cache.hits += 1
+        return obj
+
+    return wrapper
+
+
+def get_mesh_hash(mesh):
+    """
+    Hashes the geometry of a widget mesh: verts rounded to 1e-5, edges and face loops
+    :param mesh:
+    :return:
+    :rtype: str
+    """
+
+    verts = np.zeros(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', verts)
+    verts = np.round(verts, 5) + 0.0   # + 0.0 folds -0.0 into 0.0
+    edges = np.zeros(len(mesh.edges) * 2, dtype=np.int32)
+    mesh.edges.foreach_get('vertices', edges)
+    loops = np.zeros(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get('vertex_index', loops)
+    loop_totals = np.zeros(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get('loop_total', loop_totals)
+
+    digest = hashlib.sha1()
+    for array in (verts, edges, loops, loop_totals):
+        digest.update(np.int64(len(array)).tobytes())
+        digest.update(array.tobytes())
+
+    return digest.hexdigest()
+
+
+def collect_widgets(rig):
+    """
+    Post-generation pass on the widget objects of the blend file. The WGT objects of rig, named WGT-<rig>_<bone>,
+    that are neither the custom shape of a pose bone nor named after a bone of rig are deleted. Widgets of other
+    armatures and user made WGT objects are left alone. Then widget meshes with the same geometry are merged
+    onto a single mesh and the orphan widget meshes are deleted
+    :param rig: the armature object just generated
+    :return: counts of deleted objects, merged and deleted meshes
+    :rtype: dict
+    """
+
+    cache = GenerationContext.get(rig).get_cache('widget_cache', WidgetCache)
+    cached_names = {key: mesh.name for key, mesh in cache.meshes.items() if mesh.name in bpy.data.meshes}
+
+    referenced = set()
+    for obj in bpy.data.objects:
+        if obj.type == 'ARMATURE' and obj.pose:
+            referenced.update(pb.custom_shape.name for pb in obj.pose.bones if pb.custom_shape)
+
+    # widgets of rig may not be assigned as custom shapes yet
+    referenced.update(make_widget_name(name, rig.name) for name in rig.data.bones.keys())
+
+    # WGT-<rig>_ also starts the widget names of an armature named <rig>_<suffix>
+    prefix = WGT_PREFIX + rig.name + '_'
+    other_prefixes = [WGT_PREFIX + obj.name + '_' for obj in bpy.data.objects
+                      if obj.type == 'ARMATURE' and obj != rig and obj.name.startswith(rig.name + '_')]
+
+    widgets = [obj for obj in bpy.data.objects
+               if obj.name.startswith(prefix) and not any(obj.name.startswith(p) for p in other_prefixes)]
+
+    deleted_objects = 0
+    for obj in widgets:
+        if obj.name not in referenced:
+            bpy.data.objects.remove(obj, do_unlink=True)
+            deleted_objects += 1
+
+    canonical = dict()  # mesh hash -> mesh
+    remap = dict()      # merged mesh name -> canonical mesh
+    for obj in bpy.data.objects:
+        if not obj.name.startswith(WGT_PREFIX) or obj.type != 'MESH':
+            continue
+        mesh = canonical.setdefault(get_mesh_hash(obj.data), obj.data)
+        if mesh != obj.data:
+            remap[obj.data.name] = mesh
+            obj.data = mesh
+
+    deleted_meshes = 0
+    for mesh in [mesh for mesh in bpy.data.meshes if mesh.users == 0 and mesh.name.startswith(WGT_PREFIX)]:
+        bpy.data.meshes.remove(mesh)
+        deleted_meshes += 1
+
+    cache.meshes = dict()
+    for key, name in cached_names.items():
+        if name in remap:
+            cache.meshes[key] = remap[name]
+        elif name in bpy.data.meshes:
+            cache.meshes[key] = bpy.data.meshes[name]
+
+    return {'deleted_objects': deleted_objects, 'merged_meshes': len(remap), 'deleted_meshes': deleted_meshes}
+
+
+create_sphere_widget = cached_widget(rigify_sphere_widget)
+create_circle_widget = cached_widget(rigify_circle_widget)
+create_cube_widget = cached_widget(rigify_cube_widget)
 
 
 def create_widget_from_cluster(rig, bone_name, cluster, size=1.0, bone_transform_name=None):
@@ -37,122 +268,114 @@ def create_widget_from_cluster(rig, bone_name, cluster, size=1.0, bone_transform
 
 
 def get_cluster_projection(cluster, x_axis, y_axis):
+    """
+    Projects the cluster, centered on its mean, on the plane of x_axis and y_axis
+    :param cluster: point cloud
+    :type cluster: list(Vector)
+    :param x_axis:
+    :param y_axis:
+    :return: (N, 3) array of projected points, z is 0
+    :rtype: numpy.ndarray
+    """
 
-    new_cluster = []
-    cluster_sum = Vector((0, 0, 0))
-
-    for point in cluster:
-        cluster_sum += point
-
-    cluster_center = cluster_sum / len(cluster)
+    points = np.array([tuple(point) for point in cluster], dtype=np.float64).reshape(-1, 3)
+    points -= points.mean(axis=0)
 
-    for point in cluster:
-        _point = point - cluster_center
-        new_point = Vector((_point.dot(x_axis), _point.dot(y_axis), 0))
-        new_cluster.append(new_point)
+    projection = np.zeros_like(points)
+    projection[:, 0] = points @ np.array(tuple(x_axis))
+    projection[:, 1] = points @ np.array(tuple(y_axis))
 
-    return new_cluster
+    return projection
 
 
 def get_cluster_span(cluster):
 
-    x_span = 0
-    y_span = 0
-    z_span = 0
-
-    for point in cluster:
-        x_span = max(x_span, abs(point.x))
-        y_span = max(y_span, abs(point.y))
-        z_span = max(z_span, abs(point.z))
+    points = np.abs(np.array([tuple(point) for point in cluster], dtype=np.float64).reshape(-1, 3))
+    if not len(points):
+        return [0, 0, 0]
 
-    return [x_span, y_span, z_span]
+    return points.max(axis=0).tolist()
 
 
-def get_2d_border(cluster, max_points=None, size=1.0, double=True):
-
-    if not max_points:
-        max_points = 2 * len(cluster)
-
-    angle_step = 2 * pi / max_points
-
-    x_axis = Vector((1, 0))
+def get_convex_hull_2d(points):
+    """
+    Monotone chain convex hull
+    :param points: (N, 2) array
+    :return: indices of the hull points in counterclockwise order, collinear points excluded
+    :rtype: list(int)
+    """
 
-    points = [(-1, 0)] * max_points
+    points = np.asarray(points, dtype=np.float64)
+    order = np.lexsort((points[:, 1], points[:, 0]))
 
-    for i, point in enumerate(cluster):
-        angle = point.to_2d().angle_signed(x_axis)
-        angle = angle if angle >= 0 else 2 * pi + angle
-        index = int(round(angle / angle_step, 2)) % len(points)
-        if point.magnitude > points[index][1]:
-            points[index] = (i, point.magnitude)
+    def cross(o, a, b):
+        return (points[a, 0] - points[o, 0]) * (points[b, 1] - points[o, 1]) \
+            - (points[a, 1] - points[o, 1]) * (points[b, 0] - points[o, 0])
 
-    points = [p for p in points if p[0] >= 0]
+    unique = []
+    for i in order:
+        if not unique or (points[i] != points[unique[-1]]).any():
+            unique.append(int(i))
 
-    verts = []
-    edges = []
+    if len(unique) < 3:
+        return unique
 
-    if len(points) == 1:
-        return verts, edges
+    lower = []
+    for i in unique:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], i) <= 0:
+            lower.pop()
+        lower.append(i)
 
-    if len(points) == 2:
-        i0 = points[0][0]
-        i1 = points[1][0]
-        # displ = (cluster[i1] - cluster[i0]).magnitude * 0.05
-        displ = 0.1 / size
-        angle = cluster[i0].to_2d().angle(x_axis)
-        displ_vect = displ * Vector((sin(angle), -cos(angle), 0))
+    upper = []
+    for i in reversed(unique):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], i) <= 0:
+            upper.pop()
+        upper.append(i)
 
-        verts = [cluster[i0] + displ_vect, cluster[i1] + displ_vect, cluster[i0]
-                 - displ_vect, cluster[i1] - displ_vect]
-        verts = [size * v for v in verts]
-        edges = [(0, 1), (2, 3)]
-        return verts, edges
+    return lower[:-1] + upper[:-1]
 
-    j = 0
-    for p in points:
-        if p[0] >= 0:
-            vert = size * cluster[p[0]]
-            verts.append(vert.to_tuple())
-            edges.append(((j + 1) % len(points), j))
-            j += 1
 
-    if double:
-        for p in points:
-            if p[0] >= 0:
-                vert = size * 1.1 * cluster[p[0]]
-                verts.append(vert.to_tuple())
-                edges.append(((j + 1) % len(points) + len(points), j))
-                j += 1
+def get_2d_border(cluster, max_points=None, size=1.0, double=True, ring_scale=1.1):
+    """
+    Returns verts and edges of the convex border of a projected cluster
+    :param cluster: projected points, z is ignored
+    :param max_points: the hull is evenly subsampled down to max_points
+    :param size: scale applied to the border
+    :param double: add an offset ring scaled by ring_scale
+    :param ring_scale:
+    :return: verts, edges
+    """
 
-    return verts, edges
+    points = np.asarray(cluster, dtype=np.float64).reshape(-1, 3)
+    hull = get_convex_hull_2d(points[:, :2])
 
+    if max_points and len(hull) > max_points:
+        hull = [hull[i] for i in np.linspace(0, len(hull), max_points, endpoint=False).astype(int)]
 
-def adjust_widget(mesh, axis='y', offset=0.0):
+    if len(hull) < 2:
+        return [], []
 
-    if axis[0] == '-':
-        s = -1
-        axis = axis[1]
-    else:
-        s = 1
+    border = points[hull] * size
 
-    trans_matrix = Matrix.Translation((0.0, offset, 0.0))
-    rot_matrix = Matrix(((1.0, 0.0, 0.0, 0.0),
-            (0.0, s*1.0, 0.0, 0.0),
-            (0.0, 0.0, 1.0, 0.0),
-            (0.0, 0.0, 0.0, 1.0)))
+    if len(hull) == 2:
+        direction = border[1] - border[0]
+        normal = np.array((direction[1], -direction[0], 0.0))
+        normal *= 0.1 / max(np.linalg.norm(normal), 1e-9)
+        verts = [border[0] + normal, border[1] + normal, border[0] - normal, border[1] - normal]
+        return [tuple(v) for v in np.array(verts).tolist()], [(0, 1), (2, 3)]
 
-    if axis == "x":
-        rot_matrix = Matrix.Rotation(-s*pi/2, 4, 'Z')
-        trans_matrix = Matrix.Translation((offset, 0.0, 0.0))
+    count = len(hull)
+    verts = [tuple(v) for v in border.tolist()]
+    edges = [((j + 1) % count, j) for j in range(count)]
 
-    elif axis == "z":
-        rot_matrix = Matrix.Rotation(s*pi/2, 4, 'X')
-        trans_matrix = Matrix.Translation((0.0, 0.0, offset))
+    if double:
+        verts.extend(tuple(v) for v in (border * ring_scale).tolist())
+        edges.extend(((j + 1) % count + count, j + count) for j in range(count))
 
-    for vert in mesh.vertices:
-        vert.co = (trans_matrix @ rot_matrix @ vert.co.to_4d()).to_3d()
+    return verts, edges
 
 
+@cached_widget
 def create_chain_widget(rig, bone_name, cube=False, radius=0.5, invert=False, bone_transform_name=None, axis="y", offset=0.0):
     """Creates a basic chain widget
     """
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from new_experimental import headless
+
+headless.install()
+
+
+@pytest.fixture(autouse=True)
+def no_persistent_cache(monkeypatch):
+    # every generation runs the rigs, no generation cache from an earlier run is replayed
+    monkeypatch.setenv('RIGS_CACHE', '')
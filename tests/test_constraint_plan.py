@@ -0,0 +1,40 @@
+import bpy
+import pytest
+from mathutils import Vector
+
+from new_experimental.rigs.constraint_plan import ConstraintPlan
+from new_experimental.rigs.generation_context import set_mode
+
+
+@pytest.fixture
+def obj():
+    bpy.reset()
+    arm = bpy.data.armatures.new('armature')
+    obj = bpy.data.objects.new('armature', arm)
+    bpy.context.collection.objects.link(obj)
+    bpy.context.view_layer.objects.active = obj
+    set_mode(obj, 'EDIT')
+    for i, name in enumerate(['A', 'B']):
+        bone = arm.edit_bones.new(name)
+        bone.head = Vector((0, i, 0))
+        bone.tail = Vector((0, i + 1, 0))
+    return obj
+
+
+def test_repeated_clauses(obj):
+    plan = ConstraintPlan(obj)
+    plan.add('B', 'A', 'CL0.5LLO#CL0.3WW')
+    plan.flush()
+
+    constraints = obj.pose.bones['B'].constraints
+    assert [(con.type, round(con.influence, 2)) for con in constraints] == [('COPY_LOCATION', 0.5),
+                                                                            ('COPY_LOCATION', 0.3)]
+
+
+def test_parenting(obj):
+    plan = ConstraintPlan(obj)
+    plan.add('B', 'A', 'PA')
+    plan.flush()
+
+    assert obj.data.bones['B'].parent.name == 'A'
+    assert len(obj.pose.bones['B'].constraints) == 0
@@ -0,0 +1,96 @@
+import warnings
+
+import bpy
+import pytest
+from mathutils import Vector
+
+from new_experimental import headless
+from new_experimental.rigs import meshy_face
+
+
+def build_face():
+    bpy.reset()
+    arm = bpy.data.armatures.new('metarig')
+    obj = bpy.data.objects.new('metarig', arm)
+    bpy.context.collection.objects.link(obj)
+    bpy.context.view_layer.objects.active = obj
+    meshy_face.create_sample(obj)
+    bpy.ops.object.mode_set(mode='OBJECT')
+    return obj
+
+
+def touch_eyelid(metarig):
+    bpy.context.view_layer.objects.active = metarig
+    bpy.ops.object.mode_set(mode='EDIT')
+    bone = metarig.data.edit_bones['lid.B.L']
+    bone.tail = bone.tail + Vector((0.0, -0.001, 0.0))
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+
+def get_bones(obj):
+    return set((b.name, b.parent.name if b.parent else None) for b in obj.data.bones)
+
+
+def get_constraints(obj):
+    return set((pb.name, con.name, con.type, con.subtarget) for pb in obj.pose.bones for con in pb.constraints)
+
+
+def get_drivers(obj):
+    if obj.animation_data is None:
+        return set()
+    return set((fcurve.data_path, fcurve.array_index) for fcurve in obj.animation_data.drivers)
+
+
+@pytest.fixture
+def metarig():
+    return build_face()
+
+
+def test_face_sample(metarig):
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', bpy.ZeroLengthBoneWarning)
+        obj, rigs = headless.generate(metarig)
+
+    assert len(rigs) == 5
+    assert len(obj.data.bones) == 327
+    assert get_constraints(obj)
+    assert get_drivers(obj)
+
+    # every constraint target resolves to a bone of the rig
+    bones = set(name for name, parent in get_bones(obj))
+    assert set(subtarget for _, _, _, subtarget in get_constraints(obj) if subtarget) <= bones
+
+
+def test_regenerate_eyelid(metarig):
+    obj, rigs = headless.generate(metarig)
+    touch_eyelid(metarig)
+
+    obj, rigs = headless.generate(metarig)
+    fresh, fresh_rigs = headless.generate(metarig, name='fresh')
+
+    assert len(rigs) == 2
+    assert 'ORG-eye.L' in set(rig.base_bone for rig in rigs)
+    assert len(fresh_rigs) == 5
+    assert get_bones(obj) == get_bones(fresh)
+    assert get_constraints(obj) == get_constraints(fresh)
+    assert get_drivers(obj) == get_drivers(fresh)
+
+
+def test_unchanged_metarig_regenerates_nothing(metarig):
+    obj, rigs = headless.generate(metarig)
+    bones, constraints, drivers = get_bones(obj), get_constraints(obj), get_drivers(obj)
+
+    obj, rigs = headless.generate(metarig)
+
+    assert rigs == []
+    assert get_bones(obj) == bones
+    assert get_constraints(obj) == constraints
+    assert get_drivers(obj) == drivers
+
+
+def test_widgets_collected(metarig):
+    obj, rigs = headless.generate(metarig)
+    widgets = set(o.name for o in bpy.data.objects if o.name.startswith('WGT-rig_'))
+    shapes = set(pb.custom_shape.name for pb in obj.pose.bones if pb.custom_shape is not None)
+
+    assert widgets == shapes